@@ -0,0 +1,333 @@
+# -*- coding: utf-8 -*-
+"""
+《功德轮回》模拟引擎吞吐与内存基准
+固定种子、固定工作负载，逐项测量：
+  v5.8 GameEngine.run_game（基础版 / 人间炼狱）
+  核心版 CoreGameEngine.run_game
+  核心版平衡测试 balance_test_v2.GameEngine.run_game（6 个场景）
+  共业测试 KarmaTestEngine.run_game（5 个场景）
+  v5.8 BalanceAnalyzer.analyze（对已流式聚合的对局做统计）
+每项报告 次/秒、单次延迟分位数、tracemalloc 峰值分配与进程峰值 RSS，结果写入 JSON；
+与已存基线对比，吞吐下降、延迟或内存上升超过容差即标记为回归。
+
+每项默认在新的子进程中运行（峰值 RSS 互不累积，前一项的缓存与垃圾不影响后一项）。
+计时与内存分开：计时遍不开 tracemalloc（其开销会使吞吐失真），重复 repeats 遍，
+报告各遍的中位数；回归判定用各遍中最好的一遍（吞吐取最高、p99 取最低），
+只有每一遍都比基线差才算回归（单遍的 p99 受调度抖动影响，前后两次可相差 50% 以上）。
+内存遍再跑一次同一负载。基线与机器相关，只应与同一台机器上的结果对比。
+"""
+
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from functools import partial
+from typing import Any, Callable, Dict, List, Optional
+
+try:
+    import resource  # 仅 Unix；缺失时不报告峰值 RSS
+except ImportError:
+    resource = None
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "core"))
+
+import simulator_v58_FINAL as v58
+import simulator_core_v1 as core
+import balance_test_v2 as balance_test
+import karma_test as karma
+from sampling import derive_seed
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_RESULTS = os.path.join(HERE, "benchmark_results.json")
+DEFAULT_BASELINE = os.path.join(HERE, "benchmark_baseline.json")
+SEED = 2026
+REPEATS = 5  # 每项计时遍数
+
+# 回归容差：吞吐下降、p99 延迟上升、内存上升超过该比例即标记（计时指标取各遍最好值）
+TOLERANCES = {"ops_per_sec": 0.10, "p99_us": 0.25, "tracemalloc_peak_kb": 0.20, "rss_peak_mb": 0.20}
+TIMING_METRICS = ("ops_per_sec", "p99_us")  # 重复计时、按最好一遍判定的指标
+
+# ============== 工作负载 ==============
+
+@dataclass
+class Workload:
+    """一项基准：make() 做不计时的准备并返回单次操作 op(i)，共执行 ops 次（i = 0..ops-1）
+
+    make 须可序列化（模块级函数或其 partial），以便在子进程中重建。
+    """
+    name: str
+    engine: str
+    make: Callable[[], Callable[[int], Any]]
+    ops: int
+    unit: str = "局"
+
+def _v58_game(hell: bool) -> Callable[[int], Any]:
+    engine = v58.GameEngine(v58.GameConfig(hell_mode=hell))
+
+    def op(i: int):
+        engine.seed(derive_seed(SEED, i))
+        return engine.run_game()
+    return op
+
+def _core_game() -> Callable[[int], Any]:
+    engine = core.CoreGameEngine(core.CoreConfig())
+
+    def op(i: int):
+        engine.rng.seed(derive_seed(SEED, i))
+        return engine.run_game()
+    return op
+
+def _balance_test_game(player_types: tuple) -> Callable[[int], Any]:
+    engine = balance_test.GameEngine(balance_test.BalanceConfig())
+    types = list(player_types)
+
+    def op(i: int):
+        engine.rng.seed(derive_seed(SEED, i))
+        return engine.run_game(types)
+    return op
+
+def _karma_game(player_types: tuple) -> Callable[[int], Any]:
+    engine = karma.KarmaTestEngine(karma.TestConfig())
+    types = list(player_types)
+
+    def op(i: int):
+        engine.rng.seed(derive_seed(SEED, i))
+        return engine.run_game(types)
+    return op
+
+def _v58_analyze(games: int) -> Callable[[int], Any]:
+    """先流式模拟 games 局（不计时），每次操作为一次 analyze()"""
+    analyzer = v58.BalanceAnalyzer(v58.GameConfig(), num_simulations=games, seed=SEED, streaming=True)
+    with contextlib.redirect_stdout(io.StringIO()):
+        analyzer.run_simulations()
+
+    def op(i: int):
+        return analyzer.analyze()
+    return op
+
+BALANCE_TEST_SCENARIOS = {
+    "全好人": (balance_test.PlayerType.ALTRUIST,) * 4,
+    "全坏人": (balance_test.PlayerType.SELFISH,) * 4,
+    "全中立": (balance_test.PlayerType.NEUTRAL,) * 4,
+    "3好1坏": (balance_test.PlayerType.ALTRUIST,) * 3 + (balance_test.PlayerType.SELFISH,),
+    "2好2坏": (balance_test.PlayerType.ALTRUIST,) * 2 + (balance_test.PlayerType.SELFISH,) * 2,
+    "1好3坏": (balance_test.PlayerType.ALTRUIST,) + (balance_test.PlayerType.SELFISH,) * 3,
+}
+
+KARMA_SCENARIOS = {
+    "1好人vs3坏人": (karma.PlayerType.ALTRUIST,) + (karma.PlayerType.SELFISH,) * 3,
+    "1坏人vs3好人": (karma.PlayerType.SELFISH,) + (karma.PlayerType.ALTRUIST,) * 3,
+    "2好人vs2坏人": (karma.PlayerType.ALTRUIST,) * 2 + (karma.PlayerType.SELFISH,) * 2,
+    "4好人": (karma.PlayerType.ALTRUIST,) * 4,
+    "4坏人": (karma.PlayerType.SELFISH,) * 4,
+}
+
+def default_workloads(scale: float = 1.0) -> List[Workload]:
+    """标准工作负载；scale 按比例缩放每项次数（快速自检可用 0.1）"""
+    def n(ops: int) -> int:
+        return max(1, int(ops * scale))
+
+    workloads = [
+        Workload("v58/基础版", "GameEngine.run_game", partial(_v58_game, False), n(2000)),
+        Workload("v58/人间炼狱", "GameEngine.run_game", partial(_v58_game, True), n(2000)),
+        Workload("core/v1.1", "CoreGameEngine.run_game", _core_game, n(2000)),
+    ]
+    for label, types in BALANCE_TEST_SCENARIOS.items():
+        workloads.append(Workload(f"balance_test/{label}", "balance_test_v2.GameEngine.run_game",
+                                  partial(_balance_test_game, types), n(2000)))
+    for label, types in KARMA_SCENARIOS.items():
+        workloads.append(Workload(f"karma/{label}", "KarmaTestEngine.run_game",
+                                  partial(_karma_game, types), n(5000)))
+    workloads.append(Workload("v58/analyze", "BalanceAnalyzer.analyze",
+                              partial(_v58_analyze, n(5000)), n(50), unit="次"))
+    return workloads
+
+# ============== 测量 ==============
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """最近秩分位数（sorted_values 已升序）"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(q * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+def peak_rss_mb() -> Optional[float]:
+    """本进程迄今的峰值常驻内存（MB）；平台不支持时为 None"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024  # macOS 为字节，Linux 为 KB
+
+def _timing_pass(op: Callable[[int], Any], ops: int) -> Dict[str, float]:
+    """一遍计时：逐次延迟（μs）的分位数与整遍吞吐"""
+    clock = time.perf_counter_ns
+    latencies = []
+    start = clock()
+    for i in range(ops):
+        t = clock()
+        op(i)
+        latencies.append(clock() - t)
+    elapsed = (clock() - start) / 1e9
+
+    latencies.sort()
+    us = [t / 1000 for t in latencies]
+    return {
+        "seconds": elapsed,
+        "ops_per_sec": ops / elapsed if elapsed else 0.0,
+        "mean_us": sum(us) / len(us),
+        "p50_us": percentile(us, 0.50),
+        "p90_us": percentile(us, 0.90),
+        "p99_us": percentile(us, 0.99),
+        "max_us": us[-1],
+    }
+
+def measure(workload: Workload, warmup: int = 20, repeats: int = REPEATS) -> Dict[str, Any]:
+    """测量一项工作负载：预热 → repeats 遍计时（各指标取中位数）→ 内存遍（tracemalloc 峰值）
+
+    参与回归判定的计时指标另存各遍取值（<指标>_runs），供 compare() 取最好的一遍。
+    """
+    op = workload.make()
+    for i in range(min(warmup, workload.ops)):
+        op(i)
+
+    passes = [_timing_pass(op, workload.ops) for _ in range(max(1, repeats))]
+
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    base, _ = tracemalloc.get_traced_memory()
+    for i in range(workload.ops):
+        op(i)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    result = {"engine": workload.engine, "unit": workload.unit, "ops": workload.ops, "repeats": len(passes)}
+    result.update({metric: statistics.median(p[metric] for p in passes) for metric in passes[0]})
+    result.update({f"{metric}_runs": [p[metric] for p in passes] for metric in TIMING_METRICS})
+    result["tracemalloc_peak_kb"] = (peak - base) / 1024
+    result["rss_peak_mb"] = peak_rss_mb()
+    return result
+
+def _measure_isolated(workload: Workload, repeats: int = REPEATS) -> Dict[str, Any]:
+    """在新的 spawn 子进程中测量（峰值 RSS 只含本项）"""
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+        return pool.submit(measure, workload, repeats=repeats).result()
+
+def run_suite(workloads: Optional[List[Workload]] = None, isolate: bool = True,
+              progress: bool = True, repeats: int = REPEATS) -> Dict[str, Any]:
+    """跑完全部工作负载，返回 {"meta": 机器与参数, "results": {名称: 测量结果}}"""
+    workloads = workloads if workloads is not None else default_workloads()
+    results = {}
+    for w in workloads:
+        results[w.name] = _measure_isolated(w, repeats) if isolate else measure(w, repeats=repeats)
+        if progress:
+            item = results[w.name]
+            print(f"  {w.name:<20} {item['ops_per_sec']:9.1f} {w.unit}/s  p50 {item['p50_us']:8.1f}μs")
+    meta = {
+        "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "seed": SEED,
+        "isolated": isolate,
+        "repeats": repeats,
+        "engines": {"v5.8": v58.ENGINE_VERSION, "core": core.ENGINE_VERSION,
+                    "balance_test": balance_test.ENGINE_VERSION},
+    }
+    return {"meta": meta, "results": results}
+
+# ============== 基线对比 ==============
+
+def best_of_runs(item: Dict[str, Any], metric: str) -> Optional[float]:
+    """各遍中最好的取值（吞吐取最高，其余取最低）；没有逐遍记录时（旧基线、内存指标）取汇总值"""
+    runs = item.get(f"{metric}_runs")
+    if not runs:
+        return item.get(metric)
+    return max(runs) if metric == "ops_per_sec" else min(runs)
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any],
+            tolerances: Optional[Dict[str, float]] = None) -> List[Dict[str, Any]]:
+    """与基线逐项对比，返回回归列表：{name, metric, baseline, current, change}
+
+    吞吐（ops_per_sec）越高越好，其余指标越低越好；基线中没有的项或指标跳过。
+    计时指标两边都取各遍中最好的一遍（见 best_of_runs）。
+    """
+    tolerances = tolerances or TOLERANCES
+    regressions = []
+    for name, item in current["results"].items():
+        base = baseline.get("results", {}).get(name)
+        if base is None:
+            continue
+        for metric, tolerance in tolerances.items():
+            old, new = best_of_runs(base, metric), best_of_runs(item, metric)
+            if not old or new is None:
+                continue
+            change = new / old - 1
+            worse = -change if metric == "ops_per_sec" else change
+            if worse > tolerance:
+                regressions.append({"name": name, "metric": metric, "baseline": old,
+                                    "current": new, "change": change})
+    return regressions
+
+def format_results(current: Dict[str, Any], baseline: Optional[Dict[str, Any]] = None) -> str:
+    lines = [f"  {'工作负载':<18} | {'吞吐':>12} | {'p50(μs)':>9} | {'p90(μs)':>9} | {'p99(μs)':>9} | "
+             f"{'分配峰值':>10} | {'RSS峰值':>8} | 对比基线"]
+    base_results = (baseline or {}).get("results", {})
+    for name, item in current["results"].items():
+        rss = f"{item['rss_peak_mb']:6.1f}MB" if item["rss_peak_mb"] is not None else "     n/a"
+        base = base_results.get(name)
+        delta = f"{item['ops_per_sec'] / base['ops_per_sec'] * 100 - 100:+6.1f}%" if base else "     —"
+        lines.append(f"  {name:<20} | {item['ops_per_sec']:9.1f} {item['unit']}/s | {item['p50_us']:9.1f} | "
+                     f"{item['p90_us']:9.1f} | {item['p99_us']:9.1f} | {item['tracemalloc_peak_kb']:8.1f}KB | "
+                     f"{rss} | {delta}")
+    return "\n".join(lines)
+
+def format_regressions(regressions: List[Dict[str, Any]]) -> str:
+    if not regressions:
+        return "  无回归"
+    return "\n".join(f"  ✗ {r['name']:<20} {r['metric']:<20} 基线 {r['baseline']:.1f} → 当前 {r['current']:.1f} "
+                     f"({r['change']*100:+.1f}%)" for r in regressions)
+
+def load(path: str) -> Optional[Dict[str, Any]]:
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def save(data: Dict[str, Any], path: str):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+
+# ============== 主程序 ==============
+
+def main(scale: float = 1.0, out: str = DEFAULT_RESULTS, baseline: str = DEFAULT_BASELINE,
+         update_baseline: bool = False, isolate: bool = True, repeats: int = REPEATS) -> List[Dict[str, Any]]:
+    """跑基准并写出结果；基线不存在或 update_baseline=True 时以本次结果为基线，否则对比并返回回归列表"""
+    print("《功德轮回》模拟引擎吞吐与内存基准")
+    print("=" * 50)
+    current = run_suite(default_workloads(scale), isolate=isolate, repeats=repeats)
+    save(current, out)
+    stored = None if update_baseline else load(baseline)
+    print()
+    print(format_results(current, stored))
+    print(f"\n结果已写入 {out}")
+    if stored is None:
+        save(current, baseline)
+        print(f"基线已写入 {baseline}")
+        return []
+    regressions = compare(current, stored)
+    print(f"\n【对比基线】（{stored['meta']['time']}，容差 " +
+          "，".join(f"{k} {v*100:.0f}%" for k, v in TOLERANCES.items()) + "）")
+    print(format_regressions(regressions))
+    return regressions
+
+if __name__ == "__main__":
+    sys.exit(1 if main() else 0)
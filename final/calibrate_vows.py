@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+"""
+《功德轮回》v5.8 发愿阈值分位数校准
+check_vow / check_bodhisattva_vow 都是“终局量 ≥（或 ≤）阈值”的比较，
+一次模拟即可得到相关终局量的完整分布，命中目标达成率的阈值就是一个分位数。
+对 8 个发愿与 4 个菩萨愿各校准一个主阈值（其余条件保持不变），
+再用同一种子重新模拟验证：终局状态不变说明阈值不影响对局过程，结果即为不动点；
+只有终局量分布随阈值变化的发愿才继续迭代。
+
+依赖：numpy
+"""
+
+import time
+from dataclasses import dataclass, replace
+from typing import Callable, Dict, Optional, Tuple
+
+import numpy as np
+
+from simulator_v58_FINAL import (
+    GameConfig, VOWS, BVOWS,
+    VOW_DILIGENT, VOW_POOR_GIRL, VOW_CHARITY, VOW_GREAT_MERCHANT,
+    VOW_TEACHING, VOW_MASTER, VOW_ARHAT, VOW_BODHISATTVA,
+    KSITIGARBHA, AVALOKITESVARA, SAMANTABHADRA, MANJUSRI,
+)
+from rescore_v58 import collect_end_states
+
+# ============== 校准规则 ==============
+
+# 目标达成率（见 GameConfig 注释：简单愿~70%，困难愿~40%，菩萨愿15-25%）
+SIMPLE_VOW_TARGET = 0.70
+HARD_VOW_TARGET = 0.40
+BVOW_TARGET = 0.20
+
+Arrays = Dict[str, np.ndarray]
+
+def _help(s: Arrays) -> np.ndarray:
+    return s["donate_count"] + s["save_count"] + s["protect_count"]
+
+@dataclass(frozen=True)
+class VowRule:
+    """一个发愿的校准规则：主阈值字段、被比较的终局量、比较方向、其余条件"""
+    kind: str       # "vow" 或 "bvow"
+    code: int       # 发愿 / 菩萨愿编码
+    field: str      # 被校准的 GameConfig 字段
+    quantity: Callable[[Arrays], np.ndarray]  # 每位玩家的终局量 (N, 4)
+    at_least: bool  # True: 终局量 ≥ 阈值；False: 终局量 ≤ 阈值
+    target: float
+    extra: Optional[Callable[[Arrays, GameConfig], np.ndarray]] = None  # 其余条件（与主条件同时成立）
+
+    @property
+    def label(self) -> str:
+        return (VOWS if self.kind == "vow" else BVOWS)[self.code].value
+
+RULES: Tuple[VowRule, ...] = (
+    # 简单发愿
+    VowRule("vow", VOW_DILIGENT, "vow_diligent_merit", lambda s: s["merit"], True, SIMPLE_VOW_TARGET),
+    VowRule("vow", VOW_CHARITY, "vow_charity_donate", lambda s: s["donate_count"], True, SIMPLE_VOW_TARGET),
+    VowRule("vow", VOW_TEACHING, "vow_teaching_hui", lambda s: s["hui"], True, SIMPLE_VOW_TARGET,
+            lambda s, c: s["scholar_skill_used"] >= 1),
+    VowRule("vow", VOW_ARHAT, "vow_arhat_hui", lambda s: s["hui"], True, SIMPLE_VOW_TARGET),
+    # 困难发愿
+    VowRule("vow", VOW_POOR_GIRL, "vow_poor_girl_merit", lambda s: s["merit"], True, HARD_VOW_TARGET,
+            lambda s, c: s["wealth"] <= c.vow_poor_girl_wealth),
+    VowRule("vow", VOW_GREAT_MERCHANT, "vow_great_merchant_merit", lambda s: s["merit"], True, HARD_VOW_TARGET,
+            lambda s, c: s["save_count"] >= c.vow_great_merchant_save),
+    VowRule("vow", VOW_MASTER, "vow_master_hui", lambda s: s["hui"], True, HARD_VOW_TARGET,
+            lambda s, c: s["merit"] >= c.vow_master_merit),
+    VowRule("vow", VOW_BODHISATTVA, "vow_bodhisattva_merit", lambda s: s["merit"], True, HARD_VOW_TARGET,
+            lambda s, c: s["save_count"] >= c.vow_bodhisattva_save),
+    # 菩萨愿
+    VowRule("bvow", KSITIGARBHA, "bvow_ksitigarbha_calamity", lambda s: s["calamity"], False, BVOW_TARGET,
+            lambda s, c: s["ksitigarbha_absorb_count"] >= c.bvow_ksitigarbha_absorb),
+    VowRule("bvow", AVALOKITESVARA, "bvow_avalokitesvara_help", _help, True, BVOW_TARGET),
+    VowRule("bvow", SAMANTABHADRA, "bvow_samantabhadra_donate", lambda s: s["donate_count"], True, BVOW_TARGET,
+            lambda s, c: s["total_saves"] >= c.bvow_samantabhadra_save),
+    VowRule("bvow", MANJUSRI, "bvow_manjusri_assist", lambda s: s["save_count"], True, BVOW_TARGET,
+            lambda s, c: _help(s) >= 6),
+)
+
+# ============== 分位数求阈值 ==============
+
+def player_arrays(config: GameConfig, num_games: int, seed: int) -> Arrays:
+    """模拟并返回玩家级终局量 (N, 4)；局级量（劫难、团队渡化）广播到每位玩家"""
+    arrays = {key: value.astype(np.int64) for key, value in
+              collect_end_states(config, num_games, seed).arrays().items()}
+    for key in ("calamity", "total_saves"):
+        arrays[key] = np.broadcast_to(arrays[key][:, None], arrays["merit"].shape)
+    return arrays
+
+def rule_inputs(rule: VowRule, arrays: Arrays, config: GameConfig) -> Tuple[np.ndarray, np.ndarray]:
+    """选了该愿的玩家的 (终局量, 其余条件是否成立)"""
+    chosen = arrays[rule.kind] == rule.code  # 存储中的键为 "vow" / "bvow"
+    values = rule.quantity(arrays)[chosen]
+    extra = rule.extra(arrays, config)[chosen] if rule.extra else np.ones(values.shape, dtype=bool)
+    return values, extra
+
+def achieved_rate(values: np.ndarray, extra: np.ndarray, threshold: int, at_least: bool) -> float:
+    if len(values) == 0:
+        return 0.0
+    hit = values >= threshold if at_least else values <= threshold
+    return float(np.mean(hit & extra))
+
+def quantile_threshold(values: np.ndarray, extra: np.ndarray, at_least: bool,
+                       target: float, current: int) -> int:
+    """达成率最接近 target 的整数阈值；并列时取离当前值最近的"""
+    if len(values) == 0:
+        return current
+    candidates = np.arange(values.min() - 1, values.max() + 2)
+    # 对阈值排序后累计计数即得每个候选阈值的达成率（终局量为小整数）
+    ok = np.sort(values[extra])
+    if at_least:
+        hits = len(ok) - np.searchsorted(ok, candidates, side="left")
+    else:
+        hits = np.searchsorted(ok, candidates, side="right")
+    rates = hits / len(values)
+    order = np.lexsort((np.abs(candidates - current), np.abs(rates - target)))
+    return int(candidates[order[0]])
+
+# ============== 校准 ==============
+
+def calibrate(config: GameConfig, num_games: int = 20000, seed: int = 2026,
+              max_iterations: int = 5, rules: Tuple[VowRule, ...] = RULES) -> Dict:
+    """校准全部发愿阈值，返回 {"config": 校准后配置, "rows": 明细, "iterations": 模拟轮数}
+
+    每轮用同一种子模拟：若某愿的终局量与上一轮完全相同，说明它的阈值不影响对局过程，
+    阈值即已是不动点而被冻结；只有仍在变化的发愿继续迭代。
+    """
+    original = config
+    arrays = player_arrays(config, num_games, seed)
+    before = {rule.field: achieved_rate(*rule_inputs(rule, arrays, config), getattr(config, rule.field),
+                                        rule.at_least) for rule in rules}
+    active = list(rules)
+    iterations = 1
+    while active and iterations <= max_iterations:
+        updates = {}
+        for rule in active:
+            values, extra = rule_inputs(rule, arrays, config)
+            updates[rule.field] = quantile_threshold(values, extra, rule.at_least, rule.target,
+                                                     getattr(config, rule.field))
+        changed = {k: v for k, v in updates.items() if v != getattr(config, k)}
+        if not changed:
+            break
+        previous = {rule.field: rule_inputs(rule, arrays, config) for rule in active}
+        config = replace(config, **changed)
+        arrays = player_arrays(config, num_games, seed)
+        iterations += 1
+        # 终局量未变的发愿：阈值不反馈到对局，已是不动点
+        active = [rule for rule in active
+                  if not all(np.array_equal(a, b) for a, b in zip(previous[rule.field],
+                                                                  rule_inputs(rule, arrays, config)))]
+
+    rows = []
+    for rule in rules:
+        values, extra = rule_inputs(rule, arrays, config)
+        rows.append({
+            "vow": rule.label, "field": rule.field, "target": rule.target,
+            "old": getattr(original, rule.field), "new": getattr(config, rule.field),
+            "old_rate": before[rule.field],
+            "new_rate": achieved_rate(values, extra, getattr(config, rule.field), rule.at_least),
+            "samples": len(values),
+        })
+    return {"config": config, "rows": rows, "iterations": iterations, "feedback": [r.field for r in active]}
+
+def format_calibration(result: Dict) -> str:
+    lines = [f"  {'发愿':<8} | {'字段':<28} | 阈值      | 达成率           | 目标"]
+    for row in result["rows"]:
+        lines.append(f"  {row['vow']:<8} | {row['field']:<28} | {row['old']:>3} → {row['new']:<3} | "
+                     f"{row['old_rate']*100:5.1f}% → {row['new_rate']*100:5.1f}% | {row['target']*100:.0f}%")
+    feedback = "、".join(result["feedback"]) or "无（阈值不影响对局，一轮即不动点）"
+    lines.append(f"  模拟轮数: {result['iterations']}，仍随阈值变化的字段: {feedback}")
+    return "\n".join(lines)
+
+def config_snippet(result: Dict) -> str:
+    """可直接粘贴使用的 GameConfig 构造代码（只列出改动字段）"""
+    changed = [row for row in result["rows"] if row["new"] != row["old"]]
+    if not changed:
+        return "GameConfig()"
+    body = "\n".join(f"    {row['field']}={row['new']},  # {row['old']}→{row['new']} {row['vow']}"
+                     for row in changed)
+    return f"GameConfig(\n{body}\n)"
+
+# ============== 主程序 ==============
+
+def main(num_games: int = 20000, seed: int = 2026):
+    print("《功德轮回》v5.8 发愿阈值校准")
+    print("=" * 50)
+    start = time.perf_counter()
+    result = calibrate(GameConfig(), num_games, seed)
+    print(f"{num_games} 局 × {result['iterations']} 轮: {time.perf_counter() - start:.1f}s")
+    print(format_calibration(result))
+    print("\n校准后的配置:")
+    print(config_snippet(result))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""
+《功德轮回》v5.8 公共随机数配对对比
+只改一个 GameConfig 字段时，两组独立模拟的差值大半是抽样噪声。
+这里两个配置逐局共用同一局种子和预拆分的随机流（事件、众生、各玩家决策），
+报告 analyze() 中每个数值指标的配对差值与标准误（分批均值法），
+并给出同样局数下独立抽样的标准误作对照。
+"""
+
+import math
+import random
+import time
+from dataclasses import replace
+from typing import Dict, List, Optional
+
+from simulator_v58_FINAL import GameConfig, GameEngine, BalanceAccumulator, derive_seed
+
+# ============== 指标展开 ==============
+
+def flatten_stats(stats: Dict, prefix: str = "") -> Dict[str, float]:
+    """把 analyze()/finalize() 的嵌套统计展开为 {"by_role/农夫/avg_score": 值}，只保留数值"""
+    flat = {}
+    for key, value in stats.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten_stats(value, name + "/"))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = float(value)
+    return flat
+
+def _mean_var(values: List[float]):
+    n = len(values)
+    mean = sum(values) / n
+    var = sum((v - mean) ** 2 for v in values) / (n - 1) if n > 1 else 0.0
+    return mean, var
+
+# ============== 配对对比 ==============
+
+def compare(config_a: GameConfig, config_b: GameConfig, n: int = 5000,
+            seed: Optional[int] = None, batches: int = 50) -> Dict:
+    """公共随机数配对对比
+
+    第 i 局两配置都用 derive_seed(seed, i) 播种 CommonStreams。
+    n 局按顺序分成 batches 批，每批各自 finalize()；差值的标准误取各批差值的标准差 / sqrt(批数)，
+    因此对比率类指标（发愿达成率等，分母逐局变化）同样适用。
+    返回 {"metrics": {指标: {"a", "b", "delta", "se", "se_independent"}}, ...}。
+    """
+    if seed is None:
+        seed = random.randrange(1 << 63)
+    batches = max(2, min(batches, n))
+    engine_a = GameEngine(config_a, common_streams=True)
+    engine_b = GameEngine(config_b, common_streams=True)
+
+    total_a, total_b = BalanceAccumulator(), BalanceAccumulator()
+    batch_stats = []  # [(展开的A统计, 展开的B统计)]
+    bounds = [n * k // batches for k in range(batches + 1)]
+    for start, stop in zip(bounds, bounds[1:]):
+        acc_a, acc_b = BalanceAccumulator(), BalanceAccumulator()
+        for game_index in range(start, stop):
+            game_seed = derive_seed(seed, game_index)
+            engine_a.seed(game_seed)
+            acc_a.update(engine_a.run_game())
+            engine_b.seed(game_seed)
+            acc_b.update(engine_b.run_game())
+        batch_stats.append((flatten_stats(acc_a.finalize()), flatten_stats(acc_b.finalize())))
+        total_a.merge(acc_a)
+        total_b.merge(acc_b)
+
+    overall_a = flatten_stats(total_a.finalize())
+    overall_b = flatten_stats(total_b.finalize())
+    metrics = {}
+    for name in overall_a.keys() & overall_b.keys():
+        # 只有每批都出现的指标才能估计标准误（如某批无人选某舍离则缺失）
+        pairs = [(a[name], b[name]) for a, b in batch_stats if name in a and name in b]
+        se = se_independent = None
+        if len(pairs) == len(batch_stats):
+            _, var_delta = _mean_var([b - a for a, b in pairs])
+            _, var_a = _mean_var([a for a, _ in pairs])
+            _, var_b = _mean_var([b for _, b in pairs])
+            se = math.sqrt(var_delta / len(pairs))
+            se_independent = math.sqrt((var_a + var_b) / len(pairs))
+        metrics[name] = {
+            "a": overall_a[name], "b": overall_b[name],
+            "delta": overall_b[name] - overall_a[name],
+            "se": se, "se_independent": se_independent,
+        }
+    return {"n": n, "seed": seed, "batches": batches, "metrics": metrics}
+
+def format_comparison(result: Dict, names: Optional[List[str]] = None, z_mark: float = 2.0) -> str:
+    """格式化配对对比结果；names 为空时列出全部指标（按 |z| 降序）
+
+    方差缩减 = 独立抽样标准误² / 配对标准误²，即独立抽样需要多几倍局数才能达到同样精度。
+    """
+    metrics = result["metrics"]
+
+    def z_score(item):
+        return item["delta"] / item["se"] if item["se"] else 0.0
+
+    if names is None:
+        names = sorted(metrics, key=lambda k: -abs(z_score(metrics[k])))
+    lines = [f"配对对比：{result['n']} 局，{result['batches']} 批，种子 {result['seed']}",
+             f"  {'指标':<36} | {'A':>8} | {'B':>8} | {'差值':>8} | {'标准误':>7} | {'z':>6} | 方差缩减"]
+    for name in names:
+        item = metrics[name]
+        if item["se"] is None:
+            lines.append(f"  {name:<36} | {item['a']:8.3f} | {item['b']:8.3f} | {item['delta']:+8.3f} | {'-':>7} |")
+            continue
+        z = z_score(item)
+        reduction = (item["se_independent"] / item["se"]) ** 2 if item["se"] else float("inf")
+        mark = " *" if abs(z) >= z_mark else ""
+        lines.append(f"  {name:<36} | {item['a']:8.3f} | {item['b']:8.3f} | {item['delta']:+8.3f} | "
+                     f"{item['se']:7.4f} | {z:+6.1f} | {reduction:6.1f}x{mark}")
+    return "\n".join(lines)
+
+# ============== 主程序 ==============
+
+KEY_METRICS = [
+    "team_win_rate", "avg_calamity", "avg_saves",
+    "by_role/农夫/avg_score", "by_role/商人/avg_score", "by_role/学者/avg_score", "by_role/僧侣/avg_score",
+    "by_role/农夫/first_rate", "by_role/商人/first_rate", "by_role/学者/first_rate", "by_role/僧侣/first_rate",
+]
+
+def main(num_games: int = 5000, seed: int = 2026):
+    print("《功德轮回》v5.8 公共随机数配对对比")
+    print("=" * 50)
+    base = GameConfig()
+    for field_name, value in (("disaster_base_calamity_adj", 5), ("monk_protect_cost", 1)):
+        tuned = replace(base, **{field_name: value})
+        start = time.perf_counter()
+        result = compare(base, tuned, num_games, seed=seed)
+        print(f"\n{field_name}: {getattr(base, field_name)} → {value}（{time.perf_counter() - start:.1f}s）")
+        print(format_comparison(result, KEY_METRICS))
+
+if __name__ == "__main__":
+    main()
@@ -13,6 +13,13 @@ from enum import Enum
 from typing import List, Dict, Tuple, Optional
 from collections import defaultdict
 import json
+import os
+import sys
+
+# 结果缓存与随机流等共用模块位于上级目录 final/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from result_cache import ResultCache, engine_version, run_as_module
+from sampling import derive_seed, engine_rng, ci_status
 
 # ============== 枚举定义 ==============
 
@@ -131,40 +138,42 @@ class GameState:
 # ============== AI决策 ==============
 
 class AIDecision:
+    """AI决策逻辑（rng: 随机源，默认为全局 random 模块）"""
+    
     @staticmethod
-    def choose_sacrifice(player: Player, calamity: int, config: BalanceConfig) -> bool:
+    def choose_sacrifice(player: Player, calamity: int, config: BalanceConfig, rng=random) -> bool:
         """决定是否选A(牺牲)"""
         ptype = player.player_type
         
         if ptype == PlayerType.ALTRUIST:
             # 好人：高概率选A，危急时更高
             if calamity >= 15:
-                return random.random() < 0.95
+                return rng.random() < 0.95
             elif calamity >= 10:
-                return random.random() < 0.85
+                return rng.random() < 0.85
             else:
-                return random.random() < 0.70
+                return rng.random() < 0.70
         
         elif ptype == PlayerType.SELFISH:
             # 坏人：低概率选A，除非快失败了
             if calamity >= 18:
-                return random.random() < 0.50  # 快死了才帮忙
+                return rng.random() < 0.50  # 快死了才帮忙
             elif calamity >= 15:
-                return random.random() < 0.25
+                return rng.random() < 0.25
             else:
-                return random.random() < 0.10
+                return rng.random() < 0.10
         
         else:  # NEUTRAL
             # 中立：根据情况决定
             if calamity >= 15:
-                return random.random() < 0.70
+                return rng.random() < 0.70
             elif calamity >= 10:
-                return random.random() < 0.50
+                return rng.random() < 0.50
             else:
-                return random.random() < 0.35
+                return rng.random() < 0.35
     
     @staticmethod
-    def choose_action(player: Player, state: GameState) -> ActionType:
+    def choose_action(player: Player, state: GameState, rng=random) -> ActionType:
         """选择行动"""
         config = state.config
         ptype = player.player_type
@@ -175,22 +184,22 @@ class AIDecision:
         if ptype == PlayerType.ALTRUIST:
             # 高危时优先护法/布施
             if urgency > 0.5 and player.wealth >= config.protect_cost:
-                if random.random() < 0.5:
+                if rng.random() < 0.5:
                     return ActionType.PROTECT
             if urgency > 0.4 and player.wealth >= config.donate_cost:
-                if random.random() < 0.4:
+                if rng.random() < 0.4:
                     return ActionType.DONATE
             # 需要渡化时渡化
             if need_saves and player.hui >= config.save_hui_requirement:
                 if player.wealth >= (config.save_cost - (1 if player.role == Role.MONK else 0)):
-                    if random.random() < 0.5:
+                    if rng.random() < 0.5:
                         return ActionType.SAVE
         
         # 坏人：优先个人积累
         elif ptype == PlayerType.SELFISH:
             # 只在极端危急时才帮忙
             if urgency > 0.8 and player.wealth >= config.protect_cost:
-                if random.random() < 0.3:
+                if rng.random() < 0.3:
                     return ActionType.PROTECT
             # 大部分时间积累资源
             if player.role == Role.FARMER or player.wealth < 5:
@@ -200,35 +209,36 @@ class AIDecision:
         
         # 职业特化
         if player.role == Role.FARMER:
-            if random.random() < 0.5:
+            if rng.random() < 0.5:
                 return ActionType.LABOR
         elif player.role == Role.MERCHANT:
-            if player.wealth >= config.donate_cost and random.random() < 0.4:
+            if player.wealth >= config.donate_cost and rng.random() < 0.4:
                 return ActionType.DONATE
             if player.wealth < 5:
                 return ActionType.LABOR
         elif player.role == Role.SCHOLAR:
-            if player.hui < 15 and random.random() < 0.4:
+            if player.hui < 15 and rng.random() < 0.4:
                 return ActionType.PRACTICE
         elif player.role == Role.MONK:
             if need_saves and player.hui >= config.save_hui_requirement:
                 cost = config.save_cost - config.save_monk_cost_reduce
-                if player.wealth >= cost and random.random() < 0.5:
+                if player.wealth >= cost and rng.random() < 0.5:
                     return ActionType.SAVE
             if urgency > 0.3 and player.wealth >= config.protect_cost:
-                if random.random() < 0.4:
+                if rng.random() < 0.4:
                     return ActionType.PROTECT
         
         # 默认
-        if random.random() < 0.4:
+        if rng.random() < 0.4:
             return ActionType.PRACTICE
         return ActionType.LABOR
 
 # ============== 游戏引擎 ==============
 
 class GameEngine:
-    def __init__(self, config: BalanceConfig):
+    def __init__(self, config: BalanceConfig, rng: Optional[random.Random] = None):
         self.config = config
+        self.rng = engine_rng(rng)
     
     def init_players(self, player_types: List[PlayerType]) -> List[Player]:
         """初始化玩家"""
@@ -266,7 +276,7 @@ class GameEngine:
         # 统计选A的人数
         a_count = 0
         for p in state.players:
-            if AIDecision.choose_sacrifice(p, state.calamity, config):
+            if AIDecision.choose_sacrifice(p, state.calamity, config, self.rng):
                 a_count += 1
                 # 选A效果
                 cost = min(p.wealth, config.sacrifice_cost)
@@ -391,7 +401,7 @@ class GameEngine:
             # 3. 行动阶段（每人2次）
             for p in players:
                 for _ in range(2):
-                    action = AIDecision.choose_action(p, state)
+                    action = AIDecision.choose_action(p, state, self.rng)
                     self.execute_action(p, action, state)
             
             # 4. 回合结束：偶数回合消耗
@@ -441,65 +451,141 @@ class GameEngine:
         
         return result
 
-# ============== 测试场景 ==============
+# ============== 统计归约 ==============
 
-def run_scenario(config: BalanceConfig, player_types: List[PlayerType], 
-                 num_games: int = 2000, label: str = "") -> Dict:
-    """运行测试场景"""
-    engine = GameEngine(config)
-    
-    wins = 0
-    total_calamity = 0
-    total_saves = 0
-    
-    type_stats = defaultdict(lambda: {
-        "count": 0, "wins": 0, "total_raw": 0, "total_final": 0,
-        "first_place": 0, "last_place": 0
-    })
-    
-    for _ in range(num_games):
-        result = engine.run_game(player_types)
-        
-        if result["team_win"]:
-            wins += 1
-        total_calamity += result["final_calamity"]
-        total_saves += result["total_saves"]
+def _new_type_stats() -> Dict:
+    return {"count": 0, "wins": 0, "total_raw": 0, "total_final": 0, "first_place": 0, "last_place": 0}
+
+class ScenarioAccumulator:
+    """场景统计归约：update(局结果) 逐局累加，merge() 合并分片，finalize() 得到 run_scenario 的统计
+
+    只保存计数与求和，不同进程、不同日期的同场景分片可精确合并，无需重新模拟。
+    """
+    
+    def __init__(self):
+        self.games = 0
+        self.wins = 0
+        self.total_calamity = 0
+        self.total_saves = 0
+        self.by_type = defaultdict(_new_type_stats)
+    
+    def update(self, result: Dict):
+        """累加一局结果"""
+        self.games += 1
+        team_win = result["team_win"]
+        if team_win:
+            self.wins += 1
+        self.total_calamity += result["final_calamity"]
+        self.total_saves += result["total_saves"]
         
+        last_rank = len(result["players"])
         for p in result["players"]:
-            ptype = p["type"]
-            type_stats[ptype]["count"] += 1
-            if result["team_win"]:
-                type_stats[ptype]["wins"] += 1
-            type_stats[ptype]["total_raw"] += p["raw_score"]
-            type_stats[ptype]["total_final"] += p["final_score"]
-            
-            if result["team_win"]:
+            data = self.by_type[p["type"]]
+            data["count"] += 1
+            data["total_raw"] += p["raw_score"]
+            data["total_final"] += p["final_score"]
+            if team_win:
+                data["wins"] += 1
                 if p["rank"] == 1:
-                    type_stats[ptype]["first_place"] += 1
-                if p["rank"] == len(result["players"]):
-                    type_stats[ptype]["last_place"] += 1
-    
-    # 计算统计
-    stats = {
-        "label": label,
-        "num_games": num_games,
-        "team_win_rate": wins / num_games,
-        "avg_calamity": total_calamity / num_games,
-        "avg_saves": total_saves / num_games,
-        "by_type": {}
-    }
-    
-    for ptype, data in type_stats.items():
-        cnt = data["count"]
-        win_cnt = data["wins"]
-        stats["by_type"][ptype] = {
-            "count": cnt,
-            "avg_raw_score": data["total_raw"] / cnt if cnt else 0,
-            "avg_final_score": data["total_final"] / cnt if cnt else 0,
-            "first_place_rate": data["first_place"] / win_cnt if win_cnt else 0,
-            "last_place_rate": data["last_place"] / win_cnt if win_cnt else 0,
+                    data["first_place"] += 1
+                if p["rank"] == last_rank:
+                    data["last_place"] += 1
+    
+    def merge(self, other: "ScenarioAccumulator") -> "ScenarioAccumulator":
+        """合并另一个分片的部分聚合"""
+        self.games += other.games
+        self.wins += other.wins
+        self.total_calamity += other.total_calamity
+        self.total_saves += other.total_saves
+        for ptype, data in other.by_type.items():
+            target = self.by_type[ptype]
+            for k, v in data.items():
+                target[k] += v
+        return self
+    
+    def proportions(self) -> Dict[str, Tuple[int, int]]:
+        """序贯抽样关心的比例指标：名称 → (成功数, 样本数)；第1名率以胜局为分母"""
+        counts = {"team_win_rate": (self.wins, self.games)}
+        for ptype, data in self.by_type.items():
+            counts[f"first_place_rate/{ptype}"] = (data["first_place"], data["wins"])
+        return counts
+    
+    def finalize(self) -> Dict:
+        """计算最终统计"""
+        n = self.games
+        stats = {
+            "num_games": n,
+            "team_win_rate": self.wins / n,
+            "avg_calamity": self.total_calamity / n,
+            "avg_saves": self.total_saves / n,
+            "by_type": {},
         }
-    
+        for ptype, data in self.by_type.items():
+            cnt = data["count"]
+            win_cnt = data["wins"]
+            stats["by_type"][ptype] = {
+                "count": cnt,
+                "avg_raw_score": data["total_raw"] / cnt if cnt else 0,
+                "avg_final_score": data["total_final"] / cnt if cnt else 0,
+                "first_place_rate": data["first_place"] / win_cnt if win_cnt else 0,
+                "last_place_rate": data["last_place"] / win_cnt if win_cnt else 0,
+            }
+        return stats
+
+# ============== 测试场景 ==============
+
+# 引擎版本（源码哈希）：结果缓存键的一部分，改动本文件后旧缓存自动失效
+ENGINE_VERSION = engine_version(__file__, "balance-test-v2")
+
+def simulate_range(config: BalanceConfig, player_types: List[PlayerType], seed: int,
+                   start: int, stop: int, engine: Optional[GameEngine] = None) -> ScenarioAccumulator:
+    """模拟第 [start, stop) 局并归约为部分聚合"""
+    engine = engine or GameEngine(config)
+    acc = ScenarioAccumulator()
+    for game_index in range(start, stop):
+        engine.rng.seed(derive_seed(seed, game_index))
+        acc.update(engine.run_game(player_types))
+    return acc
+
+def run_scenario(config: BalanceConfig, player_types: List[PlayerType], 
+                 num_games: int = 2000, label: str = "", seed: Optional[int] = None,
+                 ci_targets: Optional[Dict[str, float]] = None, batch_size: int = 500,
+                 cache: Optional[ResultCache] = None) -> Dict:
+    """运行测试场景（每局使用 derive_seed(seed, 局号) 的独立随机流）
+
+    按 batch_size 对齐分批模拟，每批归约为 ScenarioAccumulator 后合并。
+    ci_targets: {"team_win_rate" / "first_place_rate"(或 "first_place_rate/类型"): 95%区间目标半宽}，
+    设置后 num_games 为预算上限，每批检查一次，全部达标即停。
+    cache: 结果缓存，以批为单位缓存部分聚合，命中的批不再模拟。
+    """
+    engine = GameEngine(config)
+    if seed is None:
+        seed = random.randrange(1 << 63)
+    
+    acc = ScenarioAccumulator()
+    for start in range(0, num_games, batch_size):
+        stop = min(start + batch_size, num_games)
+        key = chunk = None
+        if cache is not None:
+            key = cache.key(ENGINE_VERSION, config, seed, start, stop, player_types)
+            chunk = cache.get(key)
+        if chunk is None:
+            chunk = simulate_range(config, player_types, seed, start, stop, engine)
+            if key is not None:
+                cache.put(key, chunk)
+        acc.merge(chunk)
+        
+        # 序贯抽样：每批检查一次置信区间
+        if ci_targets and ci_status(acc.proportions(), ci_targets, acc.games, num_games)["done"]:
+            break
+    
+    stats = acc.finalize()
+    stats["label"] = label
+    stats["seed"] = seed
+    if ci_targets:
+        status = ci_status(acc.proportions(), ci_targets, acc.games, num_games)
+        stats["ci_met"] = status["met"]
+        stats["intervals"] = status["intervals"]
     return stats
 
 def print_scenario(stats: Dict):
@@ -517,11 +603,23 @@ def print_scenario(stats: Dict):
         print(f"  {'-'*8}-+-{'-'*10}-+-{'-'*10}-+-{'-'*8}-+-{'-'*8}")
         for ptype, data in stats["by_type"].items():
             print(f"  {ptype:<8} | {data['avg_raw_score']:>10.1f} | {data['avg_final_score']:>10.1f} | {data['first_place_rate']*100:>7.1f}% | {data['last_place_rate']*100:>7.1f}%")
+    
+    if stats.get("intervals"):
+        met = "全部达成" if stats["ci_met"] else "未全部达成"
+        print(f"\n95%置信区间（{stats['num_games']}局，目标{met}）:")
+        for name, item in stats["intervals"].items():
+            note = "" if item["met"] else ("  未达成" if item["reachable"] else "  预算内不可达")
+            print(f"  {name:<24} {item['rate']*100:5.1f}% [{item['low']*100:5.1f}%, {item['high']*100:5.1f}%] "
+                  f"半宽 {item['half_width']*100:.1f}% / 目标 {item['target']*100:.1f}%{note}")
 
-def run_all_tests(config: BalanceConfig, num_games: int = 2000):
-    """运行所有测试场景"""
+def run_all_tests(config: BalanceConfig, num_games: int = 2000, seed: Optional[int] = None,
+                  ci_targets: Optional[Dict[str, float]] = None, cache: Optional[ResultCache] = None):
+    """运行所有测试场景（各场景由根种子派生独立随机流；ci_targets、cache 见 run_scenario）"""
+    if seed is None:
+        seed = random.randrange(1 << 63)
     print("\n" + "="*70)
     print("《功德轮回》核心版 v1.1 平衡测试")
+    print(f"随机种子: {seed}")
     print("="*70)
     
     scenarios = [
@@ -534,8 +632,9 @@ def run_all_tests(config: BalanceConfig, num_games: int = 2000):
     ]
     
     results = []
-    for types, label in scenarios:
-        stats = run_scenario(config, types, num_games, label)
+    for i, (types, label) in enumerate(scenarios):
+        stats = run_scenario(config, types, num_games, label, seed=derive_seed(seed, "scenario", i),
+                             ci_targets=ci_targets, cache=cache)
         print_scenario(stats)
         results.append(stats)
     
@@ -585,7 +684,11 @@ def main():
         being_timeout_calamity=5,   # 超时劫难（恢复）
     )
     
-    results = run_all_tests(config, num_games=3000)
+    # 序贯抽样：胜率区间半宽±1.5%、第1名率±3%即停，每场景预算10000局；
+    # 固定根种子 + 本地结果缓存，参数未改动的场景直接命中
+    cache = ResultCache()
+    results = run_all_tests(config, num_games=10000, seed=2026,
+                            ci_targets={"team_win_rate": 0.015, "first_place_rate": 0.03}, cache=cache)
     
     # 检查是否达标
     all_good = results[0]["team_win_rate"]
@@ -602,6 +705,7 @@ def main():
             print("  - 全好人胜率太低，减少 event_base_calamity")
         if all_bad >= 0.30:
             print("  - 全坏人胜率太高，增加 event_b_extra_calamity")
+    print(cache.summary())
 
 if __name__ == "__main__":
-    main()
+    run_as_module(__file__)
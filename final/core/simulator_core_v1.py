@@ -8,8 +8,15 @@ import random
 from dataclasses import dataclass, field
 from enum import Enum
 from typing import List, Dict, Tuple, Optional
-from collections import defaultdict
+from collections import defaultdict, Counter
 import json
+import os
+import sys
+
+# 结果缓存与随机流等共用模块位于上级目录 final/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from result_cache import ResultCache, engine_version, run_as_module
+from sampling import derive_seed, engine_rng
 
 # ============== 枚举定义 ==============
 
@@ -148,8 +155,10 @@ class GameState:
 # ============== AI决策 ==============
 
 class AIDecision:
+    """AI决策逻辑（rng: 随机源，默认为全局 random 模块）"""
+    
     @staticmethod
-    def choose_vow(player: Player) -> Vow:
+    def choose_vow(player: Player, rng=random) -> Vow:
         """选择发愿"""
         role = player.role
         vows = {
@@ -159,12 +168,12 @@ class AIDecision:
             Role.MONK: [Vow.ARHAT, Vow.BODHISATTVA],
         }
         # 70%选简单，30%选困难
-        if random.random() < 0.7:
+        if rng.random() < 0.7:
             return vows[role][0]
         return vows[role][1]
     
     @staticmethod
-    def choose_sacrifice(player: Player, calamity: int) -> bool:
+    def choose_sacrifice(player: Player, calamity: int, rng=random) -> bool:
         """选择是否牺牲（选A）"""
         # 基础概率50%
         prob = 0.5
@@ -176,10 +185,10 @@ class AIDecision:
         # 资源不足时倾向选B
         if player.wealth < 3:
             prob -= 0.2
-        return random.random() < prob
+        return rng.random() < prob
     
     @staticmethod
-    def choose_action(player: Player, state: GameState, actions_left: int) -> ActionType:
+    def choose_action(player: Player, state: GameState, actions_left: int, rng=random) -> ActionType:
         """选择行动"""
         config = state.config
         role = player.role
@@ -187,37 +196,37 @@ class AIDecision:
         
         # 职业特化行为
         if role == Role.FARMER:
-            if state.current_round <= 3 and random.random() < 0.6:
+            if state.current_round <= 3 and rng.random() < 0.6:
                 return ActionType.LABOR
-            if player.hui >= config.save_hui_requirement and random.random() < 0.4:
+            if player.hui >= config.save_hui_requirement and rng.random() < 0.4:
                 return ActionType.SAVE
         
         elif role == Role.MERCHANT:
-            if player.wealth >= config.donate_cost and random.random() < 0.5:
+            if player.wealth >= config.donate_cost and rng.random() < 0.5:
                 return ActionType.DONATE
-            if player.wealth < 4 and random.random() < 0.6:
+            if player.wealth < 4 and rng.random() < 0.6:
                 return ActionType.LABOR
         
         elif role == Role.SCHOLAR:
-            if player.hui < 15 and random.random() < 0.5:
+            if player.hui < 15 and rng.random() < 0.5:
                 return ActionType.PRACTICE
-            if player.hui >= config.save_hui_requirement and random.random() < 0.4:
+            if player.hui >= config.save_hui_requirement and rng.random() < 0.4:
                 return ActionType.SAVE
         
         elif role == Role.MONK:
-            if player.hui >= config.save_hui_requirement and random.random() < 0.5:
+            if player.hui >= config.save_hui_requirement and rng.random() < 0.5:
                 return ActionType.SAVE
-            if urgency > 0.4 and player.wealth >= config.protect_cost and random.random() < 0.4:
+            if urgency > 0.4 and player.wealth >= config.protect_cost and rng.random() < 0.4:
                 return ActionType.PROTECT
-            if player.wealth < 2 and random.random() < 0.5:
+            if player.wealth < 2 and rng.random() < 0.5:
                 return ActionType.LABOR
         
         # 通用逻辑
-        if urgency > 0.4 and player.wealth >= config.protect_cost and random.random() < 0.3:
+        if urgency > 0.4 and player.wealth >= config.protect_cost and rng.random() < 0.3:
             return ActionType.PROTECT
-        if player.wealth >= config.donate_cost and random.random() < 0.25:
+        if player.wealth >= config.donate_cost and rng.random() < 0.25:
             return ActionType.DONATE
-        if random.random() < 0.3:
+        if rng.random() < 0.3:
             return ActionType.PRACTICE
         
         return ActionType.LABOR
@@ -225,8 +234,9 @@ class AIDecision:
 # ============== 游戏引擎 ==============
 
 class CoreGameEngine:
-    def __init__(self, config: CoreConfig):
+    def __init__(self, config: CoreConfig, rng: Optional[random.Random] = None):
         self.config = config
+        self.rng = engine_rng(rng)
     
     def init_players(self) -> List[Player]:
         """初始化玩家"""
@@ -241,7 +251,7 @@ class CoreGameEngine:
         for role in Role:
             w, m, h = init_resources[role]
             player = Player(role=role, wealth=w, merit=m, hui=h)
-            player.vow = AIDecision.choose_vow(player)
+            player.vow = AIDecision.choose_vow(player, self.rng)
             players.append(player)
         
         return players
@@ -313,7 +323,7 @@ class CoreGameEngine:
         
         # 玩家选择
         for p in state.players:
-            if AIDecision.choose_sacrifice(p, state.calamity):
+            if AIDecision.choose_sacrifice(p, state.calamity, self.rng):
                 # 选A：牺牲
                 p.wealth -= config.sacrifice_cost
                 p.wealth = max(0, p.wealth)
@@ -395,7 +405,7 @@ class CoreGameEngine:
             # 行动阶段
             for p in players:
                 for _ in range(2):
-                    action = AIDecision.choose_action(p, state, 2)
+                    action = AIDecision.choose_action(p, state, 2, self.rng)
                     self.execute_action(p, action, state)
             
             # 回合结束：偶数回合消耗
@@ -451,102 +461,160 @@ class CoreGameEngine:
 
 # ============== 统计分析 ==============
 
+def _new_role_stats() -> Dict:
+    return {
+        "count": 0,
+        "avg_merit": 0,
+        "avg_hui": 0,
+        "avg_score": 0,
+        "vow_achieved": 0,
+        "rank_1": 0,
+        "rank_4": 0,
+        "scores": Counter(),  # 得分直方图（得分→次数），可直接合并
+    }
+
+def _new_vow_stats() -> Dict:
+    return {"count": 0, "achieved": 0}
+
+class CoreStatsAccumulator:
+    """可合并的统计归约：update(局结果) 逐局累加，merge() 合并分片，finalize() 得到 analyze() 的统计
+
+    只保存计数、求和与得分直方图，不同进程、不同日期的分片可精确合并，无需重新模拟。
+    """
+    
+    def __init__(self):
+        self.games = 0
+        self.team_wins = 0
+        self.total_calamity = 0
+        self.total_saves = 0
+        self.by_role = defaultdict(_new_role_stats)
+        self.by_vow = defaultdict(_new_vow_stats)
+    
+    def update(self, result: Dict):
+        """累加一局结果"""
+        self.games += 1
+        if result["team_win"]:
+            self.team_wins += 1
+        self.total_calamity += result["final_calamity"]
+        self.total_saves += result["total_saves"]
+        
+        for p in result["players"]:
+            r = self.by_role[p["role"]]
+            r["count"] += 1
+            r["avg_merit"] += p["merit"]
+            r["avg_hui"] += p["hui"]
+            r["avg_score"] += p["personal_score"]
+            r["scores"][p["personal_score"]] += 1
+            if p["vow_achieved"]:
+                r["vow_achieved"] += 1
+            
+            rank = p.get("rank", 0)
+            if rank == 1:
+                r["rank_1"] += 1
+            elif rank == 4:
+                r["rank_4"] += 1
+            
+            vow = p["vow"]
+            if vow:
+                self.by_vow[vow]["count"] += 1
+                if p["vow_achieved"]:
+                    self.by_vow[vow]["achieved"] += 1
+    
+    def merge(self, other: "CoreStatsAccumulator") -> "CoreStatsAccumulator":
+        """合并另一个分片的部分聚合"""
+        self.games += other.games
+        self.team_wins += other.team_wins
+        self.total_calamity += other.total_calamity
+        self.total_saves += other.total_saves
+        for name in ("by_role", "by_vow"):
+            mine = getattr(self, name)
+            for key, data in getattr(other, name).items():
+                target = mine[key]
+                for k, v in data.items():
+                    target[k] += v  # Counter 相加即直方图合并
+        return self
+    
+    def finalize(self) -> Dict:
+        """计算最终统计"""
+        n = self.games
+        stats = {
+            "total_games": n,
+            "team_wins": self.team_wins,
+            "team_win_rate": self.team_wins / n,
+            "avg_calamity": self.total_calamity / n,
+            "avg_saves": self.total_saves / n,
+            "by_role": {},
+            "by_vow": {},
+        }
+        
+        for role, data in self.by_role.items():
+            r = stats["by_role"][role] = dict(data)
+            cnt = r["count"]
+            if cnt > 0:
+                r["avg_merit"] /= cnt
+                r["avg_hui"] /= cnt
+                r["avg_score"] /= cnt
+                r["vow_rate"] = r["vow_achieved"] / cnt
+                r["rank_1_rate"] = r["rank_1"] / cnt
+                r["rank_4_rate"] = r["rank_4"] / cnt
+                avg = r["avg_score"]
+                variance = sum(c * (s - avg) ** 2 for s, c in sorted(r["scores"].items())) / cnt
+                r["score_std"] = variance ** 0.5
+            del r["scores"]
+        
+        for vow, data in self.by_vow.items():
+            v = stats["by_vow"][vow] = dict(data)
+            if v["count"] > 0:
+                v["rate"] = v["achieved"] / v["count"]
+        
+        return stats
+
+# 引擎版本（源码哈希）：结果缓存键的一部分，改动本文件后旧缓存自动失效
+ENGINE_VERSION = engine_version(__file__, "core-v1")
+CACHE_CHUNK = 1000  # 缓存单位：对齐的 1000 局区间
+
+def simulate_range(config: CoreConfig, seed: int, start: int, stop: int,
+                   engine: Optional[CoreGameEngine] = None) -> CoreStatsAccumulator:
+    """模拟第 [start, stop) 局并归约为部分聚合"""
+    engine = engine or CoreGameEngine(config)
+    acc = CoreStatsAccumulator()
+    for i in range(start, stop):
+        engine.rng.seed(derive_seed(seed, i))
+        acc.update(engine.run_game())
+    return acc
+
 class CoreBalanceAnalyzer:
-    def __init__(self, config: CoreConfig, num_simulations: int = 5000):
+    def __init__(self, config: CoreConfig, num_simulations: int = 5000, seed: Optional[int] = None,
+                 cache: Optional[ResultCache] = None):
         self.config = config
         self.num_simulations = num_simulations
-        self.results = []
+        # 根种子：每局使用 derive_seed(seed, 局号) 的独立随机流
+        self.seed = seed if seed is not None else random.randrange(1 << 63)
+        # 结果缓存：按 CACHE_CHUNK 对齐的局号区间缓存部分聚合，命中的区间不再模拟
+        self.cache = cache
+        self.accumulator = CoreStatsAccumulator()
     
     def run_simulations(self):
         engine = CoreGameEngine(self.config)
-        for i in range(self.num_simulations):
-            if (i + 1) % 1000 == 0:
-                print(f"  模拟进度: {i+1}/{self.num_simulations}")
-            result = engine.run_game()
-            self.results.append(result)
+        for start in range(0, self.num_simulations, CACHE_CHUNK):
+            stop = min(start + CACHE_CHUNK, self.num_simulations)
+            key = None
+            if self.cache is not None:
+                key = self.cache.key(ENGINE_VERSION, self.config, self.seed, start, stop)
+                chunk = self.cache.get(key)
+                if chunk is not None:
+                    self.accumulator.merge(chunk)
+                    print(f"  模拟进度: {stop}/{self.num_simulations}（缓存）")
+                    continue
+            chunk = simulate_range(self.config, self.seed, start, stop, engine)
+            print(f"  模拟进度: {stop}/{self.num_simulations}")
+            if key is not None:
+                self.cache.put(key, chunk)
+            self.accumulator.merge(chunk)
     
     def analyze(self) -> Dict:
-        stats = {
-            "total_games": len(self.results),
-            "team_wins": 0,
-            "avg_calamity": 0,
-            "avg_saves": 0,
-            "by_role": defaultdict(lambda: {
-                "count": 0,
-                "avg_merit": 0,
-                "avg_hui": 0,
-                "avg_score": 0,
-                "vow_achieved": 0,
-                "rank_1": 0,
-                "rank_4": 0,
-                "scores": [],
-            }),
-            "by_vow": defaultdict(lambda: {
-                "count": 0,
-                "achieved": 0,
-            }),
-        }
-        
-        total_calamity = 0
-        total_saves = 0
-        
-        for result in self.results:
-            if result["team_win"]:
-                stats["team_wins"] += 1
-            total_calamity += result["final_calamity"]
-            total_saves += result["total_saves"]
-            
-            for p in result["players"]:
-                role = p["role"]
-                vow = p["vow"]
-                
-                stats["by_role"][role]["count"] += 1
-                stats["by_role"][role]["avg_merit"] += p["merit"]
-                stats["by_role"][role]["avg_hui"] += p["hui"]
-                stats["by_role"][role]["avg_score"] += p["personal_score"]
-                stats["by_role"][role]["scores"].append(p["personal_score"])
-                
-                if p["vow_achieved"]:
-                    stats["by_role"][role]["vow_achieved"] += 1
-                
-                rank = p.get("rank", 0)
-                if rank == 1:
-                    stats["by_role"][role]["rank_1"] += 1
-                elif rank == 4:
-                    stats["by_role"][role]["rank_4"] += 1
-                
-                if vow:
-                    stats["by_vow"][vow]["count"] += 1
-                    if p["vow_achieved"]:
-                        stats["by_vow"][vow]["achieved"] += 1
-        
-        # 计算平均值
-        n = len(self.results)
-        stats["team_win_rate"] = stats["team_wins"] / n
-        stats["avg_calamity"] = total_calamity / n
-        stats["avg_saves"] = total_saves / n
-        
-        for role in stats["by_role"]:
-            cnt = stats["by_role"][role]["count"]
-            if cnt > 0:
-                stats["by_role"][role]["avg_merit"] /= cnt
-                stats["by_role"][role]["avg_hui"] /= cnt
-                stats["by_role"][role]["avg_score"] /= cnt
-                stats["by_role"][role]["vow_rate"] = stats["by_role"][role]["vow_achieved"] / cnt
-                stats["by_role"][role]["rank_1_rate"] = stats["by_role"][role]["rank_1"] / cnt
-                stats["by_role"][role]["rank_4_rate"] = stats["by_role"][role]["rank_4"] / cnt
-                
-                scores = stats["by_role"][role]["scores"]
-                avg = stats["by_role"][role]["avg_score"]
-                variance = sum((s - avg) ** 2 for s in scores) / len(scores)
-                stats["by_role"][role]["score_std"] = variance ** 0.5
-                del stats["by_role"][role]["scores"]
-        
-        for vow in stats["by_vow"]:
-            cnt = stats["by_vow"][vow]["count"]
-            if cnt > 0:
-                stats["by_vow"][vow]["rate"] = stats["by_vow"][vow]["achieved"] / cnt
-        
+        stats = self.accumulator.finalize()
+        stats["seed"] = self.seed
         return stats
     
     def generate_report(self, stats: Dict) -> str:
@@ -554,6 +622,8 @@ class CoreBalanceAnalyzer:
         lines.append("=" * 60)
         lines.append("《功德轮回》核心版 v1.0 平衡分析报告")
         lines.append(f"模拟局数: {stats['total_games']}")
+        if stats.get("seed") is not None:
+            lines.append(f"随机种子: {stats['seed']}")
         lines.append("=" * 60)
         lines.append("")
         
@@ -615,7 +685,9 @@ def main():
     print("=" * 50)
     
     config = CoreConfig()
-    analyzer = CoreBalanceAnalyzer(config, num_simulations=5000)
+    # 固定根种子 + 本地结果缓存：配置与引擎未改动时重复生成报告直接命中
+    cache = ResultCache()
+    analyzer = CoreBalanceAnalyzer(config, num_simulations=5000, seed=2026, cache=cache)
     
     print("\n开始模拟...")
     analyzer.run_simulations()
@@ -642,6 +714,7 @@ def main():
         json.dump(convert_dict(stats), f, ensure_ascii=False, indent=2)
     
     print("\n报告已保存: core_balance_report.txt")
+    print(cache.summary())
 
 if __name__ == "__main__":
-    main()
+    run_as_module(__file__)
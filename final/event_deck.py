@@ -0,0 +1,428 @@
+# -*- coding: utf-8 -*-
+"""
+《功德轮回》集体事件牌堆解析评估器
+不看玩家行动，只看事件与众生超时注入的劫难压力：每张牌的劫难效果是一个小的离散分布
+（合作/选 A 人数按二项分布），逐回合卷积得到每回合与前 r 回合累计注入劫难的精确分布，
+再按引擎结算顺序（事件 → 劫难不低于 0 → 众生超时 → 达上限崩盘）传播路径分布，
+得到各回合崩盘概率与终局劫难分布。调牌堆（权重、牌面数值、张数、分段）不需要模拟。
+
+牌堆两种抽法：
+  有放回（v5.8 模拟器）：每回合按权重抽 灾难 / 人祸 / 功德，权重与劫难值取自 GameConfig.compile()，
+    人间炼狱覆盖项、灾难的二项“合作”减免与引擎一致；
+  无放回（实体牌）：规则书 12 张集体事件卡、可选的分段牌堆（规则 12.8）、
+    archive 回测系统的牌堆字典 {"name", "effect": {"calamity": n, ...}}。
+
+不建模：英雄时刻、链式决策中前人对后人的影响、依赖功德/资粮/皈依的条件效果
+（“苛政如虎”劫难≥10 加重只依赖劫难，路径分布中计入）。
+"""
+
+import math
+import random
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import simulator_v58_FINAL as v58
+
+Pmf = Dict[int, float]
+
+# ============== 分布运算 ==============
+
+def point(value: int) -> Pmf:
+    return {value: 1.0}
+
+def convolve(a: Pmf, b: Pmf) -> Pmf:
+    """两个独立整数分布之和"""
+    out: Pmf = defaultdict(float)
+    for x, p in a.items():
+        for y, q in b.items():
+            out[x + y] += p * q
+    return dict(out)
+
+def mixture(parts: Sequence[Tuple[float, Pmf]]) -> Pmf:
+    """按权重混合（权重不必归一）"""
+    total = sum(w for w, _ in parts)
+    out: Pmf = defaultdict(float)
+    for w, pmf in parts:
+        for x, p in pmf.items():
+            out[x] += w / total * p
+    return dict(out)
+
+def binomial(n: int, p: float) -> Pmf:
+    return {k: math.comb(n, k) * p ** k * (1 - p) ** (n - k) for k in range(n + 1)}
+
+def shift(pmf: Pmf, k: int) -> Pmf:
+    return {x + k: p for x, p in pmf.items()}
+
+def mean(pmf: Pmf) -> float:
+    return sum(x * p for x, p in pmf.items()) / sum(pmf.values())
+
+def std(pmf: Pmf) -> float:
+    m = mean(pmf)
+    return math.sqrt(sum((x - m) ** 2 * p for x, p in pmf.items()) / sum(pmf.values()))
+
+def tail(pmf: Pmf, threshold: int) -> float:
+    """P(X ≥ threshold)"""
+    return sum(p for x, p in pmf.items() if x >= threshold)
+
+# ============== 事件卡与牌堆 ==============
+
+@dataclass(frozen=True)
+class EventCard:
+    """一张集体事件卡的劫难效果（负值为减劫难）
+
+    每名玩家以牌堆的合作率独立选择合作（选 A / 跟随 / 护民 / 供养），
+    劫难 = calamity − coop_relief × 合作人数（无人合作时再 + none_penalty）；
+    surge_at 给出时，结算前劫难 ≥ surge_at 则额外 + surge（只在路径分布中计入）。
+    count 为张数（有放回牌堆中为抽取权重）。
+    """
+    name: str
+    calamity: int = 0
+    coop_relief: int = 0
+    none_penalty: int = 0
+    surge_at: Optional[int] = None
+    surge: int = 0
+    count: float = 1
+
+    def pmf(self, players: int, coop_rate: float) -> Pmf:
+        if self.coop_relief == 0 and self.none_penalty == 0:
+            return point(self.calamity)
+        out: Pmf = defaultdict(float)
+        for k, p in binomial(players, coop_rate).items():
+            out[self.calamity - self.coop_relief * k + (self.none_penalty if k == 0 else 0)] += p
+        return dict(out)
+
+@dataclass
+class EventDeck:
+    """牌堆：若干分堆，以及每回合从哪一堆抽的顺序（多种顺序时按概率混合）
+
+    replace=True 时每回合按 count 权重有放回抽取；否则各堆洗匀后无放回抽取。
+    """
+    name: str
+    piles: Dict[str, List[EventCard]]
+    orders: List[Tuple[float, Tuple[str, ...]]]   # (概率, 第 1..R 回合抽的堆名)
+    replace: bool = False
+    coop_rate: float = 0.5
+    players: int = 4
+
+    @property
+    def rounds(self) -> int:
+        return len(self.orders[0][1])
+
+def shuffled_deck(name: str, cards: List[EventCard], rounds: int = 6, **kwargs) -> EventDeck:
+    """单堆洗匀，逐回合无放回抽取"""
+    return EventDeck(name, {"牌堆": list(cards)}, [(1.0, ("牌堆",) * rounds)], **kwargs)
+
+def engine_deck(config: v58.GameConfig, players: int = 4) -> EventDeck:
+    """v5.8 模拟器的集体事件：与 GameEngine.process_collective_event 相同的权重、劫难与合作率"""
+    tables = config.compile()
+    cards = [
+        EventCard("灾难", tables.disaster_base, coop_relief=1, count=tables.disaster_weight),
+        EventCard("人祸", tables.misfortune_base,
+                  count=tables.misfortune_cutoff - tables.disaster_weight),
+        EventCard("功德", 0, count=1.0 - tables.misfortune_cutoff),
+    ]
+    name = "v5.8 模拟器" + ("（人间炼狱）" if config.hell_mode else "")
+    return EventDeck(name, {"事件": cards}, [(1.0, ("事件",) * config.total_rounds)],
+                     replace=True, coop_rate=tables.coop_rate, players=players)
+
+def segmented_deck(name: str, construction: List[EventCard], disaster: List[EventCard]) -> EventDeck:
+    """规则 12.8 分段牌堆：1-2 回合抽建设堆，3-4 回合从两堆各 1 张组成的混合堆抽，5-6 回合抽灾难堆
+
+    混合堆的两张分别是建设堆、灾难堆剩余牌中的均匀一张，故等价于
+    “第 3、4 回合一次建设一次灾难、先后各半”。
+    """
+    piles = {"建设": list(construction), "灾难": list(disaster)}
+    orders = [
+        (0.5, ("建设", "建设", "建设", "灾难", "灾难", "灾难")),
+        (0.5, ("建设", "建设", "灾难", "建设", "灾难", "灾难")),
+    ]
+    return EventDeck(name, piles, orders)
+
+def backtest_deck(name: str, deck: List[Dict], rounds: int = 6) -> EventDeck:
+    """archive 回测系统的牌堆字典 → 无放回牌堆（只取 effect 中的 calamity，缺省为 0）"""
+    cards = [EventCard(card["name"], card.get("effect", {}).get("calamity", 0)) for card in deck]
+    return shuffled_deck(name, cards, rounds)
+
+# 规则书 v5.8 七A 的 12 张集体事件卡（“每多 1 人选 A 劫难 −1”按每名合作者 −1 计）
+RULEBOOK_V58 = [
+    EventCard("C1 旱魃肆虐", 4, coop_relief=1, none_penalty=2),
+    EventCard("C2 洪水滔天", 4, coop_relief=1),
+    EventCard("C3 瘟疫流行", 5, coop_relief=1),
+    EventCard("C4 蝗灾蔽日", 4, coop_relief=2, none_penalty=3),
+    EventCard("C5 苛政如虎", 3, surge_at=10, surge=1),
+    EventCard("C6 兵戈四起", 3, coop_relief=1),
+    EventCard("C7 风调雨顺", 0),
+    EventCard("C8 国泰民安", -2),
+    EventCard("C9 浴佛盛会", 0, coop_relief=1),
+    EventCard("C10 盂兰盆节", 0),
+    EventCard("C11 高僧讲经", 0),
+    EventCard("C12 舍利现世", -1),
+]
+
+# archive/Archive-260129/模拟测试/backtest_system.py 的两副牌堆（只列劫难相关效果）
+BACKTEST_DEFAULT = [
+    {"name": "旱灾", "effect": {"calamity": 2}},
+    {"name": "洪水", "effect": {"calamity": 2}},
+    {"name": "瘟疫", "effect": {"calamity": 3, "wealth_all": -1}},
+    {"name": "丰收", "effect": {"wealth_all": 2}},
+    {"name": "法会", "effect": {"fu_all": 1, "hui_all": 1}},
+    {"name": "高僧开示", "effect": {"hui_all": 2}},
+    {"name": "国泰民安", "effect": {"calamity": -2}},
+    {"name": "浴佛节", "effect": {"fu_all": 2}},
+]
+BACKTEST_TUNED_V36 = [
+    {"name": "旱灾", "effect": {"calamity": 1}},
+    {"name": "洪水", "effect": {"calamity": 1}},
+    {"name": "瘟疫", "effect": {"calamity": 2, "wealth_all": -1}},
+    {"name": "丰收", "effect": {"wealth_all": 2}},
+    {"name": "法会", "effect": {"fu_all": 1, "hui_all": 1}},
+    {"name": "高僧开示", "effect": {"hui_all": 2}},
+    {"name": "国泰民安", "effect": {"calamity": -3}},
+    {"name": "浴佛节", "effect": {"fu_all": 2}},
+]
+
+# ============== 众生超时 ==============
+
+def timeout_schedule(config: v58.GameConfig, rounds: Optional[int] = None,
+                     slots: int = 2, limit: int = 2) -> List[int]:
+    """无人渡化时每回合的超时劫难（同 process_beings_phase：场上 slots 张，计时器达 limit 超时）"""
+    rounds = rounds or config.total_rounds
+    timers = [0] * slots
+    schedule = []
+    for _ in range(rounds):
+        timers = [t + 1 for t in timers]
+        expired = sum(1 for t in timers if t >= limit)
+        timers = [t for t in timers if t < limit]
+        timers += [0] * (slots - len(timers))
+        schedule.append(expired * config.timeout_penalty)
+    return schedule
+
+# ============== 注入压力（卷积） ==============
+
+def _pile_sum(deck: EventDeck, pile: str, draws: int) -> Pmf:
+    """从一堆抽 draws 张的劫难之和（基础效果）"""
+    cards = deck.piles[pile]
+    pmfs = [card.pmf(deck.players, deck.coop_rate) for card in cards]
+    if deck.replace:
+        one = mixture([(card.count, pmf) for card, pmf in zip(cards, pmfs)])
+        total = point(0)
+        for _ in range(draws):
+            total = convolve(total, one)
+        return total
+    # 无放回：draws 张子集等可能，dp[k] = 已处理牌中选 k 张的全部子集之和分布（按子集数加权）
+    dp: List[Pmf] = [point(0)] + [{} for _ in range(draws)]
+    for card, pmf in zip(cards, pmfs):
+        count = int(card.count)
+        powers = [point(0)]
+        for _ in range(min(count, draws)):
+            powers.append(convolve(powers[-1], pmf))
+        new: List[Pmf] = [defaultdict(float) for _ in range(draws + 1)]
+        for k, acc in enumerate(dp):
+            if not acc:
+                continue
+            for j in range(min(count, draws - k) + 1):
+                ways = math.comb(count, j)
+                for x, p in convolve(acc, powers[j]).items():
+                    new[k + j][x] += ways * p
+        dp = [dict(d) for d in new]
+    size = sum(int(card.count) for card in cards)
+    if draws > size:
+        raise ValueError(f"{deck.name} 的 {pile} 堆只有 {size} 张，不够抽 {draws} 张")
+    ways = math.comb(size, draws)
+    return {x: p / ways for x, p in dp[draws].items()}
+
+def injected(deck: EventDeck, rounds: Optional[int] = None) -> Pmf:
+    """前 rounds 回合事件注入劫难之和的精确分布（基础效果，不截断）"""
+    rounds = deck.rounds if rounds is None else rounds
+    parts = []
+    for prob, order in deck.orders:
+        total = point(0)
+        for pile in deck.piles:
+            draws = order[:rounds].count(pile)
+            if draws:
+                total = convolve(total, _pile_sum(deck, pile, draws))
+        parts.append((prob, total))
+    return mixture(parts)
+
+def per_round(deck: EventDeck, round_num: int) -> Pmf:
+    """第 round_num 回合（从 1 起）事件注入劫难的边际分布（无放回时与抽第一张同分布）"""
+    parts = []
+    for prob, order in deck.orders:
+        cards = deck.piles[order[round_num - 1]]
+        for card in cards:
+            parts.append((prob * card.count / sum(c.count for c in cards),
+                          card.pmf(deck.players, deck.coop_rate)))
+    return mixture(parts)
+
+# ============== 路径分布（截断与崩盘） ==============
+
+@dataclass
+class DeckAnalysis:
+    """一副牌堆的解析结果（概率均为精确值）"""
+    name: str
+    per_round: List[Pmf]                 # 每回合注入（事件 + 超时）的边际分布
+    cumulative: List[Pmf]                # 前 r 回合累计注入
+    collapse: List[float]                # 第 r 回合劫难达上限（崩盘）的概率
+    final: Pmf                           # 未崩盘局的终局劫难（质量之和 = 1 − 总崩盘率）
+    win_calamity: int
+    timeouts: List[int] = field(default_factory=list)
+    states: int = 0
+    elapsed: float = 0.0
+
+    @property
+    def collapse_rate(self) -> float:
+        return sum(self.collapse)
+
+    @property
+    def calamity_ok_rate(self) -> float:
+        """未崩盘且终局劫难 ≤ win_calamity 的概率（团队胜利的劫难条件）"""
+        return sum(p for c, p in self.final.items() if c <= self.win_calamity)
+
+def calamity_path(deck: EventDeck, timeouts: Optional[Sequence[int]] = None,
+                  max_calamity: int = 20, start: int = 0) -> Tuple[List[float], Pmf, int]:
+    """按引擎结算顺序传播 (剩余牌, 劫难) 的分布：返回 (各回合崩盘概率, 未崩盘终局劫难, 最大状态数)
+
+    每回合：抽牌结算 → 劫难不低于 0 → 加超时劫难 → 劫难 ≥ max_calamity 则崩盘（吸收）。
+    """
+    rounds = deck.rounds
+    timeouts = list(timeouts) if timeouts is not None else [0] * rounds
+    names = list(deck.piles)
+    cards = [(names.index(pile), card) for pile in names for card in deck.piles[pile]]
+    base = [card.pmf(deck.players, deck.coop_rate) for _, card in cards]
+    surged = [shift(pmf, card.surge) for pmf, (_, card) in zip(base, cards)]
+    initial = tuple(card.count for _, card in cards)
+
+    collapse = [0.0] * rounds
+    final: Pmf = defaultdict(float)
+    max_states = 0
+    for prob, order in deck.orders:
+        dist = {(initial, start): prob}
+        for r, pile_name in enumerate(order):
+            pile = names.index(pile_name)
+            new = defaultdict(float)
+            for (remaining, calamity), p in dist.items():
+                total = sum(n for (k, _), n in zip(cards, remaining) if k == pile)
+                for i, ((k, card), n) in enumerate(zip(cards, remaining)):
+                    if k != pile or n == 0:
+                        continue
+                    if deck.replace:
+                        after = remaining
+                    else:
+                        after = remaining[:i] + (n - 1,) + remaining[i + 1:]
+                    surge = card.surge_at is not None and calamity >= card.surge_at
+                    for x, q in (surged[i] if surge else base[i]).items():
+                        value = max(0, calamity + x) + timeouts[r]
+                        mass = p * n / total * q
+                        if value >= max_calamity:
+                            collapse[r] += mass
+                        else:
+                            new[(after, value)] += mass
+            dist = new
+            max_states = max(max_states, len(dist))
+        for (_, calamity), p in dist.items():
+            final[calamity] += p
+    return collapse, dict(sorted(final.items())), max_states
+
+def analyze(deck: EventDeck, timeouts: Optional[Sequence[int]] = None,
+            max_calamity: int = 20, win_calamity: int = 12) -> DeckAnalysis:
+    """注入压力（每回合 / 累计）与路径分布"""
+    begin = time.perf_counter()
+    timeouts = list(timeouts) if timeouts is not None else [0] * deck.rounds
+    rounds = [shift(per_round(deck, r), timeouts[r - 1]) for r in range(1, deck.rounds + 1)]
+    cumulative = [shift(injected(deck, r), sum(timeouts[:r])) for r in range(1, deck.rounds + 1)]
+    collapse, final, states = calamity_path(deck, timeouts, max_calamity)
+    return DeckAnalysis(deck.name, rounds, cumulative, collapse, final, win_calamity,
+                        timeouts, states, time.perf_counter() - begin)
+
+def v58_analysis(config: v58.GameConfig, timeouts: bool = True) -> DeckAnalysis:
+    """v5.8 模拟器在无行动时的事件（与众生超时）压力"""
+    schedule = timeout_schedule(config) if timeouts else None
+    return analyze(engine_deck(config), schedule, config.max_calamity, config.win_calamity)
+
+# ============== 与蒙特卡洛对照 ==============
+
+def engine_sample(config: v58.GameConfig, seed: int, games: int,
+                  timeouts: bool = True) -> Tuple[List[int], Dict[int, int]]:
+    """用 GameEngine 的事件与众生阶段抽样同一循环（无行动）：返回 (各回合崩盘局数, 未崩盘终局劫难计数)"""
+    engine = v58.GameEngine(config, rng=random.Random())
+    collapse, counts = [0] * config.total_rounds, defaultdict(int)
+    for i in range(games):
+        engine.seed(v58.derive_seed(seed, i))
+        state = v58.GameState(config=config, players=engine.init_players(), tables=engine.tables)
+        state.beings_in_play = [0, 1]
+        state.being_timers = [0, 0]
+        for round_num in range(1, config.total_rounds + 1):
+            state.current_round = round_num
+            engine.process_collective_event(state)
+            if timeouts:
+                engine.process_beings_phase(state)
+            if state.calamity >= config.max_calamity:
+                collapse[round_num - 1] += 1
+                break
+        else:
+            counts[state.calamity] += 1
+    return collapse, dict(counts)
+
+def check(name: str, exact: DeckAnalysis, collapse: List[int], counts: Dict[int, int]) -> bool:
+    """对照抽样：总崩盘率的 Wilson 区间、未崩盘局平均终局劫难的 95% 区间"""
+    games = sum(collapse) + sum(counts.values())
+    low, high = v58.wilson_interval(sum(collapse), games)
+    inside = low - 1e-12 <= exact.collapse_rate <= high + 1e-12
+    line = (f"  {name:<18} 崩盘率 精确 {exact.collapse_rate*100:6.2f}% / "
+            f"抽样 [{low*100:5.2f}%, {high*100:5.2f}%]")
+    survivors = sum(counts.values())
+    if survivors > 1 and exact.collapse_rate < 1:
+        sample_mean = sum(c * k for c, k in counts.items()) / survivors
+        var = sum(k * (c - sample_mean) ** 2 for c, k in counts.items()) / (survivors - 1)
+        margin = v58.CI_Z * (var / survivors) ** 0.5
+        exact_mean = mean(exact.final)
+        inside = inside and abs(exact_mean - sample_mean) <= margin + 1e-9
+        line += f" | 未崩盘平均劫难 精确 {exact_mean:5.2f} / 抽样 {sample_mean:5.2f}±{margin:.2f}"
+    print(f"{line} {'✓' if inside else '✗'}")
+    return inside
+
+def format_analysis(result: DeckAnalysis) -> str:
+    total = result.cumulative[-1]
+    lines = [f"  累计注入劫难: 均值 {mean(total):.2f}，标准差 {std(total):.2f}，"
+             f"P(≥12) {tail(total, 12)*100:.1f}%，P(≥20) {tail(total, 20)*100:.1f}%"]
+    lines.append("  每回合注入均值: " + "  ".join(f"R{r}:{mean(p):.2f}" for r, p in enumerate(result.per_round, 1)))
+    if any(result.timeouts):
+        lines.append("  其中超时劫难: " + "  ".join(f"R{r}:{t}" for r, t in enumerate(result.timeouts, 1)))
+    lines.append("  各回合崩盘: " + "  ".join(f"R{r}:{p*100:.2f}%" for r, p in enumerate(result.collapse, 1)))
+    lines.append(f"  总崩盘率 {result.collapse_rate*100:.2f}%，终局劫难 ≤{result.win_calamity} "
+                 f"{result.calamity_ok_rate*100:.2f}%（{result.states} 状态，{result.elapsed*1000:.0f}ms）")
+    return "\n".join(lines)
+
+# ============== 主程序 ==============
+
+def main(games: int = 20000, seed: int = 2026):
+    print("《功德轮回》集体事件牌堆解析评估（无行动）")
+    print("=" * 50)
+    base, hell = v58.GameConfig(), v58.GameConfig(hell_mode=True)
+
+    print(f"\n【v5.8 模拟器】精确值 vs {games} 局蒙特卡洛")
+    results = []
+    for name, config, timeouts in [("基础版 仅事件", base, False), ("人间炼狱 仅事件", hell, False),
+                                   ("基础版 事件+超时", base, True), ("人间炼狱 事件+超时", hell, True)]:
+        exact = v58_analysis(config, timeouts)
+        check(name, exact, *engine_sample(config, seed, games, timeouts))
+        results.append((name, exact))
+    for name, exact in results:
+        print(f"\n{name}")
+        print(format_analysis(exact))
+
+    print("\n【实体牌堆】规则书 12 张 / 分段牌堆 / archive 回测牌堆（无放回，6 回合）")
+    decks = [
+        shuffled_deck("规则书 v5.8 洗匀", RULEBOOK_V58),
+        segmented_deck("规则书 v5.8 分段（12.8）", RULEBOOK_V58[6:], RULEBOOK_V58[:6]),
+        backtest_deck("回测 默认牌堆", BACKTEST_DEFAULT),
+        backtest_deck("回测 v3.6 调优牌堆", BACKTEST_TUNED_V36),
+    ]
+    for deck in decks:
+        print(f"\n{deck.name}")
+        print(format_analysis(analyze(deck)))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,343 @@
+# -*- coding: utf-8 -*-
+"""
+《功德轮回》精确动态规划评估器（共业测试规则 karma_test 与核心版集体事件循环）
+不抽样，而是逐回合传播“状态 → 概率”的分布：每个随机分支按其概率展开，相同状态合并，
+劫难达到上限的分支提前结束。得到精确的团队胜率、终局劫难分布与共业倍率构成，
+可作为蒙特卡洛引擎的基准真值（main() 中与抽样结果的置信区间对照）。
+
+只追踪影响胜负的量：功德、慧不参与这些规则的任何决策，不进状态；
+资粮高于剩余回合内可能触及的决策阈值后截断（截断后的后续决策完全相同）。
+
+依赖：numpy
+"""
+
+import os
+import sys
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "core"))
+
+import karma_test as karma
+import simulator_core_v1 as core
+from sampling import CI_Z, derive_seed, wilson_interval
+
+Distribution = Dict[tuple, float]
+
+# ============== 结果 ==============
+
+@dataclass
+class ExactResult:
+    """精确分布：终局劫难 → 概率，共业倍率（团队失败为 0）→ 概率"""
+    win_rate: float
+    calamity: Dict[int, float]
+    karma: Dict[float, float]
+    states: int = 0      # 传播过程中的最大状态数（稠密张量为元素数）
+    elapsed: float = 0.0
+
+    @property
+    def avg_calamity(self) -> float:
+        return sum(c * p for c, p in self.calamity.items())
+
+    @property
+    def avg_karma(self) -> float:
+        return sum(m * p for m, p in self.karma.items())
+
+def _spread(dist: Distribution, step: Callable[[tuple], Iterable[Tuple[float, tuple]]]) -> Distribution:
+    """对每个状态展开 step(状态) 给出的 (条件概率, 新状态) 分支，合并相同状态"""
+    out = defaultdict(float)
+    for state, prob in dist.items():
+        for q, new_state in step(state):
+            if q > 0:
+                out[new_state] += prob * q
+    return out
+
+def _karma_multiplier(levels: Sequence[Tuple[int, float]], calamity: int) -> float:
+    """同 get_karma_multiplier"""
+    for threshold, multiplier in levels:
+        if calamity <= threshold:
+            return multiplier
+    return 1.0
+
+def _summarize(finished: Dict[tuple, float], win: Callable[[tuple], bool],
+               levels: Sequence[Tuple[int, float]]) -> ExactResult:
+    """finished: 终局状态（首元为劫难）→ 概率"""
+    result = ExactResult(0.0, defaultdict(float), defaultdict(float))
+    for state, prob in finished.items():
+        calamity = state[0]
+        result.calamity[calamity] += prob
+        if win(state):
+            result.win_rate += prob
+            result.karma[_karma_multiplier(levels, calamity)] += prob
+        else:
+            result.karma[0] += prob
+    result.calamity = dict(sorted(result.calamity.items()))
+    result.karma = dict(sorted(result.karma.items()))
+    return result
+
+# ============== 共业测试规则 ==============
+
+# 各类型选A（牺牲）的概率，同 KarmaTestEngine.player_choose_sacrifice
+SACRIFICE_PROB = {
+    karma.PlayerType.ALTRUIST: 0.8,
+    karma.PlayerType.SELFISH: 0.2,
+    karma.PlayerType.NEUTRAL: 0.5,
+}
+
+def _karma_actions(config: karma.TestConfig, wealth: int) -> Dict[Tuple[int, int], float]:
+    """一人一回合 2 次行动的分支：(资粮, 劫难减少量) → 概率，同 run_game 行动阶段的级联"""
+    out = {(wealth, 0): 1.0}
+    for _ in range(2):
+        step = defaultdict(float)
+        for (w, d), p in out.items():
+            if w < 2:
+                step[(w + config.labor_gain, d)] += p
+                continue
+            step[(w - config.donate_cost, d + config.donate_calamity)] += p * 0.3
+            step[(w - config.protect_cost, d + config.protect_calamity)] += p * 0.7 * 0.3
+            step[(w, d)] += p * 0.7 * 0.7 * 0.5  # 修行：慧不影响胜负
+            step[(w + config.labor_gain, d)] += p * 0.7 * 0.7 * 0.5
+        out = step
+    return out
+
+def _karma_stages(config: karma.TestConfig, caps: Sequence[int]) -> List[Tuple[List[int], List[int], List[int], Dict[int, int]]]:
+    """单个玩家每回合的资粮取值集合：(回合初, 选A后, 行动后, 回合末截断映射)
+
+    资粮过程与劫难、他人无关，可单独前推。不低于 cap 的资粮彼此等价，
+    统一映射到其中最小的可达值（而非 cap 本身），不引入新的取值。
+    """
+    current = {config.init_resources[0]}
+    stages = []
+    for cap in caps:
+        sacrificed = current | {w - config.sacrifice_cost for w in current}
+        acted = {w2 for w in sacrificed for w2, _ in _karma_actions(config, w)}
+        high = [w for w in acted if w >= cap]
+        capping = {w: min(high) if w in high else w for w in acted}
+        stages.append((sorted(current), sorted(sacrificed), sorted(acted), capping))
+        current = set(capping.values())
+    return stages
+
+def _matrix(src: Sequence[int], dst: Sequence[int], moves: Iterable[Tuple[int, int, float]]) -> np.ndarray:
+    """(起点取值, 终点取值, 概率) → 转移矩阵 [len(src), len(dst)]"""
+    row = {w: k for k, w in enumerate(src)}
+    col = {w: k for k, w in enumerate(dst)}
+    matrix = np.zeros((len(src), len(dst)))
+    for w, w2, q in moves:
+        matrix[row[w], col[w2]] += q
+    return matrix
+
+def _lower(tensor: np.ndarray, amount: int) -> np.ndarray:
+    """劫难轴（第0轴）整体降低 amount，低于 0 的部分截断到 0"""
+    if amount <= 0:
+        return tensor
+    out = np.zeros_like(tensor)
+    out[0] = tensor[:amount + 1].sum(axis=0)
+    out[1:len(tensor) - amount] = tensor[amount + 1:]
+    return out
+
+def _apply(tensor: np.ndarray, axis: int, kernels: Dict[int, np.ndarray]) -> np.ndarray:
+    """沿一个玩家的资粮轴作用转移矩阵：kernels 为 劫难减少量 → 矩阵，合为一次张量缩并"""
+    shifts = list(kernels)
+    stacked = np.concatenate([kernels[d] for d in shifts], axis=1)
+    out = np.tensordot(tensor, stacked, axes=([axis], [0]))
+    out = out.reshape(out.shape[:-1] + (len(shifts), -1))
+    total = 0
+    for k, d in enumerate(shifts):
+        total = total + _lower(np.moveaxis(out[..., k, :], -1, axis), d)
+    return total
+
+def karma_exact(player_types: Sequence[str], config: Optional[karma.TestConfig] = None) -> ExactResult:
+    """KarmaTestEngine.run_game 的精确胜率与终局劫难分布
+
+    状态为稠密张量 P[劫难, 玩家1资粮, …, 玩家n资粮]。各玩家的资粮只受本人选择影响，
+    劫难只通过各人贡献之和变化，因此每步只沿一个玩家的资粮轴作用转移矩阵，再平移劫难轴。
+    行动只会降低劫难，逐人截断于 0 与阶段末截断等价。
+    """
+    config = config or karma.TestConfig()
+    start = time.perf_counter()
+    n = len(player_types)
+    # 资粮只在“<2”处参与决策；每回合最多减少 选A代价 + 2 次行动的支出，
+    # 不低于 2 + 剩余回合数 × 该值的资粮此后决策完全相同，截断不改变分布
+    drop = config.sacrifice_cost + 2 * max(config.donate_cost, config.protect_cost)
+    caps = [2 + drop * (config.total_rounds - r) for r in range(1, config.total_rounds + 1)]
+
+    M, E = config.max_calamity, config.event_calamity
+    dist = np.zeros((M,) + (1,) * n)
+    dist[0] = 1.0
+    finished = np.zeros(M + E)
+    peak = 0
+    for start_values, sacrificed, acted, capping in _karma_stages(config, caps):
+        keep = _matrix(start_values, sacrificed, ((w, w, 1.0) for w in start_values))
+        chosen = _matrix(start_values, sacrificed, ((w, w - config.sacrifice_cost, 1.0) for w in start_values))
+        # 2 次行动的转移，按劫难减少量拆成多个矩阵
+        moves = defaultdict(list)
+        for w in sacrificed:
+            for (w2, d), q in _karma_actions(config, w).items():
+                moves[d].append((w, w2, q))
+        action = {d: _matrix(sacrificed, acted, m) for d, m in moves.items()}
+        capped = {0: _matrix(acted, sorted(set(capping.values())), ((w, capping[w], 1.0) for w in acted))}
+
+        # 集体事件：劫难 +event_calamity，再逐人选A/选B
+        grown = np.zeros((M + E,) + dist.shape[1:])
+        grown[E:] = dist
+        for i, ptype in enumerate(player_types):
+            q = SACRIFICE_PROB[ptype]
+            grown = _apply(grown, 1 + i, {0: (1 - q) * keep, config.sacrifice_calamity_reduce: q * chosen})
+        finished[M:] += grown[M:].reshape(E, -1).sum(axis=1)
+        dist = grown[:M]
+        # 行动阶段：每人2次
+        for i in range(n):
+            dist = _apply(dist, 1 + i, action)
+        peak = max(peak, dist.size)
+        for i in range(n):
+            dist = _apply(dist, 1 + i, capped)
+    finished[:M] += dist.reshape(M, -1).sum(axis=1)
+
+    result = _summarize({(c,): p for c, p in enumerate(finished) if p > 0},
+                        lambda s: s[0] <= config.win_calamity, config.karma_multiplier_levels)
+    result.states = peak
+    result.elapsed = time.perf_counter() - start
+    return result
+
+# ============== 核心版集体事件 ==============
+
+def _core_sacrifice_prob(wealth: int, calamity: int) -> float:
+    """同 AIDecision.choose_sacrifice（原实现中 ≥15 的分支不可达，照搬）"""
+    prob = 0.7 if calamity >= 10 else 0.5
+    if wealth < 3:
+        prob -= 0.2
+    return prob
+
+def core_event_exact(config: Optional[core.CoreConfig] = None) -> ExactResult:
+    """CoreGameEngine 集体事件/牺牲循环的精确分布（不含行动阶段）
+
+    每回合：劫难 +disaster_calamity，按职业顺序逐人以 choose_sacrifice 的概率选A
+    （概率取决于此刻劫难与本人资粮），劫难达到上限即结束；偶数回合末资粮 −1。
+    状态：(劫难, 各职业资粮)。win_rate 为终局劫难 ≤ win_calamity 的概率（不含渡化条件）。
+
+    完整核心版的行动阶段按劫难（紧迫度）、回合、四名玩家各自的资粮与慧决策，
+    联合状态达数千万，无法精确展开；这里给出其中只依赖劫难与资粮的部分，
+    即“无人行动时仅靠牺牲抵御劫难”的基线。
+    """
+    config = config or core.CoreConfig()
+    start = time.perf_counter()
+    roles = list(core.Role)
+    init = {core.Role.FARMER: config.init_farmer, core.Role.MERCHANT: config.init_merchant,
+            core.Role.SCHOLAR: config.init_scholar, core.Role.MONK: config.init_monk}
+
+    dist = {(0, tuple(init[role][0] for role in roles)): 1.0}
+    finished = defaultdict(float)
+    peak = 1
+    for round_num in range(1, config.total_rounds + 1):
+        dist = {(c + config.disaster_calamity, w): p for (c, w), p in dist.items()}
+        for i in range(len(roles)):
+            def sacrifice(state, i=i):
+                c, w = state
+                q = _core_sacrifice_prob(w[i], c)
+                chosen = w[:i] + (max(0, w[i] - config.sacrifice_cost),) + w[i + 1:]
+                return ((q, (c - config.sacrifice_calamity_reduce, chosen)), (1 - q, state))
+            dist = _spread(dist, sacrifice)
+        ongoing = defaultdict(float)
+        for (c, w), p in dist.items():
+            c = max(0, c)
+            if c >= config.max_calamity:
+                finished[(c,)] += p
+            else:
+                if round_num % 2 == 0:  # 偶数回合消耗
+                    w = tuple(x - 1 if x > 0 else x for x in w)
+                ongoing[(c, w)] += p
+        dist = ongoing
+        peak = max(peak, len(dist))
+    for (c, _), p in dist.items():
+        finished[(c,)] += p
+
+    result = _summarize(finished, lambda s: s[0] <= config.win_calamity, config.karma_multiplier_levels)
+    result.states = peak
+    result.elapsed = time.perf_counter() - start
+    return result
+
+def core_event_sample(config: core.CoreConfig, seed: int, games: int) -> Tuple[int, Dict[int, int]]:
+    """用 CoreGameEngine.process_collective_event 抽样同一循环：返回 (劫难≤win_calamity 局数, 终局劫难计数)"""
+    engine = core.CoreGameEngine(config)
+    wins, counts = 0, defaultdict(int)
+    for i in range(games):
+        engine.rng.seed(derive_seed(seed, i))
+        state = core.GameState(config=config, players=engine.init_players())
+        for round_num in range(1, config.total_rounds + 1):
+            state.current_round = round_num
+            engine.process_collective_event(state)
+            if state.calamity >= config.max_calamity:
+                break
+            if round_num % 2 == 0:
+                for p in state.players:
+                    if p.wealth > 0:
+                        p.wealth -= 1
+        wins += state.calamity <= config.win_calamity
+        counts[state.calamity] += 1
+    return wins, dict(counts)
+
+# ============== 与蒙特卡洛对照 ==============
+
+def check(name: str, exact: ExactResult, wins: int, calamity: Dict[int, int]) -> bool:
+    """对照抽样结果：胜率的 Wilson 区间、平均终局劫难的 95% 区间，返回精确值是否都落在区间内"""
+    games = sum(calamity.values())
+    low, high = wilson_interval(wins, games)
+    mean = sum(c * k for c, k in calamity.items()) / games
+    var = sum(k * (c - mean) ** 2 for c, k in calamity.items()) / (games - 1)
+    margin = CI_Z * (var / games) ** 0.5
+    inside = low <= exact.win_rate <= high and abs(exact.avg_calamity - mean) <= margin
+    print(f"  {name:<16} 胜率 精确 {exact.win_rate*100:6.2f}% / 抽样 [{low*100:5.2f}%, {high*100:5.2f}%] | "
+          f"平均劫难 精确 {exact.avg_calamity:5.2f} / 抽样 {mean:5.2f}±{margin:.2f} "
+          f"{'✓' if inside else '✗'} | {exact.states} 状态 {exact.elapsed*1000:.0f}ms")
+    return inside
+
+def format_result(exact: ExactResult) -> str:
+    lines = [f"  胜率 {exact.win_rate*100:.3f}%，平均终局劫难 {exact.avg_calamity:.3f}，平均共业倍率 {exact.avg_karma:.4f}"]
+    lines.append("  共业倍率: " + "  ".join(f"×{m}: {p*100:.2f}%" for m, p in exact.karma.items()))
+    lines.append("  终局劫难: " + "  ".join(f"{c}:{p*100:.1f}%" for c, p in exact.calamity.items() if p >= 0.0005))
+    return "\n".join(lines)
+
+# ============== 主程序 ==============
+
+KARMA_SCENARIOS = {
+    "1好人 vs 3坏人": [karma.PlayerType.ALTRUIST] + [karma.PlayerType.SELFISH] * 3,
+    "1坏人 vs 3好人": [karma.PlayerType.SELFISH] + [karma.PlayerType.ALTRUIST] * 3,
+    "2好人 vs 2坏人": [karma.PlayerType.ALTRUIST] * 2 + [karma.PlayerType.SELFISH] * 2,
+    "4好人": [karma.PlayerType.ALTRUIST] * 4,
+    "4坏人": [karma.PlayerType.SELFISH] * 4,
+    "4普通人": [karma.PlayerType.NEUTRAL] * 4,
+}
+
+def main(games: int = 20000, seed: int = 2026):
+    print("《功德轮回》精确动态规划评估（共业测试 / 核心版）")
+    print("=" * 50)
+    config = karma.TestConfig()
+    engine = karma.KarmaTestEngine(config)
+    print(f"\n【共业测试】精确值 vs {games} 局蒙特卡洛")
+    exact_results = {}
+    for name, types in KARMA_SCENARIOS.items():
+        exact = exact_results[name] = karma_exact(types, config)
+        wins, calamity = 0, defaultdict(int)
+        for i in range(games):
+            engine.rng.seed(derive_seed(seed, name, i))
+            result = engine.run_game(types)
+            wins += result["team_win"]
+            calamity[result["final_calamity"]] += 1
+        check(name, exact, wins, calamity)
+    for name, exact in exact_results.items():
+        print(f"\n{name}")
+        print(format_result(exact))
+
+    print(f"\n【核心版集体事件循环（无行动）】精确值 vs {games} 局蒙特卡洛")
+    core_config = core.CoreConfig()
+    exact = core_event_exact(core_config)
+    wins, calamity = core_event_sample(core_config, seed, games)
+    check("核心版 v1.1", exact, wins, calamity)
+    print(format_result(exact))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,421 @@
+# -*- coding: utf-8 -*-
+"""
+《功德轮回》v5.8 对局轨迹记录与确定性回放
+平衡异常（如僧侣 0 渡化却得第 1）只看终局字典无从追查。轨迹模式记录每一局的
+集体事件抽取、众生抽取、每次行动决策，以及每一步之后全部状态字段的增量，
+写成 gzip 压缩的定长二进制流；回放器从轨迹重建任意一步的完整 GameState，无需引擎与随机数。
+
+用法：GameEngine(config, tracer=GameTracer(path, config))，不传 tracer 时引擎不做任何额外工作
+（与逐阶段剖析相同，以实例属性包装阶段方法）。BalanceAnalyzer 第 i 局的种子为 derive_seed(seed, i)，
+find_games() 找出可疑局号后 record_games() 只重跑并记录这些局，对局与原统计中的完全相同。
+
+文件格式：
+  b"GDTRACE1" + uint32 头部长度 + 头部 JSON（状态字段表、配置、引擎版本）
+  之后为 4 字节定长记录 <op:uint8, a:uint8, b:int16>：
+    GAME 开局（随后的 DELTA 为相对全零向量的初始状态）、SEED/INDEX 分段写出的种子与局号、
+    SETUP 信仰与发愿、ROUND a=回合、REFUGE a=玩家（无变化时省略）、EVENT a=事件类型 b=合作人数、
+    BEINGS 众生阶段（BEING a=槽位 b=新众生）、ACTION a=玩家 b=行动、ROUND_END、END a=团队胜利 b=终局劫难；
+    DELTA a=状态字段下标 b=增量，跟在所属步骤之后（超出 int16 时拆成多条）。
+  run_game 内联的状态改动（每回合帮助计数清零、学者讲学与地藏承受的随机判定）计入其后的一步。
+"""
+
+import dataclasses
+import gzip
+import json
+import os
+import struct
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import simulator_v58_FINAL as v58
+
+MAGIC = b"GDTRACE1"
+RECORD = struct.Struct("<BBh")
+RECORD_U16 = struct.Struct("<BBH")  # SEED / INDEX 的 16 位分段
+
+EVENT_TYPES = tuple(v58.EventType)
+DISASTER, MISFORTUNE, BLESSING = range(3)
+
+# ============== 记录类型 ==============
+
+OP_GAME, OP_SEED, OP_INDEX, OP_DELTA = 1, 2, 3, 4
+OP_SETUP, OP_ROUND, OP_REFUGE, OP_EVENT, OP_BEINGS, OP_BEING, OP_ACTION, OP_ROUND_END, OP_END = range(5, 14)
+
+STEP_NAMES = {
+    OP_GAME: "开局", OP_SETUP: "信仰与发愿", OP_ROUND: "回合开始", OP_REFUGE: "中途皈依", OP_EVENT: "集体事件",
+    OP_BEINGS: "众生阶段", OP_ACTION: "行动", OP_ROUND_END: "回合结束", OP_END: "终局",
+}
+
+# ============== 状态向量 ==============
+
+BEING_SLOTS = 2  # 场上众生数上限（同 process_beings_phase）
+STATE_FIELDS = ("calamity", "total_saves", "current_round", "protect_blessing_active", "protect_blessing_monk")
+PLAYER_FIELDS = tuple(f.name for f in dataclasses.fields(v58.Player))
+BOOL_FIELDS = {"protect_blessing_active", "protect_blessing_monk", "merchant_first_save"}
+
+def field_names(players: int = 4) -> List[str]:
+    """状态向量各下标的字段名：全局字段、众生槽位、逐玩家字段"""
+    names = list(STATE_FIELDS)
+    names += [f"being{k}" for k in range(BEING_SLOTS)] + [f"timer{k}" for k in range(BEING_SLOTS)]
+    names += [f"p{i}.{name}" for i in range(players) for name in PLAYER_FIELDS]
+    return names
+
+def state_vector(state: v58.GameState) -> List[int]:
+    """GameState → 整数向量（空众生槽位为 -1）"""
+    vector = [int(getattr(state, name)) for name in STATE_FIELDS]
+    for values in (state.beings_in_play, state.being_timers):
+        vector += list(values) + [-1] * (BEING_SLOTS - len(values))
+    for p in state.players:
+        vector += [int(getattr(p, name)) for name in PLAYER_FIELDS]
+    return vector
+
+def state_from_vector(vector: Sequence[int], config: v58.GameConfig) -> v58.GameState:
+    """整数向量 → GameState（tables 按 config 重新编译）"""
+    values = dict(zip(field_names((len(vector) - len(STATE_FIELDS) - 2 * BEING_SLOTS) // len(PLAYER_FIELDS)),
+                      vector))
+
+    def typed(name: str, key: str):
+        return bool(values[key]) if name in BOOL_FIELDS else values[key]
+
+    players = []
+    i = 0
+    while f"p{i}.role" in values:
+        players.append(v58.Player(**{name: typed(name, f"p{i}.{name}") for name in PLAYER_FIELDS}))
+        i += 1
+    state = v58.GameState(config=config, players=players, tables=config.compile())
+    for name in STATE_FIELDS:
+        setattr(state, name, typed(name, name))
+    slots = [(values[f"being{k}"], values[f"timer{k}"]) for k in range(BEING_SLOTS)]
+    state.beings_in_play = [b for b, _ in slots if b >= 0]
+    state.being_timers = [t for b, t in slots if b >= 0]
+    return state
+
+def _delta_records(old: Sequence[int], new: Sequence[int]) -> List[bytes]:
+    records = []
+    for index, (a, b) in enumerate(zip(old, new)):
+        delta = b - a
+        while delta:
+            part = max(-32768, min(32767, delta))
+            records.append(RECORD.pack(OP_DELTA, index, part))
+            delta -= part
+    return records
+
+# ============== 记录器 ==============
+
+class GameTracer:
+    """把引擎每一局写入轨迹文件（gzip 流，逐局写出）；用作上下文管理器或用毕调用 close()"""
+
+    def __init__(self, path: str, config: v58.GameConfig, players: int = 4):
+        self.path = path
+        self.file = gzip.open(path, "wb")
+        header = json.dumps({
+            "fields": field_names(players),
+            "config": dataclasses.asdict(config),
+            "engine": v58.ENGINE_VERSION,
+        }, ensure_ascii=False).encode("utf-8")
+        self.file.write(MAGIC + struct.pack("<I", len(header)) + header)
+        self.games = 0
+        self.records = 0
+        self.game_index: Optional[int] = None  # 下一局的局号（record_games 设置），写入轨迹
+        self._seed: Optional[int] = None
+        self._buffer: List[bytes] = []
+        self._last: List[int] = []
+        self._round = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.file.close()
+
+    # ---------- 记录 ----------
+
+    def _step(self, op: int, a: int, b: int, state: v58.GameState, extra: Iterable[bytes] = (),
+              skip_empty: bool = False):
+        """写一步：步骤记录 + 相对上一步的状态增量（+ 附加记录）"""
+        vector = state_vector(state)
+        deltas = _delta_records(self._last, vector)
+        if skip_empty and not deltas:
+            return
+        self._buffer.append(RECORD.pack(op, a, b))
+        self._buffer.extend(deltas)
+        self._buffer.extend(extra)
+        self._last = vector
+
+    def _begin(self, state: v58.GameState):
+        """开局：种子、局号与相对全零向量的初始状态"""
+        self._buffer = [RECORD.pack(OP_GAME, 0, 0)]
+        for op, value, chunks in ((OP_SEED, self._seed, 4), (OP_INDEX, self.game_index, 2)):
+            if value is not None:
+                self._buffer += [RECORD_U16.pack(op, k, (value >> (16 * k)) & 0xFFFF) for k in range(chunks)]
+        vector = state_vector(state)
+        self._buffer += _delta_records([0] * len(vector), vector)
+        self._last = vector
+        self._round = 0
+
+    def _end(self, state: v58.GameState, result: Dict):
+        self._step(OP_END, int(result["team_win"]), state.calamity, state)
+        self.file.write(b"".join(self._buffer))
+        self.records += len(self._buffer)
+        self.games += 1
+        self._buffer = []
+        self._seed = None
+        self.game_index = None
+
+    # ---------- 挂接引擎 ----------
+
+    def attach(self, engine: v58.GameEngine):
+        """以实例属性包装引擎的播种与各阶段方法（GameEngine(tracer=...) 时自动调用）"""
+        seed, setup = engine.seed, engine.choose_setup
+        refuge, event = engine.check_mid_game_refuge, engine.process_collective_event
+        beings = engine.process_beings_phase
+        execute, round_end, result = engine.execute_action, engine.process_round_end, engine.game_result
+        tracer = self
+
+        def traced_seed(value: int):
+            tracer._seed = value & 0xFFFFFFFFFFFFFFFF
+            seed(value)
+
+        def traced_setup(state):
+            tracer._begin(state)
+            setup(state)
+            tracer._step(OP_SETUP, 0, 0, state)
+
+        def traced_refuge(player, state):
+            if state.current_round != tracer._round:
+                tracer._round = state.current_round
+                tracer._step(OP_ROUND, state.current_round, 0, state)
+            refuge(player, state)
+            tracer._step(OP_REFUGE, player.index, 0, state, skip_empty=True)
+
+        def traced_event(state):
+            kind, coop = tracer._peek_event(engine, state)
+            event(state)
+            tracer._step(OP_EVENT, kind, coop, state)
+
+        def traced_beings(state):
+            kept = sum(1 for t in state.being_timers if t + 1 < 2)
+            beings(state)
+            drawn = [RECORD.pack(OP_BEING, slot, state.beings_in_play[slot])
+                     for slot in range(kept, len(state.beings_in_play))]
+            tracer._step(OP_BEINGS, 0, 0, state, drawn)
+
+        def traced_execute(player, action, state):
+            execute(player, action, state)
+            tracer._step(OP_ACTION, player.index, action, state)
+
+        def traced_round_end(state):
+            round_end(state)
+            tracer._step(OP_ROUND_END, state.current_round, 0, state)
+
+        def traced_result(state):
+            outcome = result(state)
+            tracer._end(state, outcome)
+            return outcome
+
+        engine.seed = traced_seed
+        engine.choose_setup = traced_setup
+        engine.check_mid_game_refuge = traced_refuge
+        engine.process_collective_event = traced_event
+        engine.process_beings_phase = traced_beings
+        engine.execute_action = traced_execute
+        engine.process_round_end = traced_round_end
+        engine.game_result = traced_result
+
+    @staticmethod
+    def _peek_event(engine: v58.GameEngine, state: v58.GameState) -> Tuple[int, int]:
+        """预读事件流（读后恢复状态）：与 process_collective_event 相同的抽取得到事件类型与合作人数"""
+        rng, tables = engine.event_rng, engine.tables
+        saved = rng.getstate()
+        r = rng.random()
+        coop = 0
+        if r < tables.disaster_weight:
+            kind = DISASTER
+            coop = sum(1 for _ in state.players if rng.random() < tables.coop_rate)
+        elif r < tables.misfortune_cutoff:
+            kind = MISFORTUNE
+        else:
+            kind = BLESSING
+        rng.setstate(saved)
+        return kind, coop
+
+# ============== 读取与回放 ==============
+
+@dataclass
+class TraceStep:
+    """一步：类型、参数、之后的状态增量 (字段下标, 增量)、本步抽到的众生 (槽位, 众生)"""
+    op: int
+    a: int
+    b: int
+    deltas: List[Tuple[int, int]] = field(default_factory=list)
+    beings: List[Tuple[int, int]] = field(default_factory=list)
+
+    def describe(self) -> str:
+        name = STEP_NAMES.get(self.op, str(self.op))
+        if self.op == OP_EVENT:
+            text = f"{name} {EVENT_TYPES[self.a].value}" + (f"（{self.b} 人合作）" if self.a == DISASTER else "")
+        elif self.op == OP_ACTION:
+            text = f"{name} {v58.ROLES[self.a].value} {v58.ACTIONS[self.b].value}"
+        elif self.op == OP_REFUGE:
+            text = f"{name} {v58.ROLES[self.a].value}"
+        elif self.op == OP_ROUND:
+            text = f"第 {self.a} 回合"
+        elif self.op == OP_ROUND_END:
+            text = f"第 {self.a} 回合结束"
+        elif self.op == OP_END:
+            text = f"{name} {'胜利' if self.a else '失败'}，劫难 {self.b}"
+        else:
+            text = name
+        if self.beings:
+            text += "，新众生 " + " ".join(f"#{being}" for _, being in self.beings)
+        return text
+
+@dataclass
+class GameTrace:
+    """一局的轨迹：steps[0] 为开局（初始状态），最后一步为终局"""
+    seed: Optional[int]
+    index: Optional[int]
+    steps: List[TraceStep]
+    fields: List[str]
+    config: v58.GameConfig
+
+    @property
+    def team_win(self) -> bool:
+        return bool(self.steps[-1].a)
+
+    def vector(self, step: Optional[int] = None) -> List[int]:
+        """第 step 步之后的状态向量（None 为终局）"""
+        vector = [0] * len(self.fields)
+        for s in self.steps[:None if step is None else step + 1]:
+            for index, delta in s.deltas:
+                vector[index] += delta
+        return vector
+
+    def state(self, step: Optional[int] = None) -> v58.GameState:
+        """重建第 step 步之后的完整 GameState"""
+        return state_from_vector(self.vector(step), self.config)
+
+    def changes(self, step: int) -> Dict[str, int]:
+        """第 step 步的状态增量（字段名 → 增量）"""
+        return {self.fields[index]: delta for index, delta in self.steps[step].deltas}
+
+def _like(template, value):
+    """按默认值的结构把 JSON 还原的列表换回元组（含嵌套的列表与字典值）"""
+    if isinstance(template, (list, tuple)) and isinstance(value, list):
+        inner = template[0] if template else None
+        items = [_like(inner, v) for v in value]
+        return tuple(items) if isinstance(template, tuple) else items
+    if isinstance(template, dict) and isinstance(value, dict):
+        inner = next(iter(template.values()), None)
+        return {k: _like(inner, v) for k, v in value.items()}
+    return value
+
+def _config_from_header(data: Dict) -> v58.GameConfig:
+    default = v58.GameConfig()
+    values = {f.name: _like(getattr(default, f.name), data[f.name])
+              for f in dataclasses.fields(v58.GameConfig) if f.name in data}
+    return v58.GameConfig(**values)
+
+def read_trace(path: str) -> Iterator[GameTrace]:
+    """逐局读出轨迹文件"""
+    with gzip.open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} 不是轨迹文件")
+        (length,) = struct.unpack("<I", f.read(4))
+        header = json.loads(f.read(length).decode("utf-8"))
+        fields, config = header["fields"], _config_from_header(header["config"])
+        game = None
+        while True:
+            raw = f.read(RECORD.size * 4096)
+            if not raw:
+                break
+            for op, a, b in RECORD.iter_unpack(raw):
+                if op == OP_GAME:
+                    game = GameTrace(None, None, [TraceStep(op, a, b)], fields, config)
+                elif op in (OP_SEED, OP_INDEX):
+                    value = (b & 0xFFFF) << (16 * a)
+                    if op == OP_SEED:
+                        game.seed = (game.seed or 0) | value
+                    else:
+                        game.index = (game.index or 0) | value
+                elif op == OP_DELTA:
+                    game.steps[-1].deltas.append((a, b))
+                elif op == OP_BEING:
+                    game.steps[-1].beings.append((a, b))
+                else:
+                    game.steps.append(TraceStep(op, a, b))
+                    if op == OP_END:
+                        yield game
+
+# ============== 重跑与查找 ==============
+
+def find_games(config: v58.GameConfig, seed: int, games: int,
+               predicate: Callable[[Dict], bool]) -> List[int]:
+    """按 BalanceAnalyzer 的逐局种子跑第 [0, games) 局，返回结果满足 predicate 的局号"""
+    engine = v58.GameEngine(config)
+    found = []
+    for i in range(games):
+        engine.seed(v58.derive_seed(seed, i))
+        if predicate(engine.run_game()):
+            found.append(i)
+    return found
+
+def record_games(config: v58.GameConfig, seed: int, indices: Iterable[int], path: str) -> List[Dict]:
+    """带轨迹重跑指定局号（与 BalanceAnalyzer 同种子的第 i 局完全相同），返回各局结果"""
+    results = []
+    with GameTracer(path, config) as tracer:
+        engine = v58.GameEngine(config, tracer=tracer)
+        for i in indices:
+            tracer.game_index = i
+            engine.seed(v58.derive_seed(seed, i))
+            results.append(engine.run_game())
+    return results
+
+def monk_first_few_saves(result: Dict, max_saves: int = 1) -> bool:
+    """示例异常：僧侣渡化不超过 max_saves 次却排名第 1"""
+    return any(p["role"] == v58.Role.MONK.value and p["rank"] == 1 and p["save_count"] <= max_saves
+               for p in result["players"])
+
+def format_game(trace: GameTrace, limit: Optional[int] = None) -> str:
+    lines = [f"  局号 {trace.index}，种子 {trace.seed}，{len(trace.steps)} 步"]
+    for k, step in enumerate(trace.steps[:limit]):
+        changes = trace.changes(k)
+        shown = " ".join(f"{name}{delta:+d}" for name, delta in changes.items()) if k else "（初始状态）"
+        lines.append(f"  [{k:3d}] {step.describe():<24} {shown}")
+    return "\n".join(lines)
+
+# ============== 主程序 ==============
+
+def main(games: int = 2000, seed: int = 2026, path: str = "trace_v58.bin.gz"):
+    print("《功德轮回》v5.8 对局轨迹记录与回放")
+    print("=" * 50)
+    config = v58.GameConfig()
+    indices = find_games(config, seed, games, monk_first_few_saves)
+    print(f"\n{games} 局中僧侣渡化 ≤1 次却得第 1 的对局: {len(indices)} 局")
+    results = record_games(config, seed, indices, path)
+    size = os.path.getsize(path)
+    traces = list(read_trace(path))
+    print(f"已记录 {path}：{len(traces)} 局，{size} 字节（压缩后每局 {size / max(1, len(traces)):.0f} 字节）")
+
+    mismatched = 0
+    for trace, result in zip(traces, results):
+        end = trace.state()
+        players = [(p.merit, p.hui, p.wealth, p.save_count) for p in end.players]
+        expected = [(p["merit"], p["hui"], p["wealth"], p["save_count"]) for p in result["players"]]
+        mismatched += (players != expected or end.calamity != result["final_calamity"]
+                       or trace.team_win != result["team_win"])
+    print(f"回放终局与引擎结果一致: {len(traces) - mismatched}/{len(traces)}")
+
+    if traces:
+        trace = traces[0]
+        print("\n【首局回放】")
+        print(format_game(trace))
+        monk = trace.state().players[v58.MONK]
+        print(f"\n  终局僧侣: 功德 {monk.merit}，慧 {monk.hui}，资粮 {monk.wealth}，"
+              f"渡化 {monk.save_count}，护法 {monk.protect_count}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+"""
+《功德轮回》逐次减半 / Hyperband 配置搜索调度
+扫描或搜索中的大多数候选配置在几百局后就明显不合格（胜率 30% 或 98%），
+没必要每个都跑满预算。逐次减半：全部候选先跑 min_games 局，按目标排序保留最好的 1/eta，
+幸存者局数乘以 eta 继续跑，直到 max_games。
+追加的局号区间 [已跑局数, 新预算) 与已有部分聚合 merge，前面的对局不浪费；
+全部候选共用同一根种子（公共随机数），同一档局数下的比较只差在参数上。
+Hyperband 在多个起始预算（括号）上各跑一轮逐次减半，兼顾“多候选少局数”与“少候选多局数”。
+
+目标函数：展开指标行 → 数值，越小越好（与 optimize_dice_config.calculate_balance_score 同向）。
+"""
+
+import math
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from simulator_v58_FINAL import GameConfig
+from compare_v58 import flatten_stats
+from result_cache import ResultCache
+from sweep import Param, SweepTarget, apply_point, latin_hypercube, simulate_points, v58_target
+
+Objective = Callable[[Dict[str, float]], float]
+
+# ============== 目标 ==============
+
+def balance_score(target_share: float = 0.25) -> Objective:
+    """平衡分：各职业在胜局中得第1名的占比与目标之差的绝对值之和（百分点），0 为完全平衡
+
+    口径同 optimize_dice_config.calculate_balance_score（各路线胜率与 100/人数 的偏差之和）。
+    """
+    def score(row: Dict[str, float]) -> float:
+        win_rate = row["team_win_rate"]
+        total = 0.0
+        for key, value in row.items():
+            if key.startswith("by_role/") and key.endswith("/first_rate"):
+                share = value / win_rate if win_rate > 0 else 0.0
+                total += abs(share - target_share) * 100
+        return total
+    return score
+
+def win_rate_score(target: float = 0.75) -> Objective:
+    """团队胜率与目标之差的绝对值（百分点）"""
+    def score(row: Dict[str, float]) -> float:
+        return abs(row["team_win_rate"] - target) * 100
+    return score
+
+def combined(*objectives: Objective, weights: Optional[Sequence[float]] = None) -> Objective:
+    """多个目标的加权和"""
+    weights = list(weights) if weights is not None else [1.0] * len(objectives)
+
+    def score(row: Dict[str, float]) -> float:
+        return sum(w * f(row) for w, f in zip(weights, objectives))
+    return score
+
+# ============== 逐次减半 ==============
+
+@dataclass
+class Candidate:
+    """一个候选配置及其已累计的部分聚合"""
+    point: Dict[str, Any]
+    config: Any
+    acc: Any = None
+    games: int = 0
+    score: float = math.inf
+    row: Optional[Dict[str, float]] = None
+
+class SuccessiveHalving:
+    """逐次减半调度器：预算 min_games → ×eta → … → max_games，每档保留最好的 1/eta"""
+
+    def __init__(self, target: SweepTarget, objective: Objective, min_games: int = 200,
+                 max_games: int = 6400, eta: int = 2, seed: int = 2026,
+                 workers: Optional[int] = None, shard_size: int = 1000,
+                 cache: Optional[ResultCache] = None):
+        self.target = target
+        self.objective = objective
+        self.min_games = min_games
+        self.max_games = max_games
+        self.eta = eta
+        self.seed = seed
+        self.workers = workers
+        self.shard_size = shard_size
+        self.cache = cache
+        self.games_simulated = 0
+        self.history: List[Dict[str, Any]] = []
+
+    def extend(self, candidates: List[Candidate], games: int):
+        """把候选补跑到 games 局（只模拟新增局号区间，与已有聚合合并）并重新打分"""
+        by_start: Dict[int, List[Candidate]] = {}
+        for c in candidates:
+            if c.games < games:
+                by_start.setdefault(c.games, []).append(c)
+        for start, group in by_start.items():
+            accs = simulate_points(self.target, [c.config for c in group], [self.seed] * len(group),
+                                   start, games, workers=self.workers, shard_size=self.shard_size,
+                                   cache=self.cache)
+            for c, acc in zip(group, accs):
+                if c.acc is None:
+                    c.acc = acc
+                else:
+                    c.acc.merge(acc)
+                self.games_simulated += games - c.games
+                c.games = games
+                c.row = flatten_stats(c.acc.finalize())
+                c.score = self.objective(c.row)
+
+    def run(self, points: List[Dict[str, Any]], progress: bool = True) -> List[Candidate]:
+        """对全部点跑逐次减半，返回全部候选：按达到的局数降序、同局数按得分升序"""
+        candidates = [Candidate(point, apply_point(self.target.base, point)) for point in points]
+        active = list(candidates)
+        budget = min(self.min_games, self.max_games)
+        while True:
+            self.extend(active, budget)
+            active.sort(key=lambda c: c.score)
+            self.history.append({"games": budget, "candidates": len(active), "best": active[0].score})
+            if progress:
+                print(f"  {budget:>6} 局 × {len(active):>3} 个候选：最优 {active[0].score:.2f}")
+            if budget >= self.max_games or len(active) == 1:
+                break
+            active = active[:max(1, len(active) // self.eta)]
+            budget = min(budget * self.eta, self.max_games)
+        # 单个幸存者提前胜出时也补跑到满预算，使最终得分与完整评估同精度
+        self.extend(active[:1], self.max_games)
+        return sorted(candidates, key=lambda c: (-c.games, c.score))
+
+    def full_cost(self, n: int) -> int:
+        """不做淘汰时 n 个候选全部跑满的局数"""
+        return n * self.max_games
+
+def hyperband(target: SweepTarget, params: List[Param], objective: Objective,
+              min_games: int = 200, max_games: int = 6400, eta: int = 2, seed: int = 2026,
+              sample_seed: int = 0, workers: Optional[int] = None,
+              cache: Optional[ResultCache] = None, progress: bool = True) -> Dict[str, Any]:
+    """Hyperband：括号 s 从多候选少局数到少候选多局数，每个括号在新的拉丁超立方样本上逐次减半
+
+    返回 {"best": 满预算候选中得分最低者, "brackets": 各括号结果, "games": 实际模拟局数}
+    """
+    s_max = int(math.floor(math.log(max_games / min_games, eta) + 1e-9))
+    brackets, simulated, best = [], 0, None
+    for s in range(s_max, -1, -1):
+        n = int(math.ceil((s_max + 1) / (s + 1) * eta ** s))
+        start_games = max(1, int(max_games / eta ** s))
+        if progress:
+            print(f"括号 s={s}: {n} 个候选，起始 {start_games} 局")
+        scheduler = SuccessiveHalving(target, objective, start_games, max_games, eta, seed,
+                                      workers=workers, cache=cache)
+        ranked = scheduler.run(latin_hypercube(params, n, seed=sample_seed + s), progress=progress)
+        simulated += scheduler.games_simulated
+        brackets.append({"s": s, "candidates": n, "ranked": ranked, "history": scheduler.history})
+        if best is None or ranked[0].score < best.score:
+            best = ranked[0]
+    return {"best": best, "brackets": brackets, "games": simulated}
+
+# ============== 主程序 ==============
+
+HALVING_PARAMS = [
+    Param("disaster_base_calamity_adj", 4, 8),
+    Param("misfortune_base_calamity_adj", 3, 7),
+    Param("protect_merit", 2, 5),
+    Param("monk_protect_cost", values=[1, 2, 3]),
+    Param("donate_merchant_bonus", 0, 3),
+    Param("labor_base", 2, 4),
+]
+
+def main(candidates: int = 32, min_games: int = 200, max_games: int = 3200):
+    print("《功德轮回》v5.8 逐次减半配置搜索")
+    print("=" * 50)
+    objective = combined(win_rate_score(0.75), balance_score())
+    scheduler = SuccessiveHalving(v58_target(GameConfig()), objective, min_games, max_games,
+                                  cache=ResultCache())
+    start = time.perf_counter()
+    ranked = scheduler.run(latin_hypercube(HALVING_PARAMS, candidates, seed=1))
+    elapsed = time.perf_counter() - start
+    print(f"\n模拟 {scheduler.games_simulated} 局（全部跑满需 {scheduler.full_cost(candidates)} 局），"
+          f"耗时 {elapsed:.1f}s；{scheduler.cache.summary()}")
+    print("\n前 5 名（得分 = 团队胜率偏差 + 平衡分，百分点）:")
+    for c in ranked[:5]:
+        values = " ".join(f"{k}={getattr(c.config, k)}" for k in c.point)
+        print(f"  {c.score:6.2f} | 胜率 {c.row['team_win_rate']*100:5.1f}% | {c.games} 局 | {values}")
+
+if __name__ == "__main__":
+    main()
@@ -10,9 +10,11 @@
 
 import random
 from dataclasses import dataclass, field
-from typing import List, Dict, Tuple
+from typing import List, Dict, Tuple, Optional
 from collections import defaultdict
 
+from sampling import derive_seed, engine_rng, ci_status
+
 # ============== 配置 ==============
 
 @dataclass
@@ -75,8 +77,9 @@ class Player:
 # ============== 游戏模拟 ==============
 
 class KarmaTestEngine:
-    def __init__(self, config: TestConfig):
+    def __init__(self, config: TestConfig, rng: Optional[random.Random] = None):
         self.config = config
+        self.rng = engine_rng(rng)
     
     def get_karma_multiplier(self, calamity: int) -> float:
         """获取共业倍率"""
@@ -88,15 +91,16 @@ class KarmaTestEngine:
     def player_choose_sacrifice(self, player: Player, calamity: int) -> bool:
         """玩家选择是否牺牲（选A）"""
         if player.player_type == PlayerType.ALTRUIST:
-            return random.random() < 0.8  # 80%选A
+            return self.rng.random() < 0.8  # 80%选A
         elif player.player_type == PlayerType.SELFISH:
-            return random.random() < 0.2  # 20%选A（80%选B）
+            return self.rng.random() < 0.2  # 20%选A（80%选B）
         else:
-            return random.random() < 0.5  # 50%选A
+            return self.rng.random() < 0.5  # 50%选A
     
     def run_game(self, player_types: List[str]) -> Dict:
         """运行一局游戏"""
         config = self.config
+        rng = self.rng
         
         # 初始化玩家
         players = []
@@ -147,19 +151,19 @@ class KarmaTestEngine:
                     if p.wealth < 2:
                         # 资源不足，劳作
                         p.wealth += config.labor_gain
-                    elif random.random() < 0.3:
+                    elif rng.random() < 0.3:
                         # 30%布施
                         p.wealth -= config.donate_cost
                         p.merit += config.donate_merit
                         calamity -= config.donate_calamity
-                    elif random.random() < 0.3:
+                    elif rng.random() < 0.3:
                         # 30%护法
                         p.wealth -= config.protect_cost
                         p.merit += config.protect_merit
                         calamity -= config.protect_calamity
                     else:
                         # 40%修行或劳作
-                        if random.random() < 0.5:
+                        if rng.random() < 0.5:
                             p.hui += config.practice_gain
                         else:
                             p.wealth += config.labor_gain
@@ -197,54 +201,112 @@ class KarmaTestEngine:
         
         return result
 
-# ============== 测试场景 ==============
+# ============== 统计归约 ==============
 
-def run_scenario(name: str, player_types: List[str], num_games: int = 5000):
-    """运行测试场景"""
-    config = TestConfig()
-    engine = KarmaTestEngine(config)
-    
-    # 统计
-    stats = {
-        "wins": 0,
-        "by_type": defaultdict(lambda: {
-            "count": 0,
-            "total_base": 0,
-            "total_final": 0,
-            "rank_1": 0,
-            "rank_4": 0,
-            "sacrifice": 0,
-            "selfish": 0,
-        })
+def _new_type_stats() -> Dict:
+    return {
+        "count": 0,
+        "total_base": 0,
+        "total_final": 0,
+        "rank_1": 0,
+        "rank_4": 0,
+        "sacrifice": 0,
+        "selfish": 0,
     }
+
+class KarmaAccumulator:
+    """场景统计归约：update(局结果) 逐局累加，merge() 合并分片，finalize() 得到 run_scenario 的统计
+
+    只保存计数与求和，不同进程、不同日期的同场景分片可精确合并，无需重新模拟。
+    """
     
-    for _ in range(num_games):
-        result = engine.run_game(player_types)
-        
+    def __init__(self):
+        self.games = 0
+        self.wins = 0
+        self.by_type = defaultdict(_new_type_stats)
+    
+    def update(self, result: Dict):
+        """累加一局结果（按最终分排名）"""
+        self.games += 1
         if result["team_win"]:
-            stats["wins"] += 1
+            self.wins += 1
         
-        # 按最终分排名
         players = result["players"]
         players_sorted = sorted(players, key=lambda x: -x["final_score"])
-        
         for rank, p in enumerate(players_sorted):
-            ptype = p["type"]
-            stats["by_type"][ptype]["count"] += 1
-            stats["by_type"][ptype]["total_base"] += p["base_score"]
-            stats["by_type"][ptype]["total_final"] += p["final_score"]
-            stats["by_type"][ptype]["sacrifice"] += p["sacrifice_count"]
-            stats["by_type"][ptype]["selfish"] += p["selfish_count"]
-            
+            s = self.by_type[p["type"]]
+            s["count"] += 1
+            s["total_base"] += p["base_score"]
+            s["total_final"] += p["final_score"]
+            s["sacrifice"] += p["sacrifice_count"]
+            s["selfish"] += p["selfish_count"]
             if rank == 0:
-                stats["by_type"][ptype]["rank_1"] += 1
+                s["rank_1"] += 1
             if rank == len(players) - 1:
-                stats["by_type"][ptype]["rank_4"] += 1
+                s["rank_4"] += 1
+    
+    def merge(self, other: "KarmaAccumulator") -> "KarmaAccumulator":
+        """合并另一个分片的部分聚合"""
+        self.games += other.games
+        self.wins += other.wins
+        for ptype, data in other.by_type.items():
+            target = self.by_type[ptype]
+            for k, v in data.items():
+                target[k] += v
+        return self
+    
+    def proportions(self) -> Dict[str, Tuple[int, int]]:
+        """序贯抽样关心的比例指标：名称 → (成功数, 样本数)"""
+        counts = {"team_win_rate": (self.wins, self.games)}
+        for ptype, s in self.by_type.items():
+            counts[f"rank1_rate/{ptype}"] = (s["rank_1"], s["count"])
+        return counts
+    
+    def finalize(self) -> Dict:
+        """汇总统计：胜局数与各类型的计数、求和"""
+        return {
+            "games": self.games,
+            "wins": self.wins,
+            "by_type": {ptype: dict(data) for ptype, data in self.by_type.items()},
+        }
+
+# ============== 测试场景 ==============
+
+def run_scenario(name: str, player_types: List[str], num_games: int = 5000, seed: Optional[int] = None,
+                 ci_targets: Optional[Dict[str, float]] = None, batch_size: int = 500):
+    """运行测试场景（每局使用 derive_seed(seed, 局号) 的独立随机流）
+
+    给出 ci_targets（如 {"team_win_rate": 0.01, "rank1_rate": 0.02}）时改为序贯抽样：
+    每 batch_size 局检查一次置信区间半宽，全部达标即停止，num_games 作为预算上限。
+    """
+    config = TestConfig()
+    engine = KarmaTestEngine(config)
+    if seed is None:
+        seed = random.randrange(1 << 63)
+    
+    acc = KarmaAccumulator()
+    game_index = 0
+    while game_index < num_games:
+        engine.rng.seed(derive_seed(seed, game_index))
+        acc.update(engine.run_game(player_types))
+        game_index += 1
+        
+        if (ci_targets and game_index % batch_size == 0
+                and ci_status(acc.proportions(), ci_targets, game_index, num_games)["done"]):
+            break
+    
+    budget, num_games = num_games, game_index
+    stats = acc.finalize()
+    if ci_targets:
+        status = ci_status(acc.proportions(), ci_targets, num_games, budget)
+        stats["ci_met"] = status["met"]
+        stats["intervals"] = status["intervals"]
     
     # 输出结果
     print(f"\n{'='*60}")
     print(f"场景：{name}")
-    print(f"模拟局数：{num_games}")
+    print(f"模拟局数：{num_games}" + (f"（预算 {budget}）" if ci_targets else ""))
+    print(f"随机种子：{seed}")
     print(f"团队胜率：{stats['wins']/num_games*100:.1f}%")
     print(f"{'='*60}")
     print(f"{'类型':<20} | {'平均基础分':>10} | {'平均最终分':>10} | {'第1名率':>8} | {'选A次数':>8}")
@@ -261,8 +323,19 @@ def run_scenario(name: str, player_types: List[str], num_games: int = 5000):
                 avg_sacrifice = s["sacrifice"] / cnt
                 print(f"{ptype:<20} | {avg_base:>10.1f} | {avg_final:>10.1f} | {rank1_rate:>7.1f}% | {avg_sacrifice:>8.1f}")
     
+    if ci_targets:
+        print(f"\n95%置信区间（目标{'全部达成' if stats['ci_met'] else '未全部达成'}）:")
+        for metric, item in stats["intervals"].items():
+            note = "" if item["met"] else ("  未达成" if item["reachable"] else "  预算内不可达")
+            print(f"  {metric:<28} {item['rate']*100:5.1f}% [{item['low']*100:5.1f}%, {item['high']*100:5.1f}%] "
+                  f"半宽 {item['half_width']*100:.1f}% / 目标 {item['target']*100:.1f}%{note}")
+    
     return stats
 
+# 序贯抽样：胜率与第1名率的95%置信区间半宽目标，局数预算上限
+CI_TARGETS = {"team_win_rate": 0.015, "rank1_rate": 0.02}
+NUM_GAMES_BUDGET = 20000
+
 def main():
     print("="*60)
     print("《功德轮回》共业倍率机制测试")
@@ -276,7 +349,7 @@ def main():
     run_scenario(
         "1好人 vs 3坏人",
         [PlayerType.ALTRUIST, PlayerType.SELFISH, PlayerType.SELFISH, PlayerType.SELFISH],
-        5000
+        NUM_GAMES_BUDGET, ci_targets=CI_TARGETS
     )
     
     # 场景2：1个坏人 vs 3个好人
@@ -286,7 +359,7 @@ def main():
     run_scenario(
         "1坏人 vs 3好人",
         [PlayerType.SELFISH, PlayerType.ALTRUIST, PlayerType.ALTRUIST, PlayerType.ALTRUIST],
-        5000
+        NUM_GAMES_BUDGET, ci_targets=CI_TARGETS
     )
     
     # 场景3：2好人 vs 2坏人
@@ -296,7 +369,7 @@ def main():
     run_scenario(
         "2好人 vs 2坏人",
         [PlayerType.ALTRUIST, PlayerType.ALTRUIST, PlayerType.SELFISH, PlayerType.SELFISH],
-        5000
+        NUM_GAMES_BUDGET, ci_targets=CI_TARGETS
     )
     
     # 场景4：全是好人
@@ -306,7 +379,7 @@ def main():
     run_scenario(
         "4好人",
         [PlayerType.ALTRUIST, PlayerType.ALTRUIST, PlayerType.ALTRUIST, PlayerType.ALTRUIST],
-        5000
+        NUM_GAMES_BUDGET, ci_targets=CI_TARGETS
     )
     
     # 场景5：全是坏人
@@ -316,7 +389,7 @@ def main():
     run_scenario(
         "4坏人",
         [PlayerType.SELFISH, PlayerType.SELFISH, PlayerType.SELFISH, PlayerType.SELFISH],
-        5000
+        NUM_GAMES_BUDGET, ci_targets=CI_TARGETS
     )
     
     # 总结
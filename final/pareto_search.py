@@ -0,0 +1,287 @@
+# -*- coding: utf-8 -*-
+"""
+《功德轮回》v5.8 多目标 Pareto 搜索（NSGA-II）
+平衡目标同时包含：基础版团队胜率~75%、人间炼狱版46-50%、各职业第1名占比接近25%、
+每人护法次数合理。这里对 GameConfig 的一组字段做 NSGA-II 进化搜索，
+种群用参数扫描的进程池并行评估（全部候选共用同一根种子，即公共随机数；重复候选命中结果缓存），
+每代结束写检查点，中断后可续跑，最终输出可供挑选的 Pareto 前沿。
+"""
+
+import json
+import os
+import random
+import time
+from dataclasses import replace
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from simulator_v58_FINAL import GameConfig
+from result_cache import ResultCache
+from sweep import Param, apply_point, run_sweep, v58_target, write_csv
+
+# ============== 目标 ==============
+
+BASE_WIN_TARGET = 0.75
+HELL_WIN_BAND = (0.46, 0.50)
+FIRST_SHARE_TARGET = 0.25       # 胜局中各职业得第1名的占比
+PROTECT_BAND = (0.5, 2.0)       # 每人每局护法次数
+
+OBJECTIVE_NAMES = ("基础胜率偏差", "炼狱胜率偏差", "职业第1名偏差", "护法次数偏差")
+
+def _band_distance(x: float, band: Tuple[float, float]) -> float:
+    low, high = band
+    return max(low - x, 0.0, x - high)
+
+def objectives(base: Dict[str, float], hell: Dict[str, float]) -> Tuple[float, ...]:
+    """由两种模式的展开指标计算目标向量（全部越小越好）"""
+    parity = 0.0
+    protect = 0.0
+    for row in (base, hell):
+        win_rate = row["team_win_rate"]
+        for key, value in row.items():
+            if key.startswith("by_role/") and key.endswith("/first_rate") and win_rate > 0:
+                parity = max(parity, abs(value / win_rate - FIRST_SHARE_TARGET))
+        protect = max(protect, _band_distance(row["action_stats/avg_protect"], PROTECT_BAND))
+    return (
+        abs(base["team_win_rate"] - BASE_WIN_TARGET),
+        _band_distance(hell["team_win_rate"], HELL_WIN_BAND),
+        parity,
+        protect,
+    )
+
+# ============== NSGA-II ==============
+
+def dominates(a: Sequence[float], b: Sequence[float]) -> bool:
+    return all(x <= y for x, y in zip(a, b)) and any(x < y for x, y in zip(a, b))
+
+def non_dominated_sort(scores: List[Tuple[float, ...]]) -> List[List[int]]:
+    """快速非支配排序：返回各层前沿的下标列表（第0层即 Pareto 前沿）"""
+    n = len(scores)
+    dominated_by = [[] for _ in range(n)]
+    counts = [0] * n
+    for i in range(n):
+        for j in range(i + 1, n):
+            if dominates(scores[i], scores[j]):
+                dominated_by[i].append(j)
+                counts[j] += 1
+            elif dominates(scores[j], scores[i]):
+                dominated_by[j].append(i)
+                counts[i] += 1
+    fronts = [[i for i in range(n) if counts[i] == 0]]
+    while fronts[-1]:
+        nxt = []
+        for i in fronts[-1]:
+            for j in dominated_by[i]:
+                counts[j] -= 1
+                if counts[j] == 0:
+                    nxt.append(j)
+        fronts.append(nxt)
+    return fronts[:-1]
+
+def crowding_distance(front: List[int], scores: List[Tuple[float, ...]]) -> Dict[int, float]:
+    distance = {i: 0.0 for i in front}
+    for m in range(len(scores[front[0]])):
+        ordered = sorted(front, key=lambda i: scores[i][m])
+        lo, hi = scores[ordered[0]][m], scores[ordered[-1]][m]
+        distance[ordered[0]] = distance[ordered[-1]] = float("inf")
+        if hi == lo:
+            continue
+        for k in range(1, len(ordered) - 1):
+            distance[ordered[k]] += (scores[ordered[k + 1]][m] - scores[ordered[k - 1]][m]) / (hi - lo)
+    return distance
+
+def rank_population(scores: List[Tuple[float, ...]]) -> Tuple[Dict[int, int], Dict[int, float]]:
+    """每个个体的 (前沿层号, 拥挤距离)"""
+    rank, crowd = {}, {}
+    for level, front in enumerate(non_dominated_sort(scores)):
+        crowd.update(crowding_distance(front, scores))
+        for i in front:
+            rank[i] = level
+    return rank, crowd
+
+def sbx_crossover(a: List[float], b: List[float], rng: random.Random, eta: float = 15.0):
+    """模拟二进制交叉（基因在 [0, 1] 内）"""
+    child1, child2 = list(a), list(b)
+    for k in range(len(a)):
+        if rng.random() < 0.5:
+            u = rng.random()
+            beta = (2 * u) ** (1 / (eta + 1)) if u <= 0.5 else (1 / (2 * (1 - u))) ** (1 / (eta + 1))
+            child1[k] = min(1.0, max(0.0, 0.5 * ((1 + beta) * a[k] + (1 - beta) * b[k])))
+            child2[k] = min(1.0, max(0.0, 0.5 * ((1 - beta) * a[k] + (1 + beta) * b[k])))
+    return child1, child2
+
+def polynomial_mutation(genes: List[float], rng: random.Random, rate: float, eta: float = 20.0) -> List[float]:
+    out = list(genes)
+    for k in range(len(out)):
+        if rng.random() < rate:
+            u = rng.random()
+            delta = (2 * u) ** (1 / (eta + 1)) - 1 if u < 0.5 else 1 - (2 * (1 - u)) ** (1 / (eta + 1))
+            out[k] = min(1.0, max(0.0, out[k] + delta))
+    return out
+
+# ============== 搜索 ==============
+
+class ParetoSearch:
+    """NSGA-II 搜索：基因为 [0,1]^d，经 Param.at 映射到字段取值（整数字段取整）"""
+
+    def __init__(self, params: List[Param], population: int = 24, games: int = 2000,
+                 seed: int = 2026, base: Optional[GameConfig] = None, workers: Optional[int] = None,
+                 checkpoint: Optional[str] = None, cache: Optional[ResultCache] = None):
+        self.params = params
+        self.population = population
+        self.games = games
+        self.seed = seed  # 评估用根种子：所有候选、所有代共用（公共随机数）
+        self.base = base or GameConfig()
+        self.workers = workers
+        self.checkpoint = checkpoint
+        self.cache = cache
+        self.rng = random.Random(seed)
+        self.generation = 0
+        self.genes: List[List[float]] = []
+        self.scores: List[Tuple[float, ...]] = []
+        self.metrics: List[Tuple[Dict, Dict]] = []
+
+    def point(self, genes: List[float]) -> Dict:
+        """基因 → 字段取值（按基准配置字段类型取整后的实际值）"""
+        config = apply_point(self.base, {p.name: p.at(g) for p, g in zip(self.params, genes)})
+        return {p.name: getattr(config, p.name) for p in self.params}
+
+    def evaluate(self, genes: List[List[float]]):
+        """并行评估一批个体的基础版与人间炼狱版，返回 (目标向量, (基础指标, 炼狱指标))"""
+        points = [self.point(g) for g in genes]
+        kwargs = dict(games=self.games, seed=self.seed, workers=self.workers, cache=self.cache, progress=False)
+        base_rows = run_sweep(v58_target(self.base), points, **kwargs)
+        hell_rows = run_sweep(v58_target(replace(self.base, hell_mode=True)), points, **kwargs)
+        return ([objectives(b, h) for b, h in zip(base_rows, hell_rows)],
+                list(zip(base_rows, hell_rows)))
+
+    def _tournament(self, rank, crowd) -> int:
+        i, j = self.rng.randrange(len(self.genes)), self.rng.randrange(len(self.genes))
+        if rank[i] != rank[j]:
+            return i if rank[i] < rank[j] else j
+        return i if crowd[i] >= crowd[j] else j
+
+    def step(self):
+        """一代：锦标赛选择 + SBX 交叉 + 多项式变异，父子合并后按 (前沿层, 拥挤距离) 截断"""
+        if not self.genes:
+            self.genes = [[self.rng.random() for _ in self.params] for _ in range(self.population)]
+            self.scores, self.metrics = self.evaluate(self.genes)
+            self.generation = 1
+            return
+        rank, crowd = rank_population(self.scores)
+        children = []
+        while len(children) < self.population:
+            a = self.genes[self._tournament(rank, crowd)]
+            b = self.genes[self._tournament(rank, crowd)]
+            for child in sbx_crossover(a, b, self.rng):
+                children.append(polynomial_mutation(child, self.rng, 1.0 / len(self.params)))
+        children = children[:self.population]
+        child_scores, child_metrics = self.evaluate(children)
+
+        genes = self.genes + children
+        scores = self.scores + child_scores
+        metrics = self.metrics + child_metrics
+        rank, crowd = rank_population(scores)
+        keep = sorted(range(len(genes)), key=lambda i: (rank[i], -crowd[i]))[:self.population]
+        self.genes = [genes[i] for i in keep]
+        self.scores = [scores[i] for i in keep]
+        self.metrics = [metrics[i] for i in keep]
+        self.generation += 1
+
+    def front(self) -> List[Dict]:
+        """当前种群的 Pareto 前沿（按字段取值去重）"""
+        seen = set()
+        rows = []
+        for i in non_dominated_sort(self.scores)[0]:
+            point = self.point(self.genes[i])
+            key = tuple(point.values())
+            if key in seen:
+                continue
+            seen.add(key)
+            base, hell = self.metrics[i]
+            row = dict(point)
+            row.update(zip(OBJECTIVE_NAMES, self.scores[i]))
+            row["基础胜率"] = base["team_win_rate"]
+            row["炼狱胜率"] = hell["team_win_rate"]
+            rows.append(row)
+        return sorted(rows, key=lambda r: r[OBJECTIVE_NAMES[0]])
+
+    # ---------- 检查点 ----------
+
+    def save(self):
+        if not self.checkpoint:
+            return
+        state = {
+            "params": [p.name for p in self.params], "seed": self.seed, "games": self.games,
+            "generation": self.generation, "genes": self.genes, "scores": self.scores,
+            "metrics": self.metrics, "rng": _encode_state(self.rng.getstate()),
+        }
+        tmp = self.checkpoint + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False)
+        os.replace(tmp, self.checkpoint)
+
+    def load(self) -> bool:
+        """从检查点续跑；参数、种子或局数不一致时忽略检查点"""
+        if not self.checkpoint or not os.path.exists(self.checkpoint):
+            return False
+        with open(self.checkpoint, encoding="utf-8") as f:
+            state = json.load(f)
+        if (state["params"] != [p.name for p in self.params] or state["seed"] != self.seed
+                or state["games"] != self.games):
+            return False
+        self.generation = state["generation"]
+        self.genes = state["genes"]
+        self.scores = [tuple(s) for s in state["scores"]]
+        self.metrics = [tuple(m) for m in state["metrics"]]
+        self.rng.setstate(_decode_state(state["rng"]))
+        return True
+
+    def run(self, generations: int) -> List[Dict]:
+        """跑到第 generations 代（含已从检查点恢复的代数），每代写检查点"""
+        if self.load():
+            print(f"  从检查点恢复：第 {self.generation} 代")
+        while self.generation < generations:
+            start = time.perf_counter()
+            self.step()
+            self.save()
+            best = min(self.scores)
+            print(f"  第 {self.generation} 代: 前沿 {len(non_dominated_sort(self.scores)[0])} 个，"
+                  f"{time.perf_counter() - start:.1f}s，最优基础胜率偏差 {best[0]*100:.1f}%")
+        return self.front()
+
+def _encode_state(state):
+    version, internal, gauss = state
+    return [version, list(internal), gauss]
+
+def _decode_state(state):
+    version, internal, gauss = state
+    return (version, tuple(internal), gauss)
+
+# ============== 主程序 ==============
+
+SEARCH_PARAMS = [
+    Param("disaster_base_calamity_adj", 4, 8),
+    Param("misfortune_base_calamity_adj", 3, 7),
+    Param("hell_disaster_calamity", 7, 11),
+    Param("protect_merit", 2, 5),
+    Param("monk_protect_cost", values=[1, 2, 3]),
+    Param("donate_merchant_bonus", 0, 3),
+]
+
+def main(generations: int = 10, population: int = 24, games: int = 2000):
+    print("《功德轮回》v5.8 多目标 Pareto 搜索（NSGA-II）")
+    print("=" * 50)
+    cache = ResultCache()
+    search = ParetoSearch(SEARCH_PARAMS, population=population, games=games,
+                          checkpoint="pareto_checkpoint.json", cache=cache)
+    front = search.run(generations)
+    write_csv(front, "pareto_front_v58.csv")
+    print(f"\nPareto 前沿 {len(front)} 个配置（已写入 pareto_front_v58.csv）:")
+    for row in front:
+        values = " ".join(f"{p.name}={row[p.name]}" for p in SEARCH_PARAMS)
+        print(f"  基础 {row['基础胜率']*100:5.1f}% 炼狱 {row['炼狱胜率']*100:5.1f}% "
+              f"第1名偏差 {row['职业第1名偏差']*100:4.1f}% 护法偏差 {row['护法次数偏差']:.2f} | {values}")
+    print(cache.summary())
+
+if __name__ == "__main__":
+    main()
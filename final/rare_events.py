@@ -0,0 +1,422 @@
+# -*- coding: utf-8 -*-
+"""
+《功德轮回》v5.8 稀有事件估计（重要性抽样）
+地藏愿达成（终局劫难≤4 且主动承受≥2）、“前3回合劫难即达上限”这类指标只在百分之几甚至更少的对局中出现，
+朴素蒙特卡洛要极多局数才能给出窄的置信区间。
+
+TiltedEngine 把抽样换成提议分布并累计似然比 w = ∏ p(抽样)/q(抽样)：
+  集体事件：逐回合的 (天灾, 人祸, 功德) 概率与天灾时每人合作概率
+  玩家行动：经编译策略得到每次决策的精确动作分布 p(a|状态)，按 q ∝ p·exp(θ_回合,a) 指数倾斜
+众生与其余随机数不变。E_p[I] = E_q[w·I]，因此加权均值是无偏估计。
+提议由交叉熵法自适应求得：逐轮取得分最高的 ρ 分位精英对局，以其加权频率拟合新提议，
+直到精英门槛达到事件水平。最终提议与名义分布按 δ 混合（防御性重要性抽样），单次抽样的似然比不超过 1/δ。
+"""
+
+import math
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+from simulator_v58_FINAL import (
+    GameConfig, GameEngine, GameState, CompiledPolicy, ACTIONS, SECULAR, derive_seed, wilson_interval, CI_Z,
+)
+
+# ============== 提议分布 ==============
+
+@dataclass
+class EventTilt:
+    """逐回合的提议分布
+
+    events：(天灾, 人祸, 功德) 概率；coop：天灾时每人合作概率；
+    actions：各动作的倾斜指数 θ（全 0 即不倾斜）；defensive：行动提议中名义分布的混合比例 δ。
+    """
+    events: List[Tuple[float, float, float]]
+    coop: List[float]
+    actions: List[Tuple[float, ...]]
+    defensive: float = 0.0
+
+    @classmethod
+    def nominal(cls, config: GameConfig) -> "EventTilt":
+        """名义分布（与 GameEngine 同分布）"""
+        t = config.compile()
+        p = (t.disaster_weight, t.misfortune_cutoff - t.disaster_weight, 1.0 - t.misfortune_cutoff)
+        rounds = config.total_rounds
+        return cls([p] * rounds, [t.coop_rate] * rounds, [(0.0,) * len(ACTIONS)] * rounds)
+
+    def mix(self, nominal: "EventTilt", delta: float) -> "EventTilt":
+        """(1-δ)·self + δ·nominal（行动提议在决策时按 defensive 混合）"""
+        events = [tuple((1 - delta) * a + delta * b for a, b in zip(q, p))
+                  for q, p in zip(self.events, nominal.events)]
+        coop = [(1 - delta) * q + delta * p for q, p in zip(self.coop, nominal.coop)]
+        return EventTilt(events, coop, list(self.actions), delta)
+
+# ============== 倾斜引擎 ==============
+
+class TiltedEngine(GameEngine):
+    """按 EventTilt 抽集体事件与玩家行动并累计似然比的 GameEngine（使用编译策略）
+
+    结果附带 "weight"（似然比）与 "trace"：逐回合峰值劫难、事件与合作计数、
+    以及每次随机决策的 (回合, 名义动作分布, 动作, 选中下标)，供交叉熵更新。
+    """
+
+    def __init__(self, config: GameConfig, tilt: Optional[EventTilt] = None, **kwargs):
+        super().__init__(config, **kwargs)
+        self.nominal = EventTilt.nominal(config)
+        self.tilt = tilt or self.nominal
+        self.round_index = 0
+        self.policy = CompiledPolicy(config, self.tables)
+        self.choosers = (self._choose_action,) * len(self.choosers)
+
+    def _choose_action(self, player, state, actions_left, rng) -> int:
+        """取编译策略给出的名义动作分布，按 θ 倾斜后抽样"""
+        cumulative, actions = self.policy.distribution(player, state, actions_left)
+        if len(actions) == 1:
+            return actions[0]
+        p, previous = [], 0.0
+        for c in cumulative:
+            c = min(c, 1.0)
+            p.append(c - previous)
+            previous = c
+
+        k = self.round_index
+        theta = self.tilt.actions[k]
+        tilted = [pi * math.exp(theta[a]) for pi, a in zip(p, actions)]
+        z = sum(tilted)
+        d = self.tilt.defensive
+        q = [(1 - d) * t / z + d * pi for t, pi in zip(tilted, p)]
+
+        u = rng.random()
+        index, running = len(q) - 1, 0.0
+        for i, qi in enumerate(q):
+            running += qi
+            if u < running:
+                index = i
+                break
+        self.log_weight += math.log(p[index] / q[index])
+        self.trace["decisions"].append((k, p, actions, index))
+        return actions[index]
+
+    def process_collective_event(self, state: GameState):
+        """同 GameEngine.process_collective_event，事件类型与合作按提议分布抽取"""
+        rng = self.event_rng
+        tables = self.tables
+        k = self.round_index = state.current_round - 1
+        p, q = self.nominal.events[k], self.tilt.events[k]
+        trace = self.trace
+
+        r = rng.random()
+        kind = 0 if r < q[0] else (1 if r < q[0] + q[1] else 2)
+        self.log_weight += math.log(p[kind] / q[kind])
+        trace["events"][k][kind] += 1
+
+        if kind == 0:
+            state.calamity += tables.disaster_base
+            pc, qc = self.nominal.coop[k], self.tilt.coop[k]
+            coop = 0
+            for _ in state.players:
+                if rng.random() < qc:
+                    coop += 1
+                    self.log_weight += math.log(pc / qc)
+                else:
+                    self.log_weight += math.log((1 - pc) / (1 - qc))
+            trace["coop"][k][0] += coop
+            trace["coop"][k][1] += len(state.players)
+            state.calamity -= coop
+        elif kind == 1:
+            state.calamity += tables.misfortune_base
+        else:
+            for pl in state.players:
+                pl.merit += 1
+                if pl.faith != SECULAR:
+                    pl.merit += 1
+
+        state.calamity = max(0, state.calamity)
+
+    def _record_peak(self, state: GameState):
+        peaks = self.trace["peaks"]
+        k = state.current_round - 1
+        peaks[k] = max(peaks[k], state.calamity)
+
+    def process_beings_phase(self, state: GameState):
+        super().process_beings_phase(state)
+        self._record_peak(state)
+
+    def process_round_end(self, state: GameState):
+        super().process_round_end(state)
+        self._record_peak(state)
+
+    def run_game(self) -> Dict:
+        rounds = self.config.total_rounds
+        self.log_weight = 0.0
+        self.round_index = 0
+        self.trace = {
+            "peaks": [0] * rounds,
+            "events": [[0, 0, 0] for _ in range(rounds)],
+            "coop": [[0, 0] for _ in range(rounds)],
+            "decisions": [],
+        }
+        result = super().run_game()
+        result["weight"] = math.exp(self.log_weight)
+        result["trace"] = self.trace
+        return result
+
+# ============== 稀有事件定义 ==============
+
+@dataclass
+class RareEvent:
+    """稀有事件：score(结果) ≥ level 即发生
+
+    count(结果) 给出 (发生数, 分母数)：分母恒为 1 时估计每局概率（无偏）；
+    否则估计比率 Σw·发生数 / Σ分母数（如选了某愿的玩家中达成的比例）。
+    分母须在第一次倾斜抽样之前就已确定（发愿在开局选定），其期望不受倾斜影响，故不加权。
+    horizon：事件只取决于前 horizon 回合时，之后的回合保持名义分布（倾斜只会徒增权重方差）。
+    """
+    name: str
+    config: GameConfig
+    score: Callable[[Dict], float]
+    level: float
+    count: Callable[[Dict], Tuple[int, int]]
+    ratio: bool = False
+    horizon: Optional[int] = None
+
+def collapse_event(config: GameConfig, by_round: int = 3) -> RareEvent:
+    """前 by_round 回合内劫难达到上限（立即失败）"""
+    def score(result):
+        return max(result["trace"]["peaks"][:by_round])
+
+    def count(result):
+        return int(score(result) >= config.max_calamity), 1
+
+    mode = "人间炼狱" if config.hell_mode else "基础版"
+    return RareEvent(f"{mode}：前{by_round}回合劫难≥{config.max_calamity}", config, score,
+                     config.max_calamity, count, horizon=by_round)
+
+def bvow_event(config: GameConfig, bvow: str = "地藏愿") -> RareEvent:
+    """地藏愿达成率（选了该愿的玩家中达成的比例）；交叉熵以终局劫难为得分（要求劫难≤阈值）"""
+    def chosen(result):
+        return [p for p in result["players"] if p["bodhisattva_vow"] == bvow]
+
+    def score(result):
+        return -result["final_calamity"] if chosen(result) else -math.inf
+
+    def count(result):
+        players = chosen(result)
+        return sum(p["bvow_achieved"] for p in players), len(players)
+
+    mode = "人间炼狱" if config.hell_mode else "基础版"
+    return RareEvent(f"{mode}：{bvow}达成率", config, score, -config.bvow_ksitigarbha_calamity, count,
+                     ratio=True)
+
+# ============== 估计 ==============
+
+class ISAccumulator:
+    """重要性抽样估计量的可合并累加器：f = w·发生数，g = 分母数"""
+
+    def __init__(self, ratio: bool = False):
+        self.ratio = ratio
+        self.n = 0
+        self.hits = 0
+        self.sf = self.sf2 = self.sg = self.sg2 = self.sfg = 0.0
+        self.sw = self.sw2 = 0.0
+
+    def update(self, weight: float, hits: int, total: int):
+        f, g = weight * hits, total
+        self.n += 1
+        self.hits += hits
+        self.sf += f
+        self.sf2 += f * f
+        self.sg += g
+        self.sg2 += g * g
+        self.sfg += f * g
+        self.sw += weight
+        self.sw2 += weight * weight
+
+    def merge(self, other: "ISAccumulator"):
+        for name in ("n", "hits", "sf", "sf2", "sg", "sg2", "sfg", "sw", "sw2"):
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+
+    def finalize(self, z: float = CI_Z) -> Dict:
+        """估计值、置信区间、有效样本量，及方差缩减倍数（= 朴素蒙特卡洛达到同样精度所需局数之比）"""
+        n = self.n
+        mf, mg = self.sf / n, self.sg / n
+        var_f = max(self.sf2 / n - mf * mf, 0.0)
+        if self.ratio:
+            # 比率估计：delta 方法
+            estimate = mf / mg if mg > 0 else 0.0
+            var_g = max(self.sg2 / n - mg * mg, 0.0)
+            cov = self.sfg / n - mf * mg
+            var = max(var_f - 2 * estimate * cov + estimate ** 2 * var_g, 0.0) / (mg * mg) if mg > 0 else 0.0
+            plain_var = estimate * (1 - estimate) / mg if mg > 0 else 0.0  # 每局约 mg 个伯努利样本
+        else:
+            estimate = mf
+            var = var_f
+            plain_var = estimate * (1 - estimate)
+        se = math.sqrt(var / n) if n > 1 else 0.0
+        return {
+            "estimate": estimate,
+            "ci": (max(0.0, estimate - z * se), estimate + z * se),
+            "se": se,
+            "games": n,
+            "hits": self.hits,
+            "ess": self.sw ** 2 / self.sw2 if self.sw2 > 0 else 0.0,
+            "variance_reduction": plain_var / var if var > 0 else math.inf,
+        }
+
+def _quantile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(math.ceil(q * len(ordered))) - 1))]
+
+def _fit_action_theta(decisions, theta: Tuple[float, ...], steps: int = 20,
+                      bound: float = 3.0) -> Tuple[float, ...]:
+    """加权最大似然拟合 q ∝ p·exp(θ)：θ_a ← θ_a + log(实际次数_a / 期望次数_a)（多项 logit 不动点）
+
+    decisions: [(权重, 名义分布, 动作, 选中下标)]；θ 限制在 [-bound, bound]。
+    """
+    theta = list(theta)
+    n = len(theta)
+    chosen = [0.0] * n
+    for w, p, actions, index in decisions:
+        chosen[actions[index]] += w
+    for _ in range(steps):
+        expected = [0.0] * n
+        for w, p, actions, _ in decisions:
+            tilted = [pi * math.exp(theta[a]) for pi, a in zip(p, actions)]
+            z = sum(tilted)
+            for t, a in zip(tilted, actions):
+                expected[a] += w * t / z
+        for a in range(n):
+            if expected[a] > 0:
+                step = math.log(chosen[a] / expected[a]) if chosen[a] > 0 else -bound
+                theta[a] = max(-bound, min(bound, theta[a] + step))
+    mean = sum(theta) / n
+    return tuple(t - mean for t in theta)
+
+def cross_entropy_tilt(event: RareEvent, games: int = 2000, rho: float = 0.1, iterations: int = 10,
+                       smoothing: float = 0.7, seed: int = 2026) -> Tuple[EventTilt, List[float]]:
+    """交叉熵法求提议分布，返回 (提议, 各轮精英门槛)
+
+    每轮用当前提议模拟 games 局，精英 = 得分 ≥ min(level, 1-ρ 分位)；
+    以 w·精英 加权的逐回合事件频率、合作率与行动倾斜指数作为新提议（与旧提议按 smoothing 平滑）。
+    精英中某回合无抽样（如对局已在更早回合结束）或超出 horizon 时保持原提议。
+    """
+    config = event.config
+    tilt = EventTilt.nominal(config)
+    levels = []
+    rounds = min(event.horizon or config.total_rounds, config.total_rounds)
+    for it in range(iterations):
+        engine = TiltedEngine(config, tilt)
+        results = []
+        for i in range(games):
+            engine.seed(derive_seed(seed, "ce", it, i))
+            results.append(engine.run_game())
+        scores = [event.score(r) for r in results]
+        gamma = min(event.level, _quantile(scores, 1 - rho))
+        levels.append(gamma)
+        elite = [r for r, s in zip(results, scores) if s >= gamma and s > -math.inf]
+        if not elite:
+            break
+
+        events = [[0.0, 0.0, 0.0] for _ in range(rounds)]
+        coop = [[0.0, 0.0] for _ in range(rounds)]
+        decisions = [[] for _ in range(rounds)]
+        for r in elite:
+            w = r["weight"]
+            trace = r["trace"]
+            for k in range(rounds):
+                for kind in range(3):
+                    events[k][kind] += w * trace["events"][k][kind]
+                coop[k][0] += w * trace["coop"][k][0]
+                coop[k][1] += w * trace["coop"][k][1]
+            for k, p, actions, index in trace["decisions"]:
+                if k < rounds:
+                    decisions[k].append((w, p, actions, index))
+
+        new_events, new_coop, new_actions = [], [], []
+        for k in range(rounds):
+            total = sum(events[k])
+            if total > 0:
+                new_events.append(tuple(smoothing * c / total + (1 - smoothing) * o
+                                        for c, o in zip(events[k], tilt.events[k])))
+            else:
+                new_events.append(tilt.events[k])
+            if coop[k][1] > 0:
+                new_coop.append(smoothing * coop[k][0] / coop[k][1] + (1 - smoothing) * tilt.coop[k])
+            else:
+                new_coop.append(tilt.coop[k])
+            if decisions[k]:
+                fitted = _fit_action_theta(decisions[k], tilt.actions[k])
+                new_actions.append(tuple(smoothing * a + (1 - smoothing) * o
+                                         for a, o in zip(fitted, tilt.actions[k])))
+            else:
+                new_actions.append(tilt.actions[k])
+        tilt = EventTilt(new_events + tilt.events[rounds:], new_coop + tilt.coop[rounds:],
+                         new_actions + tilt.actions[rounds:])
+        if gamma >= event.level:
+            break
+    return tilt, levels
+
+def estimate(event: RareEvent, games: int = 10000, tilt: Optional[EventTilt] = None,
+             delta: float = 0.3, seed: int = 2026) -> Dict:
+    """用提议分布估计事件概率 / 比率；tilt 为 None 时即朴素蒙特卡洛（Wilson 区间）"""
+    nominal = EventTilt.nominal(event.config)
+    engine = TiltedEngine(event.config, tilt.mix(nominal, delta) if tilt is not None else nominal)
+    acc = ISAccumulator(event.ratio)
+    for i in range(games):
+        engine.seed(derive_seed(seed, "is", i))
+        result = engine.run_game()
+        acc.update(result["weight"] if tilt is not None else 1.0, *event.count(result))
+    stats = acc.finalize()
+    if tilt is None and not event.ratio:
+        stats["ci"] = wilson_interval(acc.hits, games)
+    return stats
+
+def importance_sampling(event: RareEvent, games: int = 10000, pilot: int = 2000, rho: float = 0.1,
+                        delta: float = 0.3, seed: int = 2026) -> Dict:
+    """交叉熵求提议 + 重要性抽样估计；返回的 cost 含试探局数"""
+    tilt, levels = cross_entropy_tilt(event, pilot, rho, seed=seed)
+    stats = estimate(event, games, tilt, delta, seed)
+    stats.update({"tilt": tilt.mix(EventTilt.nominal(event.config), delta), "levels": levels,
+                  "cost": games + pilot * len(levels)})
+    return stats
+
+def format_estimate(name: str, stats: Dict) -> str:
+    lo, hi = stats["ci"]
+    line = (f"  {name:<6} {stats['estimate']*100:7.3f}%  [{lo*100:6.3f}%, {hi*100:6.3f}%]  "
+            f"{stats.get('cost', stats['games']):>6} 局  命中 {stats['hits']:>5}")
+    if "tilt" in stats:
+        line += f"  方差缩减 ×{stats['variance_reduction']:.1f}  ESS {stats['ess']:.0f}"
+    return line
+
+# ============== 主程序 ==============
+
+def main(games: int = 10000, pilot: int = 2000, seed: int = 2026):
+    print("《功德轮回》v5.8 稀有事件估计（交叉熵重要性抽样）")
+    print("=" * 50)
+    events = [
+        collapse_event(GameConfig(), by_round=3),
+        collapse_event(GameConfig(hell_mode=True), by_round=2),
+        bvow_event(GameConfig(hell_mode=True), "地藏愿"),
+    ]
+    for event in events:
+        print(f"\n{event.name}")
+        start = time.perf_counter()
+        tilted = importance_sampling(event, games, pilot, seed=seed)
+        t_is = time.perf_counter() - start
+        start = time.perf_counter()
+        plain = estimate(event, games, seed=seed + 1)
+        t_mc = time.perf_counter() - start
+        print(format_estimate("重要性", tilted) + f"  {t_is:.1f}s")
+        print(format_estimate("朴素", plain) + f"  {t_mc:.1f}s")
+        print(f"  交叉熵门槛: {' → '.join(f'{g:g}' for g in tilted['levels'])}")
+        horizon = event.horizon or event.config.total_rounds
+        for k in range(horizon):
+            q = tilted["tilt"].events[k]
+            theta = " ".join(f"{ACTIONS[a].value}{t:+.1f}" for a, t in enumerate(tilted["tilt"].actions[k]))
+            print(f"  第{k + 1}回合提议 天灾/人祸/功德 {q[0]:.2f}/{q[1]:.2f}/{q[2]:.2f} "
+                  f"合作 {tilted['tilt'].coop[k]:.2f} | 行动 θ: {theta}")
+        if 0 < tilted["estimate"] < 1:
+            needed = tilted["variance_reduction"] * games
+            print(f"  朴素蒙特卡洛达到同样精度约需 {needed:,.0f} 局（重要性抽样总成本 {tilted['cost']} 局）")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""
+《功德轮回》v5.8 终局状态重算分
+只调整计分参数（发愿/菩萨愿分数、共业倍率、基础分阶梯、商人/农夫终局加成、发愿达成条件、胜利条件）时
+不必重新模拟：保存每局的紧凑终局状态，换配置后向量化重算发愿、菩萨愿、个人得分与排名。
+
+依赖：numpy
+"""
+
+import io
+import time
+import contextlib
+from typing import Dict, List
+
+import numpy as np
+
+from simulator_v58_FINAL import (
+    GameConfig, GameEngine, BalanceAccumulator, BalanceAnalyzer, derive_seed, END_STATE_PLAYER_FIELDS,
+)
+from simulator_v58_batch import BatchGameEngine
+
+# ============== 终局状态存储 ==============
+
+# 终局状态字段 → 批量引擎状态数组的键名
+STATE_KEYS = tuple("bvow" if name == "bodhisattva_vow" else name for name in END_STATE_PLAYER_FIELDS)
+STORE_DTYPE = np.int16  # 资源与计数均为小整数
+
+class EndStateStore:
+    """紧凑终局状态：每局 (劫难, 团队渡化) 加 4 位玩家的整数字段"""
+
+    def __init__(self):
+        self._games: List[tuple] = []     # 参考引擎逐局追加
+        self._players: List[tuple] = []
+        self._chunks: List[Dict[str, np.ndarray]] = []  # 批量引擎整批追加
+
+    def __len__(self) -> int:
+        return len(self._games) + sum(len(c["calamity"]) for c in self._chunks)
+
+    def append(self, end_state: tuple):
+        """追加一局 GameEngine.end_state() 的结果"""
+        calamity, total_saves, players = end_state
+        self._games.append((calamity, total_saves))
+        self._players.append(players)
+
+    def extend(self, state: Dict[str, np.ndarray]):
+        """追加 BatchGameEngine.simulate() 返回的整批终局状态"""
+        chunk = {"calamity": state["calamity"].astype(STORE_DTYPE),
+                 "total_saves": state["total_saves"].astype(STORE_DTYPE)}
+        for key in STATE_KEYS:
+            chunk[key] = (state[key] if key in state else np.zeros_like(state["merit"])).astype(STORE_DTYPE)
+        self._chunks.append(chunk)
+
+    def arrays(self) -> Dict[str, np.ndarray]:
+        """合并为 {字段: 数组}；局级字段形状 (N,)，玩家字段形状 (N, 4)"""
+        chunks = list(self._chunks)
+        if self._games:
+            games = np.array(self._games, dtype=STORE_DTYPE)
+            players = np.array(self._players, dtype=STORE_DTYPE)  # (N, 4, 字段)
+            chunk = {"calamity": games[:, 0], "total_saves": games[:, 1]}
+            for i, key in enumerate(STATE_KEYS):
+                chunk[key] = players[:, :, i]
+            chunks.insert(0, chunk)
+        if not chunks:
+            raise ValueError("没有终局状态")
+        return {key: np.concatenate([c[key] for c in chunks]) for key in chunks[0]}
+
+    def save(self, path: str):
+        """保存为压缩 npz"""
+        np.savez_compressed(path, **self.arrays())
+
+    @classmethod
+    def load(cls, path: str) -> "EndStateStore":
+        store = cls()
+        with np.load(path) as data:
+            store._chunks.append({key: data[key] for key in data.files})
+        return store
+
+# ============== 采集与重算 ==============
+
+def collect_end_states(config: GameConfig, num_games: int, seed: int) -> EndStateStore:
+    """用参考引擎采集终局状态；第 i 局使用 derive_seed(seed, i)，与同种子的 BalanceAnalyzer 逐局一致"""
+    engine = GameEngine(config, record_end_state=True)
+    store = EndStateStore()
+    for game_index in range(num_games):
+        engine.rng.seed(derive_seed(seed, game_index))
+        store.append(engine.run_game()["end_state"])
+    return store
+
+def collect_batch_end_states(config: GameConfig, num_games: int, seed: int,
+                             batch_size: int = 20000) -> EndStateStore:
+    """用批量引擎采集终局状态（随机流与 BatchBalanceAnalyzer 一致）"""
+    store = EndStateStore()
+    done = 0
+    batch_index = 0
+    while done < num_games:
+        size = min(batch_size, num_games - done)
+        rng = np.random.default_rng(derive_seed(seed, "batch", batch_index))
+        store.extend(BatchGameEngine(config, rng).simulate(size))
+        done += size
+        batch_index += 1
+    return store
+
+def rescore(store: EndStateStore, config: GameConfig) -> BalanceAccumulator:
+    """按新的计分配置重算全部终局状态，返回可 finalize() 的聚合
+
+    只适用于不影响对局过程的参数；改动行动、事件或AI相关参数后须重新模拟。
+    """
+    state = {key: value.astype(np.int64) for key, value in store.arrays().items()}
+    return BatchGameEngine(config).accumulate(state)
+
+# ============== 主程序 ==============
+
+def main(num_games: int = 5000, seed: int = 2026):
+    print("《功德轮回》v5.8 终局状态重算分")
+    print("=" * 50)
+    config = GameConfig()
+
+    start = time.perf_counter()
+    store = collect_end_states(config, num_games, seed)
+    print(f"采集 {len(store)} 局终局状态: {time.perf_counter() - start:.2f}s")
+
+    # 同一配置下重算结果应与完整模拟一致
+    analyzer = BalanceAnalyzer(config, num_games, seed=seed, streaming=True)
+    with contextlib.redirect_stdout(io.StringIO()):
+        analyzer.run_simulations()
+    expected = analyzer.analyze()
+    actual = rescore(store, config).finalize()
+    same = all(
+        abs(expected["by_role"][role]["avg_score"] - actual["by_role"][role]["avg_score"]) < 1e-9
+        and expected["by_role"][role]["rank_1"] == actual["by_role"][role]["rank_1"]
+        for role in expected["by_role"]
+    ) and expected["team_wins"] == actual["team_wins"]
+    print(f"原配置重算与完整模拟一致: {'是' if same else '否'}")
+
+    # 调整计分参数后只需重算
+    tuned = GameConfig(karma_multiplier_levels=[(4, 1.3), (8, 1.1), (12, 1.0)])
+    tuned.vow_scores = dict(config.vow_scores, **{"贫女一灯": (20, -6)})
+    start = time.perf_counter()
+    stats = rescore(store, tuned).finalize()
+    print(f"调整计分后重算: {(time.perf_counter() - start) * 1000:.1f}ms")
+    for role, data in stats["by_role"].items():
+        print(f"  {role}: 平均得分 {expected['by_role'][role]['avg_score']:.1f} → {data['avg_score']:.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+"""
+模拟结果的本地磁盘缓存（按内容寻址）
+键 = 完整配置数据类 + 引擎版本 + 根种子 + 局号区间 的稳定哈希，值 = 可合并的部分聚合。
+重复生成报告、参数扫描回到已算过的点时直接命中，不再重复模拟。
+按最近使用时间（文件 mtime）淘汰，总大小不超过上限。
+
+值以 pickle 按“模块名.类名”保存，因此不缓存定义在 __main__ 中的类（换一个入口脚本就无法还原）；
+直接运行的模拟器脚本经 run_as_module() 按模块名导入自身再运行。读不出的条目一律视为未命中并删除。
+"""
+
+import dataclasses
+import hashlib
+import importlib
+import io
+import json
+import os
+import pickle
+import tempfile
+from enum import Enum
+from typing import Any, Optional, Sequence
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".sim_cache")
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+# 各引擎共用、影响模拟结果的模块（子种子派生、随机流），计入每个引擎的版本
+SHARED_SOURCES = (os.path.join(os.path.dirname(os.path.abspath(__file__)), "sampling.py"),)
+
+# ============== 指纹 ==============
+
+def _canonical(value: Any) -> Any:
+    """转为可稳定序列化的结构：数据类展开、字典按键排序、枚举取值"""
+    if dataclasses.is_dataclass(value) and not isinstance(value, type):
+        fields = {f.name: _canonical(getattr(value, f.name)) for f in dataclasses.fields(value)}
+        return [type(value).__name__, fields]
+    if isinstance(value, Enum):
+        return _canonical(value.value)
+    if isinstance(value, dict):
+        items = [[_canonical(k), _canonical(v)] for k, v in value.items()]
+        return sorted(items, key=lambda item: json.dumps(item[0], ensure_ascii=False))
+    if isinstance(value, (list, tuple)):
+        return [_canonical(v) for v in value]
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    return repr(value)
+
+def config_fingerprint(config: Any) -> str:
+    """配置的稳定哈希（字段顺序、字典插入顺序无关；任一字段改动即变化）"""
+    text = json.dumps(_canonical(config), ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def engine_version(path: str, label: str = "", dependencies: Sequence[str] = ()) -> str:
+    """引擎版本：模块文件名 + 源码哈希
+
+    哈希覆盖引擎本身、SHARED_SOURCES 与 dependencies（引擎另行导入、影响结果的模块），
+    改动其中任一源码后旧缓存自动失效。
+    """
+    digest = hashlib.sha256()
+    for source in (path, *SHARED_SOURCES, *dependencies):
+        with open(source, "rb") as f:
+            digest.update(hashlib.sha256(f.read()).digest())
+    return f"{label or os.path.basename(path)}:{digest.hexdigest()[:16]}"
+
+def run_as_module(path: str):
+    """以模块名导入脚本 path 并运行其 main()，供直接运行的模拟器脚本在 __main__ 块中调用
+
+    这样写入缓存的部分聚合是 <模块名>.<类名> 的实例而不是 __main__.*，从其他模块导入时同样能读取。
+    脚本所在目录在直接运行时已位于 sys.path 首位。
+    """
+    module = importlib.import_module(os.path.splitext(os.path.basename(path))[0])
+    return module.main()
+
+# ============== 缓存 ==============
+
+class _Pickler(pickle.Pickler):
+    """拒绝序列化 __main__ 中定义的类"""
+
+    def reducer_override(self, obj):
+        if isinstance(obj, type) and obj.__module__ == "__main__":
+            raise pickle.PicklingError(f"{obj.__qualname__} 定义在 __main__ 中，其他入口无法还原")
+        return NotImplemented
+
+class ResultCache:
+    """按内容寻址的磁盘缓存，每个键一个 pickle 文件，LRU 按总大小淘汰"""
+
+    def __init__(self, directory: str = DEFAULT_CACHE_DIR, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(engine: str, config: Any, seed: int, start: int, stop: int, *extra: Any) -> str:
+        """缓存键：引擎版本、配置指纹、根种子、局号区间 [start, stop) 及其他影响结果的参数"""
+        text = json.dumps([engine, config_fingerprint(config), seed, start, stop, _canonical(list(extra))],
+                          ensure_ascii=False)
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key + ".pkl")
+
+    def get(self, key: str) -> Optional[Any]:
+        """命中返回缓存值并刷新使用时间，未命中返回 None
+
+        文件损坏、类已改名或所在模块无法导入（AttributeError / ImportError 等）时视为未命中，
+        并删除该条目，随后由调用方重新模拟并写入。
+        """
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                value = pickle.load(f)
+        except OSError:
+            self.misses += 1
+            return None
+        except Exception:
+            self.misses += 1
+            self._remove(path)
+            return None
+        try:
+            os.utime(path)
+        except OSError:  # 读取后已被其他进程淘汰，值仍可用
+            pass
+        self.hits += 1
+        return value
+
+    def put(self, key: str, value: Any):
+        """原子写入（先写临时文件再改名，多进程并发写同一键也安全），随后按大小淘汰
+
+        值中含 __main__ 里定义的类时不写入（见模块说明）。
+        """
+        buffer = io.BytesIO()
+        try:
+            _Pickler(buffer, protocol=pickle.HIGHEST_PROTOCOL).dump(value)
+        except pickle.PicklingError as error:
+            print(f"  缓存未写入：{error}")
+            return
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(buffer.getvalue())
+        os.replace(tmp, self._path(key))
+        self.evict()
+
+    @staticmethod
+    def _remove(path: str):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def evict(self):
+        """删除最久未使用的条目，直到总大小不超过 max_bytes"""
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".pkl"):
+                continue
+            try:
+                st = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, name))
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            self._remove(os.path.join(self.directory, name))
+            total -= size
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            if name.endswith(".pkl"):
+                os.remove(os.path.join(self.directory, name))
+
+    def summary(self) -> str:
+        return f"缓存命中 {self.hits}，未命中 {self.misses}（{self.directory}）"
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""
+各模拟器共用的随机流与置信区间工具
+v5.8 模拟器、批量引擎、共业测试与 core/ 下的核心版模拟器都从这里导入，
+保证同一根种子在各引擎中派生出相同的子种子，序贯抽样的判停规则一致。
+"""
+
+import hashlib
+import random
+from typing import Dict, Optional, Tuple
+
+# ============== 随机流 ==============
+
+def derive_seed(root_seed: int, *stream) -> int:
+    """由根种子和流标识（场景、局号、分片号等）派生互不相关的子种子"""
+    key = ":".join(str(x) for x in (root_seed,) + stream).encode("utf-8")
+    return int.from_bytes(hashlib.sha256(key).digest()[:8], "big")
+
+def engine_rng(rng: Optional[random.Random] = None) -> random.Random:
+    """引擎的随机源：注入的随机流；未注入时使用独立的未播种流"""
+    return rng if rng is not None else random.Random()
+
+# ============== 置信区间 ==============
+
+CI_Z = 1.96  # 95% 置信水平
+
+def wilson_interval(successes: int, n: int, z: float = CI_Z) -> Tuple[float, float]:
+    """比例的 Wilson 置信区间（小样本、接近0或1的比例也稳定）"""
+    if n <= 0:
+        return (0.0, 1.0)
+    p = successes / n
+    denom = 1 + z * z / n
+    center = (p + z * z / (2 * n)) / denom
+    margin = z * ((p * (1 - p) + z * z / (4 * n)) / n) ** 0.5 / denom
+    return (max(0.0, center - margin), min(1.0, center + margin))
+
+def games_needed(successes: int, n: int, games: int, target: float, z: float = CI_Z) -> float:
+    """按当前样本累积速度，估计达到目标半宽所需的总局数（样本数为0时为无穷）"""
+    if n <= 0:
+        return float("inf")
+    p = (successes + 2) / (n + 4)  # Agresti-Coull 修正，避免 p=0 时低估
+    return z * z * p * (1 - p) / (target * target) * games / n
+
+def ci_status(counts: Dict[str, Tuple[int, int]], targets: Dict[str, float],
+              games: int, budget: int,
+              overrides: Optional[Dict[str, Tuple[float, float]]] = None) -> Dict:
+    """counts: {指标名: (成功数, 样本数)}；targets 可按全名或 "/" 前的指标族给出目标半宽
+
+    overrides: {指标名: (估计值, 标准误)}，给出的指标改用 估计值 ± z·标准误（如控制变量修正估计），
+    其余指标用 Wilson 区间。
+    返回 {"met": 是否全部达标, "done": 是否可以停止, "intervals": {名称: 详情}}。
+    预计所需局数超出预算的指标（如几乎不胜利时的条件比例）标记为不可达，不阻止停止。
+    """
+    overrides = overrides or {}
+    intervals = {}
+    for name, (successes, n) in counts.items():
+        target = targets.get(name, targets.get(name.split("/")[0]))
+        if target is None:
+            continue
+        if name in overrides:
+            rate, se = overrides[name]
+            half_width = CI_Z * se
+            low, high = max(0.0, rate - half_width), min(1.0, rate + half_width)
+            needed = games * (half_width / target) ** 2
+        else:
+            rate = successes / n if n else 0.0
+            low, high = wilson_interval(successes, n)
+            half_width = (high - low) / 2
+            needed = games_needed(successes, n, games, target)
+        met = half_width <= target
+        intervals[name] = {
+            "rate": rate, "low": low, "high": high,
+            "half_width": half_width, "target": target, "met": met,
+            "reachable": met or needed <= budget,
+        }
+    met = bool(intervals) and all(item["met"] for item in intervals.values())
+    done = all(item["met"] or not item["reachable"] for item in intervals.values())
+    return {"met": met, "done": done, "intervals": intervals}
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""
+《功德轮回》全局敏感性分析（Sobol 指数）
+Saltelli 抽样：两组独立样本 A、B，再对每个参数 i 构造 AB_i（A 的第 i 列换成 B 的），
+共 N·(d+2) 个点经参数扫描进程池模拟；对每个指标估计
+  一阶指数 S_i（Saltelli 2010）：该参数单独解释的方差比例
+  总效应指数 ST_i（Jansen 1999）：含全部交互作用的方差比例，≈0 即为惰性参数
+置信区间按样本行自助法估计。
+
+所有点共用同一根种子（公共随机数）：改动惰性参数时对局完全相同，ST_i 精确为 0。
+
+依赖：numpy
+"""
+
+import time
+from dataclasses import fields
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from simulator_v58_FINAL import GameConfig
+from result_cache import ResultCache
+from sweep import Param, SweepTarget, run_sweep, v58_target, write_csv
+
+DEFAULT_METRICS = (
+    "team_win_rate",
+    "by_role/农夫/first_rate", "by_role/商人/first_rate",
+    "by_role/学者/first_rate", "by_role/僧侣/first_rate",
+)
+
+# ============== 参数空间 ==============
+
+def config_params(base: Any, spread: float = 0.5, exclude: Sequence[str] = ()) -> List[Param]:
+    """基准配置全部标量数值字段的扫描区间：默认值 ±spread（整数字段至少 ±1，不为负）
+
+    布尔开关与元组/列表/字典字段跳过。整数区间向两端各扩 0.5，取整后每个整数等概率。
+    """
+    params = []
+    for f in fields(base):
+        value = getattr(base, f.name)
+        if f.name in exclude or isinstance(value, bool) or not isinstance(value, (int, float)):
+            continue
+        if isinstance(value, int):
+            delta = max(1, round(abs(value) * spread))
+            low = max(0, value - delta) if value >= 0 else value - delta
+            params.append(Param(f.name, low - 0.499, value + delta + 0.499))
+        else:
+            delta = abs(value) * spread or spread
+            params.append(Param(f.name, max(0.0, value - delta) if value >= 0 else value - delta, value + delta))
+    return params
+
+def saltelli_points(params: List[Param], n: int, seed: int = 0) -> List[Dict[str, Any]]:
+    """A（n 行）、B（n 行）、AB_1..AB_d（各 n 行），共 n·(d+2) 个点，按此顺序排列"""
+    rng = np.random.default_rng(seed)
+    d = len(params)
+    A = rng.random((n, d))
+    B = rng.random((n, d))
+    blocks = [A, B]
+    for i in range(d):
+        AB = A.copy()
+        AB[:, i] = B[:, i]
+        blocks.append(AB)
+    units = np.vstack(blocks)
+    return [{p.name: p.at(u[k]) for k, p in enumerate(params)} for u in units]
+
+# ============== 指数估计 ==============
+
+def sobol_indices(y: np.ndarray, n: int, d: int, bootstrap: int = 200, seed: int = 0) -> Dict[str, np.ndarray]:
+    """由 saltelli_points 顺序排列的输出 y 估计 S1、ST 及其 95% 自助法半宽"""
+    fA, fB = y[:n], y[n:2 * n]
+    fAB = y[2 * n:].reshape(d, n)
+
+    def estimate(rows):
+        a, b, ab = fA[rows], fB[rows], fAB[:, rows]
+        var = np.var(np.concatenate([a, b]))
+        if var == 0:
+            return np.zeros(d), np.zeros(d)
+        s1 = np.mean(b * (ab - a), axis=1) / var
+        st = 0.5 * np.mean((a - ab) ** 2, axis=1) / var
+        return s1, st
+
+    s1, st = estimate(np.arange(n))
+    rng = np.random.default_rng(seed)
+    samples = [estimate(rng.integers(0, n, n)) for _ in range(bootstrap)]
+    s1_boot = np.array([s for s, _ in samples])
+    st_boot = np.array([t for _, t in samples])
+    return {
+        "S1": s1, "S1_conf": 1.96 * s1_boot.std(axis=0),
+        "ST": st, "ST_conf": 1.96 * st_boot.std(axis=0),
+        "variance": float(np.var(y[:2 * n])),
+    }
+
+# ============== 分析 ==============
+
+def sobol_analysis(params: List[Param], n: int = 16, games: int = 200, seed: int = 2026,
+                   target: Optional[SweepTarget] = None, metrics: Sequence[str] = DEFAULT_METRICS,
+                   sample_seed: int = 0, workers: Optional[int] = None,
+                   cache: Optional[ResultCache] = None, progress: bool = True) -> Dict[str, Any]:
+    """对 params 做 Sobol 分析，返回 {"indices": {指标: sobol_indices 结果}, "params", "points", "games"}"""
+    target = target or v58_target()
+    points = saltelli_points(params, n, sample_seed)
+    rows = run_sweep(target, points, games=games, seed=seed, workers=workers,
+                     cache=cache, progress=progress)
+    indices = {}
+    for metric in metrics:
+        y = np.array([float(row.get(metric, 0.0)) for row in rows])
+        indices[metric] = sobol_indices(y, n, len(params), seed=sample_seed)
+    return {"indices": indices, "params": params, "points": len(points), "games": games}
+
+def influential(result: Dict[str, Any], threshold: float = 0.05) -> List[Param]:
+    """任一指标上总效应指数 ≥ threshold 的参数（可直接用于后续扫描 / 调参）"""
+    keep = set()
+    for idx in result["indices"].values():
+        keep.update(k for k, st in enumerate(idx["ST"]) if st >= threshold)
+    return [p for k, p in enumerate(result["params"]) if k in keep]
+
+def result_rows(result: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """整洁表：每 (指标, 参数) 一行"""
+    rows = []
+    for metric, idx in result["indices"].items():
+        for k, p in enumerate(result["params"]):
+            rows.append({"metric": metric, "param": p.name,
+                         "S1": idx["S1"][k], "S1_conf": idx["S1_conf"][k],
+                         "ST": idx["ST"][k], "ST_conf": idx["ST_conf"][k]})
+    return rows
+
+def format_indices(result: Dict[str, Any], top: int = 10) -> str:
+    lines = []
+    for metric, idx in result["indices"].items():
+        lines.append(f"\n{metric}（方差 {idx['variance']:.5f}）")
+        lines.append(f"  {'参数':<34} |   S1 (±95%)      |   ST (±95%)")
+        order = np.argsort(idx["ST"])[::-1][:top]
+        for k in order:
+            lines.append(f"  {result['params'][k].name:<34} | {idx['S1'][k]:6.3f} ± {idx['S1_conf'][k]:5.3f} | "
+                         f"{idx['ST'][k]:6.3f} ± {idx['ST_conf'][k]:5.3f}")
+        inert = int(np.sum(idx["ST"] == 0))
+        lines.append(f"  总效应为 0 的参数: {inert}/{len(result['params'])}")
+    return "\n".join(lines)
+
+# ============== 主程序 ==============
+
+def main(n: int = 32, games: int = 200, threshold: float = 0.05, out: str = "sensitivity_v58.csv"):
+    print("《功德轮回》v5.8 全局敏感性分析（Sobol 指数）")
+    print("=" * 50)
+    params = config_params(GameConfig())
+    print(f"{len(params)} 个标量字段（默认值 ±50%），N={n}：{n * (len(params) + 2)} 点 × {games} 局")
+    start = time.perf_counter()
+    cache = ResultCache()
+    result = sobol_analysis(params, n=n, games=games, cache=cache, progress=False)
+    print(f"耗时 {time.perf_counter() - start:.1f}s；{cache.summary()}")
+    print(format_indices(result))
+    keep = influential(result, threshold)
+    print(f"\n任一指标 ST ≥ {threshold} 的参数（{len(keep)}/{len(params)}）:")
+    for p in keep:
+        print(f"  {p.name}")
+    write_csv(result_rows(result), out)
+    print(f"\n已写入 {out}")
+
+if __name__ == "__main__":
+    main()
@@ -6,11 +6,21 @@ v6.0更新：职业平衡调整、共业倍率机制
 """
 
 import random
+from bisect import bisect_right
 from dataclasses import dataclass, field
 from enum import Enum, auto
-from typing import List, Dict, Tuple, Optional
-from collections import defaultdict
+from typing import List, Dict, Tuple, Optional, Iterable, Iterator
+from collections import defaultdict, Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import contextlib
+import cProfile
 import json
+import os
+import pstats
+import time
+
+from result_cache import ResultCache, engine_version, run_as_module
+from sampling import derive_seed, engine_rng, CI_Z, wilson_interval, ci_status
 
 # ============== 枚举定义 ==============
 
@@ -63,6 +73,45 @@ class EventType(Enum):
     MISFORTUNE = "人祸"
     BLESSING = "功德"
 
+# ============== 整数编码 ==============
+# 热循环内只比较小整数；枚举仅在输出结果时换回中文标签（ROLES[code].value 等）
+
+ROLES = tuple(Role)
+FARMER, MERCHANT, SCHOLAR, MONK = range(4)
+
+FAITHS = tuple(FaithState)
+SECULAR, REFUGE, MAHAYANA = range(3)
+
+SACRIFICES = tuple(SacrificeType)
+NO_SACRIFICE = -1
+SAC_WEALTH, SAC_MERIT, SAC_WISDOM = range(3)
+
+BVOWS = tuple(BodhisattvaVow)
+NO_BVOW = -1
+KSITIGARBHA, AVALOKITESVARA, SAMANTABHADRA, MANJUSRI = range(4)
+
+VOWS = tuple(Vow)  # 职业 r 的简单愿编码为 2r，困难愿为 2r+1
+NO_VOW = -1
+(VOW_DILIGENT, VOW_POOR_GIRL, VOW_CHARITY, VOW_GREAT_MERCHANT,
+ VOW_TEACHING, VOW_MASTER, VOW_ARHAT, VOW_BODHISATTVA) = range(8)
+
+ACTIONS = tuple(ActionType)
+LABOR, PRACTICE, DONATE, SAVE, PROTECT, MUTUAL_AID = range(6)
+HELP_ACTIONS = (DONATE, SAVE, PROTECT)
+
+SACRIFICE_CODES = tuple(range(len(SACRIFICES)))
+BVOW_CODES = tuple(range(len(BVOWS)))
+
+# 互助时每位玩家可选的队友下标
+OTHER_PLAYERS = tuple(tuple(k for k in range(4) if k != j) for j in range(4))
+
+# 紧凑终局状态中每位玩家保存的整数字段（只重算得分时所需的全部信息）
+END_STATE_PLAYER_FIELDS = (
+    "wealth", "merit", "hui", "faith", "sacrifice", "vow", "bodhisattva_vow",
+    "labor_count", "practice_count", "donate_count", "save_count", "protect_count",
+    "scholar_skill_used", "ksitigarbha_absorb_count", "mahayana_penalty", "hero_marks",
+)
+
 # ============== 配置 ==============
 
 @dataclass
@@ -139,6 +188,10 @@ class GameConfig:
     merchant_donate_threshold: int = 4  # 布施次数阈值
     merchant_donate_hui_bonus: int = 3  # 终局慧加成
     
+    # v5.8: 农夫"勤劳积德"
+    farmer_labor_threshold: int = 5     # 劳作次数阈值
+    farmer_labor_merit_bonus: int = 2   # 终局功德加成
+    
     # 众生成本
     being_costs: List[int] = field(default_factory=lambda: [3, 3, 4, 4, 4, 5, 5, 6, 3, 5])
     being_merit_rewards: List[int] = field(default_factory=lambda: [2, 2, 3, 2, 1, 2, 4, 3, 3, 2])
@@ -222,20 +275,135 @@ class GameConfig:
         (8, 1.2),   # 劫难5-8: ×1.2 功德圆满
         (12, 1.0),  # 劫难9-12: ×1.0 勉强成功
     ])
+    
+    # 基础分阶梯：功德+慧 ≥ 第k个阈值时取 steps[k+1]
+    base_score_thresholds: Tuple[int, ...] = (10, 15, 20, 25, 30, 35)
+    base_score_steps: Tuple[int, ...] = (10, 15, 25, 35, 45, 55, 65)
+
+    def compile(self) -> "CompiledConfig":
+        """预计算热循环用的只读查表（每次模拟运行构建一次）"""
+        roles = range(len(ROLES))
+        faiths = range(len(FAITHS))
+
+        def role_faith_table(base, role_bonus, secular_bonus):
+            return tuple(
+                tuple(base + role_bonus(r) + (secular_bonus if f == SECULAR else 0) for f in faiths)
+                for r in roles
+            )
+
+        def save_cost_table(clamp):
+            table = []
+            for cost in self.being_costs:
+                per_role = []
+                for r in roles:
+                    c = cost - (self.save_monk_cost_reduce if r == MONK else 0)
+                    row = tuple(c - (self.secular_save_cost_reduce if f == SECULAR else 0) for f in faiths)
+                    per_role.append(tuple(max(1, x) for x in row) if clamp else row)
+                table.append(tuple(per_role))
+            return tuple(table)
+
+        # 共业倍率：按劫难值直接索引，超出表长为 ×1.0
+        top = max((threshold for threshold, _ in self.karma_multiplier_levels), default=-1)
+        karma = []
+        for calamity in range(top + 1):
+            multiplier = 1.0
+            for threshold, level in self.karma_multiplier_levels:
+                if calamity <= threshold:
+                    multiplier = level
+                    break
+            karma.append(multiplier)
+
+        hell = self.hell_mode
+        disaster_weight = self.hell_disaster_weight if hell else self.disaster_weight
+        misfortune_weight = self.misfortune_weight * (0.5 if hell else 1.0)
+
+        return CompiledConfig(
+            labor_gain=role_faith_table(
+                self.labor_base, lambda r: self.labor_farmer_bonus if r == FARMER else 0,
+                self.secular_labor_bonus),
+            practice_gain=role_faith_table(
+                self.practice_base, lambda r: self.practice_scholar_bonus if r == SCHOLAR else 0,
+                self.secular_practice_bonus),
+            save_cost=save_cost_table(clamp=True),
+            save_check_cost=save_cost_table(clamp=False),
+            donate_merit=tuple(self.donate_merit + (self.donate_merchant_bonus if r == MERCHANT else 0)
+                               for r in roles),
+            protect_cost=tuple(self.monk_protect_cost if r == MONK else self.protect_cost for r in roles),
+            protect_merit=tuple(self.protect_merit + (self.monk_protect_merit_bonus if r == MONK else 0)
+                                for r in roles),
+            being_costs=tuple(self.being_costs),
+            being_merit=tuple(self.being_merit_rewards),
+            being_hui=tuple(self.being_hui_rewards),
+            being_futian=tuple(self.being_is_futian),
+            disaster_weight=disaster_weight,
+            misfortune_cutoff=disaster_weight + misfortune_weight,
+            disaster_base=self.hell_disaster_calamity if hell else getattr(
+                self, 'disaster_base_calamity_adj', self.disaster_base_calamity),
+            misfortune_base=self.hell_disaster_calamity - 3 if hell else getattr(
+                self, 'misfortune_base_calamity_adj', self.misfortune_base_calamity),
+            coop_rate=0.3 if hell else 0.5,
+            base_score_thresholds=tuple(self.base_score_thresholds),
+            base_score_steps=tuple(self.base_score_steps),
+            vow_success=tuple(self.vow_scores.get(v.value, (0, 0))[0] for v in VOWS),
+            vow_fail=tuple(self.vow_scores.get(v.value, (0, 0))[1] for v in VOWS),
+            bvow_success=tuple(self.bvow_scores.get(b.value, (0, 0))[0] for b in BVOWS),
+            bvow_fail=tuple(self.bvow_scores.get(b.value, (0, 0))[1] for b in BVOWS),
+            karma_multiplier=tuple(karma),
+        )
+
+@dataclass(frozen=True, slots=True)
+class CompiledConfig:
+    """GameConfig 的只读预计算表（元组，可直接转 numpy 数组做向量查表）
+
+    下标约定：role/faith/vow/bvow 为整数编码，being 为众生卡索引。
+    """
+    labor_gain: Tuple[Tuple[int, ...], ...]        # [role][faith]
+    practice_gain: Tuple[Tuple[int, ...], ...]     # [role][faith]
+    save_cost: Tuple[Tuple[Tuple[int, ...], ...], ...]        # [being][role][faith]，执行时成本（≥1）
+    save_check_cost: Tuple[Tuple[Tuple[int, ...], ...], ...]  # [being][role][faith]，AI判断用成本（不截断）
+    donate_merit: Tuple[int, ...]                  # [role]
+    protect_cost: Tuple[int, ...]                  # [role]
+    protect_merit: Tuple[int, ...]                 # [role]（不含危机加成）
+    being_costs: Tuple[int, ...]
+    being_merit: Tuple[int, ...]
+    being_hui: Tuple[int, ...]
+    being_futian: Tuple[bool, ...]
+    disaster_weight: float
+    misfortune_cutoff: float                       # 灾难+人祸累计权重
+    disaster_base: int
+    misfortune_base: int
+    coop_rate: float
+    base_score_thresholds: Tuple[int, ...]         # 基础分阶梯：steps[bisect_right(thresholds, 功德+慧)]
+    base_score_steps: Tuple[int, ...]
+    vow_success: Tuple[int, ...]                   # [vow]
+    vow_fail: Tuple[int, ...]
+    bvow_success: Tuple[int, ...]                  # [bvow]
+    bvow_fail: Tuple[int, ...]
+    karma_multiplier: Tuple[float, ...]            # [calamity]，超出表长为 1.0
+
+    def base_score(self, total: int) -> int:
+        """基础分查表（功德+慧）"""
+        return self.base_score_steps[bisect_right(self.base_score_thresholds, total)]
+
+    def karma(self, calamity: int) -> float:
+        """共业倍率查表"""
+        return self.karma_multiplier[max(0, calamity)] if calamity < len(self.karma_multiplier) else 1.0
 
 # ============== 玩家状态 ==============
 
-@dataclass
+@dataclass(slots=True, eq=False)
 class Player:
-    role: Role
+    """玩家运行时状态：职业/信仰/发愿均为整数编码，按身份比较"""
+    role: int
+    index: int = 0   # 在 state.players 中的下标
     wealth: int = 0
     merit: int = 0
     hui: int = 0
-    faith: FaithState = FaithState.SECULAR
+    faith: int = SECULAR
     refuge_round: int = 0  # 皈依的回合
-    sacrifice: Optional[SacrificeType] = None
-    vow: Optional[Vow] = None
-    bodhisattva_vow: Optional[BodhisattvaVow] = None
+    sacrifice: int = NO_SACRIFICE
+    vow: int = NO_VOW
+    bodhisattva_vow: int = NO_BVOW
     
     # 行动统计
     labor_count: int = 0
@@ -246,10 +414,7 @@ class Player:
     help_count: int = 0  # 布施+渡化+护法（每回合重置）
     
     # 职业特性使用统计
-    farmer_share_used: int = 0      # 农夫分享收成次数
     merchant_first_save: bool = False  # 商人首次渡化+2资
-    merchant_feast_used: int = 0    # 商人宴请次数
-    scholar_redraw_used: bool = False  # 学者重抽事件
     scholar_skill_used: int = 0     # v5.4: 学者讲学传道使用次数
     monk_merit_substitute: int = 0  # 僧侣功德代资次数
     
@@ -262,17 +427,15 @@ class Player:
     mutual_aid_given: int = 0          # 帮助他人次数
     
     # 其他统计
-    assist_save_count: int = 0
-    helped_players: set = field(default_factory=set)
-    rounds_without_help: int = 0
     mahayana_penalty: int = 0
 
 # ============== 游戏状态 ==============
 
-@dataclass
+@dataclass(slots=True, eq=False)
 class GameState:
     config: GameConfig
     players: List[Player]
+    tables: Optional["CompiledConfig"] = None  # config.compile() 的结果，由引擎注入
     calamity: int = 0
     total_saves: int = 0
     current_round: int = 1
@@ -280,130 +443,170 @@ class GameState:
     being_timers: List[int] = field(default_factory=list)    # 众生计时器
     protect_blessing_active: bool = False  # v5.6: 护法祝福激活
     protect_blessing_monk: bool = False    # v5.7: 是否僧侣护法（祝福+2功德）
+    controls: Optional[List[float]] = None  # 控制变量（鞅差累计和），仅 record_controls 时记录
+
+# ============== 随机流 ==============
+
+class AntitheticRandom(random.Random):
+    """对偶随机流：同一种子下 random() 返回 1-u（分布不变，与原流负相关）"""
+    
+    def random(self) -> float:
+        return 1.0 - super().random()
+
+class CommonStreams:
+    """公共随机数（CRN）：按用途预先拆分的随机流
+
+    事件、众生、每位玩家的决策各用一条流，且每回合按 (局种子, 用途, 回合[, 玩家]) 重新播种。
+    两个配置用同一局种子对局时，一方多抽或少抽一次只影响本回合的这一条流，
+    其余随机数不会整体错位，配对差值的方差因此远小于独立抽样。
+    antithetic=True 时事件流为对偶流：与同种子的普通局组成对偶对，灾难与功德事件此消彼长；
+    众生与决策流则另行派生、与原局独立（若共享，决策噪声会使对偶对整体正相关）。
+    """
+    
+    def __init__(self, antithetic: bool = False):
+        self.antithetic = antithetic
+        self.event = AntitheticRandom() if antithetic else random.Random()
+        self.being = random.Random()
+        self.decisions = tuple(random.Random() for _ in ROLES)  # 按玩家下标
+        self.game_seed = 0
+        self.other_seed = 0  # 众生与决策流的局种子
+    
+    def start_game(self, seed: int):
+        """设定局种子并播种开局（回合0：信仰与发愿选择）"""
+        self.game_seed = seed
+        self.other_seed = derive_seed(seed, "antithetic") if self.antithetic else seed
+        self.start_round(0)
+    
+    def start_round(self, round_num: int):
+        self.event.seed(derive_seed(self.game_seed, "event", round_num))
+        seed = self.other_seed
+        self.being.seed(derive_seed(seed, "being", round_num))
+        for index, rng in enumerate(self.decisions):
+            rng.seed(derive_seed(seed, "decision", round_num, index))
+
+# 控制变量：每回合（或每次抽取）的 抽取值 − 已知期望 的累计和。
+# 是否继续下一回合只取决于此前的局面（有界停时），因此无论对局何时结束，每局的期望都恰为 0。
+CONTROL_NAMES = (
+    "disaster",    # 灾难事件次数 − 回合数 × 灾难权重
+    "blessing",    # 功德事件次数 − 回合数 × 功德权重
+    "coop",        # 灾难中合作人数 − 灾难次数 × 人数 × 合作率
+    "being_cost",  # 新众生成本 − 抽取次数 × 平均成本
+)
 
 # ============== AI决策 ==============
 
 class AIDecision:
-    """简化的AI决策逻辑"""
+    """简化的AI决策逻辑（rng: 随机源，默认为全局 random 模块）"""
     
     @staticmethod
-    def choose_faith(player: Player, state: GameState) -> Tuple[FaithState, Optional[int], Optional[SacrificeType]]:
-        """选择信仰路线: (信仰状态, 皈依回合, 舍离类型)"""
-        role = player.role
-        round_num = state.current_round
-        
+    def choose_faith(player: Player, state: GameState, rng=random) -> Tuple[int, int, int]:
+        """选择信仰路线: (信仰编码, 皈依回合, 舍离编码)"""
         # 僧侣固定皈依
-        if role == Role.MONK:
+        if player.role == MONK:
             # 50%概率发大乘
-            if random.random() < 0.5:
-                sacrifice = random.choice(list(SacrificeType))
-                return (FaithState.MAHAYANA, 1, sacrifice)
-            return (FaithState.REFUGE, 1, None)
+            if rng.random() < 0.5:
+                sacrifice = rng.choice(SACRIFICE_CODES)
+                return (MAHAYANA, 1, sacrifice)
+            return (REFUGE, 1, NO_SACRIFICE)
         
         # 其他职业按策略选择
-        r = random.random()
+        r = rng.random()
         if r < 0.3:  # 30% 不皈依
-            return (FaithState.SECULAR, 0, None)
+            return (SECULAR, 0, NO_SACRIFICE)
         elif r < 0.7:  # 40% 皈依
-            refuge_round = random.choice([1, 1, 2, 3])  # 偏向早皈依
-            return (FaithState.REFUGE, refuge_round, None)
+            refuge_round = rng.choice([1, 1, 2, 3])  # 偏向早皈依
+            return (REFUGE, refuge_round, NO_SACRIFICE)
         else:  # 30% 大乘
             refuge_round = 1
-            sacrifice = random.choice(list(SacrificeType))
-            return (FaithState.MAHAYANA, refuge_round, sacrifice)
+            sacrifice = rng.choice(SACRIFICE_CODES)
+            return (MAHAYANA, refuge_round, sacrifice)
     
     @staticmethod
-    def choose_vow(player: Player) -> Vow:
-        """选择发愿"""
-        role = player.role
-        vows = {
-            Role.FARMER: [Vow.DILIGENT, Vow.POOR_GIRL],
-            Role.MERCHANT: [Vow.CHARITY, Vow.GREAT_MERCHANT],
-            Role.SCHOLAR: [Vow.TEACHING, Vow.MASTER],
-            Role.MONK: [Vow.ARHAT, Vow.BODHISATTVA],
-        }
+    def choose_vow(player: Player, rng=random) -> int:
+        """选择发愿（每个职业的简单愿编码为 2r，困难愿为 2r+1）"""
         # 70%选简单，30%选困难
-        if random.random() < 0.7:
-            return vows[role][0]
-        return vows[role][1]
+        if rng.random() < 0.7:
+            return player.role * 2
+        return player.role * 2 + 1
     
     @staticmethod
-    def choose_bodhisattva_vow(player: Player) -> BodhisattvaVow:
+    def choose_bodhisattva_vow(player: Player, rng=random) -> int:
         """选择菩萨愿"""
-        return random.choice(list(BodhisattvaVow))
+        return rng.choice(BVOW_CODES)
     
     @staticmethod
-    def choose_action(player: Player, state: GameState, actions_left: int) -> ActionType:
+    def choose_action(player: Player, state: GameState, actions_left: int, rng=random) -> int:
         """选择行动 - 职业差异化决策"""
         config = state.config
+        tables = state.tables
         role = player.role
         
         # 大乘玩家必须每回合帮助
-        if player.faith == FaithState.MAHAYANA and player.help_count == 0 and actions_left == 1:
+        if player.faith == MAHAYANA and player.help_count == 0 and actions_left == 1:
             if player.wealth >= config.donate_cost:
-                return ActionType.DONATE
+                return DONATE
             elif player.hui >= config.save_hui_requirement and state.beings_in_play:
-                return ActionType.SAVE
+                return SAVE
             elif player.wealth >= config.protect_cost:
-                return ActionType.PROTECT
+                return PROTECT
         
         urgency = state.calamity / config.max_calamity
         
         # ============ 职业特化行为 ============
         
         # 农夫：偏好劳作积累资粮，后期爆发渡化
-        if role == Role.FARMER:
+        if role == FARMER:
             if state.current_round <= 3:
                 # 前期积累
-                if random.random() < 0.6:
-                    return ActionType.LABOR
+                if rng.random() < 0.6:
+                    return LABOR
             else:
                 # 后期渡化
                 if state.beings_in_play and player.hui >= config.save_hui_requirement:
-                    cost = config.being_costs[state.beings_in_play[0]]
-                    if player.wealth >= cost and random.random() < 0.5:
-                        return ActionType.SAVE
+                    cost = tables.being_costs[state.beings_in_play[0]]
+                    if player.wealth >= cost and rng.random() < 0.5:
+                        return SAVE
         
         # 商人：偏好布施积累功德，v5.5增加经济渡化倾向
-        elif role == Role.MERCHANT:
+        elif role == MERCHANT:
             # v5.5: 商人经济渡化 - 用双倍资粮代替慧
             if state.beings_in_play and player.wealth >= 8:  # 资粮充足时尝试经济渡化
                 being_idx = state.beings_in_play[0]
-                double_cost = config.being_costs[being_idx] * 2  # 双倍成本
-                if player.wealth >= double_cost and random.random() < 0.3:
-                    return ActionType.SAVE  # 模拟经济渡化
+                double_cost = tables.being_costs[being_idx] * 2  # 双倍成本
+                if player.wealth >= double_cost and rng.random() < 0.3:
+                    return SAVE  # 模拟经济渡化
             
             if player.wealth >= config.donate_cost:
-                if random.random() < 0.5:  # 商人更爱布施
-                    return ActionType.DONATE
+                if rng.random() < 0.5:  # 商人更爱布施
+                    return DONATE
             if player.wealth < 4:  # 资粮不足时劳作
-                if random.random() < 0.6:
-                    return ActionType.LABOR
+                if rng.random() < 0.6:
+                    return LABOR
         
         # 学者：偏好修行积累慧
-        elif role == Role.SCHOLAR:
+        elif role == SCHOLAR:
             if player.hui < 15:  # 慧不够时优先修行
-                if random.random() < 0.5:
-                    return ActionType.PRACTICE
+                if rng.random() < 0.5:
+                    return PRACTICE
             # 慧够了可以渡化
             if state.beings_in_play and player.hui >= config.save_hui_requirement:
-                cost = config.being_costs[state.beings_in_play[0]] - 1  # 学者成本-1
-                if player.wealth >= cost and random.random() < 0.4:
-                    return ActionType.SAVE
+                cost = tables.being_costs[state.beings_in_play[0]] - 1  # 学者成本-1
+                if player.wealth >= cost and rng.random() < 0.4:
+                    return SAVE
         
         # 僧侣：偏好渡化（成本-1，可用功德代资）
-        elif role == Role.MONK:
+        elif role == MONK:
             if state.beings_in_play and player.hui >= config.save_hui_requirement:
                 being_idx = state.beings_in_play[0]
-                cost = config.being_costs[being_idx] - config.save_monk_cost_reduce
+                cost = tables.save_check_cost[being_idx][MONK][REFUGE]  # 僧侣减免（不含不皈依减免）
                 # 可以用功德代替部分资粮
                 effective_wealth = player.wealth + min(2, player.merit)
-                if effective_wealth >= cost and random.random() < 0.6:
-                    return ActionType.SAVE
+                if effective_wealth >= cost and rng.random() < 0.6:
+                    return SAVE
             # 僧侣资粮少，需要劳作补充
             if player.wealth < 2:
-                if random.random() < 0.5:
-                    return ActionType.LABOR
+                if rng.random() < 0.5:
+                    return LABOR
         
         # ============ 通用逻辑 ============
         
@@ -413,80 +616,339 @@ class AIDecision:
                 # 人间炼狱模式：大幅提高护法概率
                 protect_prob = 0.35 + urgency * 0.5  # 基础35%，高劫难时85%
                 if urgency > 0.25:  # 劫难>3时就开始护法
-                    if random.random() < protect_prob:
-                        return ActionType.PROTECT
+                    if rng.random() < protect_prob:
+                        return PROTECT
             elif urgency > 0.35:
                 # 基础版：劫难较高时护法
                 protect_prob = 0.25 + urgency * 0.4
-                if random.random() < protect_prob:
-                    return ActionType.PROTECT
+                if rng.random() < protect_prob:
+                    return PROTECT
         
         # 有众生且能渡化
         if state.beings_in_play and player.hui >= config.save_hui_requirement:
-            cost = config.being_costs[state.beings_in_play[0]]
-            if role == Role.MONK:
-                cost -= config.save_monk_cost_reduce
-            if player.faith == FaithState.SECULAR:
-                cost -= config.secular_save_cost_reduce
+            cost = tables.save_check_cost[state.beings_in_play[0]][role][player.faith]
             if player.wealth >= cost:
-                if random.random() < 0.3:
-                    return ActionType.SAVE
+                if rng.random() < 0.3:
+                    return SAVE
         
         # 布施
         if player.wealth >= config.donate_cost:
-            if random.random() < 0.25:
-                return ActionType.DONATE
+            if rng.random() < 0.25:
+                return DONATE
         
         # v5.7: 互助行动 - 资源不足时考虑
         if player.mutual_aid_used < config.mutual_aid_max_uses:
             # 需要资源但不足时请求帮助
             need_wealth = (player.wealth < config.donate_cost and urgency > 0.3)
             need_hui = (player.hui < config.save_hui_requirement and state.beings_in_play)
-            if (need_wealth or need_hui) and random.random() < 0.2:
-                return ActionType.MUTUAL_AID
+            if (need_wealth or need_hui) and rng.random() < 0.2:
+                return MUTUAL_AID
         
         # 修行
-        if random.random() < 0.3:
-            return ActionType.PRACTICE
+        if rng.random() < 0.3:
+            return PRACTICE
         
         # 默认劳作
-        return ActionType.LABOR
+        return LABOR
+
+# ============== 编译策略 ==============
+
+class _BranchProbe:
+    """choose_action 中 rng 的替身：记录每次 rng.random() < p 的概率，并按脚本选择分支"""
+    __slots__ = ("script", "trace")
+
+    def __init__(self, script: List[bool]):
+        self.script = script
+        self.trace = []  # [(p, 是否走 <p 分支)]
+
+    def random(self):
+        return self
+
+    def __lt__(self, p: float) -> bool:
+        i = len(self.trace)
+        taken = self.script[i] if i < len(self.script) else False
+        self.trace.append((min(max(p, 0.0), 1.0), taken))
+        return taken
+
+class CompiledPolicy:
+    """把 AIDecision.choose_action 的级联概率编译为按离散状态键缓存的显式动作分布
+
+    缓存未命中时用 _BranchProbe 穷举级联的全部分支路径，得到与级联完全相同的动作分布。
+    供需要 p(动作|状态) 的分析使用（rare_events 的重要性抽样、as_table 导出策略表）；
+    引擎本身始终按级联逐条抽样：CPython 中计算状态键与级联本身同样昂贵，编译抽样并不更快。
+    """
+
+    def __init__(self, config: GameConfig, tables: Optional[CompiledConfig] = None, decide=None):
+        self.config = config
+        self.tables = tables if tables is not None else config.compile()
+        self.decide = decide if decide is not None else AIDecision.choose_action
+        self.cache: Dict[tuple, Tuple[Tuple[float, ...], Tuple[int, ...]]] = {}
+
+    def state_key(self, player: Player, state: GameState, actions_left: int) -> tuple:
+        """级联读取的全部条件；劫难为整数，因此紧迫度分档即劫难值本身"""
+        config = self.config
+        tables = self.tables
+        role = player.role
+        wealth = player.wealth
+        beings = state.beings_in_play
+        has_being = bool(beings)
+        front = beings[0] if has_being else 0
+        
+        # 职业特化分支读取的条件
+        if role == FARMER:
+            role_bit1, role_bit2 = state.current_round <= 3, wealth >= tables.being_costs[front]
+        elif role == MERCHANT:
+            role_bit1, role_bit2 = wealth >= 8 and wealth >= tables.being_costs[front] * 2, wealth < 4
+        elif role == SCHOLAR:
+            role_bit1, role_bit2 = player.hui < 15, wealth >= tables.being_costs[front] - 1
+        else:
+            role_bit1 = wealth + min(2, player.merit) >= tables.save_check_cost[front][MONK][REFUGE]
+            role_bit2 = wealth < 2
+        
+        return (
+            role,
+            player.faith == MAHAYANA and player.help_count == 0 and actions_left == 1,
+            has_being and player.hui >= config.save_hui_requirement,
+            wealth >= config.donate_cost,
+            wealth >= config.protect_cost,
+            role_bit1,
+            role_bit2,
+            wealth >= tables.save_check_cost[front][role][player.faith],
+            player.mutual_aid_used < config.mutual_aid_max_uses,
+            has_being,
+            state.calamity,
+        )
+
+    def compile_distribution(self, player: Player, state: GameState,
+                             actions_left: int) -> Tuple[Tuple[float, ...], Tuple[int, ...]]:
+        """穷举级联分支，返回 (累计概率, 动作编码)"""
+        masses: Dict[int, float] = {}
+        script: List[bool] = []
+        while True:
+            probe = _BranchProbe(script)
+            action = self.decide(player, state, actions_left, probe)
+            prob = 1.0
+            for p, taken in probe.trace:
+                prob *= p if taken else 1.0 - p
+            masses[action] = masses.get(action, 0.0) + prob
+            # 回溯：最后一个未走的 <p 分支改为走
+            script = [taken for _, taken in probe.trace]
+            while script and script[-1]:
+                script.pop()
+            if not script:
+                break
+            script[-1] = True
+        
+        # 归一化累计概率；最后一档置为 +inf，按累计概率抽样时必落在范围内
+        total = sum(masses.values())
+        cumulative = []
+        running = 0.0
+        for mass in masses.values():
+            running += mass / total
+            cumulative.append(running)
+        cumulative[-1] = float("inf")
+        return tuple(cumulative), tuple(masses)
+
+    def distribution(self, player: Player, state: GameState,
+                     actions_left: int) -> Tuple[Tuple[float, ...], Tuple[int, ...]]:
+        """当前决策的 (累计概率, 动作编码)，按状态键缓存"""
+        key = self.state_key(player, state, actions_left)
+        entry = self.cache.get(key)
+        if entry is None:
+            entry = self.cache[key] = self.compile_distribution(player, state, actions_left)
+        return entry
+
+    def as_table(self) -> Dict[tuple, Dict[str, float]]:
+        """已编译的策略表：状态键 → {动作标签: 概率}"""
+        table = {}
+        for key, (cumulative, actions) in self.cache.items():
+            previous = 0.0
+            row = {}
+            for c, action in zip(cumulative, actions):
+                c = min(c, 1.0)
+                row[ACTIONS[action].value] = c - previous
+                previous = c
+            table[key] = row
+        return table
+
+# ============== 性能剖析 ==============
+
+# 剖析阶段：run_game 为整局总耗时，其余为其内部互不嵌套的阶段（整局减去各阶段之和记为“其他”）
+PROFILE_PHASES = (
+    "setup",             # 信仰、发愿选择
+    "mid_game_refuge",   # 中途皈依检查
+    "collective_event",  # 集体事件
+    "beings_phase",      # 众生阶段
+    "choose_action",     # AI 行动决策
+    "execute_action",    # 执行行动
+    "round_end",         # 回合结束
+    "game_result",       # 终局计分与结果字典
+)
+
+class PhaseProfiler:
+    """逐阶段累计计时、调用次数与行动类型计数（可合并，随部分聚合从分片回传）
+
+    GameEngine(profiler=...) 时以实例属性包装各阶段方法，未启用时引擎不做任何额外工作。
+    计时包装本身的开销（每次调用约零点几微秒）落在 run_game 内，计入“其他”。
+    """
+    
+    def __init__(self):
+        self.seconds = defaultdict(float)
+        self.calls = defaultdict(int)
+        self.actions = Counter()  # 行动编码 → 执行次数
+    
+    def wrap(self, phase: str, func):
+        """返回计时版本的 func：每次调用累计到 phase"""
+        seconds, calls, clock = self.seconds, self.calls, time.perf_counter
+        
+        def timed(*args):
+            start = clock()
+            try:
+                return func(*args)
+            finally:
+                seconds[phase] += clock() - start
+                calls[phase] += 1
+        return timed
+    
+    def wrap_action(self, func):
+        """execute_action 的计时版本，另按行动类型计数"""
+        actions, timed = self.actions, self.wrap("execute_action", func)
+        
+        def counted(player, action, state):
+            actions[action] += 1
+            return timed(player, action, state)
+        return counted
+    
+    def add(self, phase: str, seconds: float, calls: int = 1):
+        """记录引擎外部阶段（聚合、统计）的耗时"""
+        self.seconds[phase] += seconds
+        self.calls[phase] += calls
+    
+    def merge(self, other: "PhaseProfiler"):
+        for phase, value in other.seconds.items():
+            self.seconds[phase] += value
+        for phase, value in other.calls.items():
+            self.calls[phase] += value
+        self.actions.update(other.actions)
+        return self
+    
+    def summary(self) -> Dict:
+        """{"phases": {阶段: {seconds, calls, us_per_call, share}}, "actions": {行动: 次数}}
+
+        share 为占整局总耗时（run_game）的比例；引擎外部阶段（update/analyze）同样按此比例列出。
+        """
+        total = self.seconds.get("run_game", 0.0)
+        inner = sum(self.seconds.get(phase, 0.0) for phase in PROFILE_PHASES)
+        seconds = dict(self.seconds)
+        calls = dict(self.calls)
+        if total:
+            seconds["other"] = max(0.0, total - inner)
+            calls["other"] = calls.get("run_game", 0)
+        order = ["run_game", *PROFILE_PHASES, "other"]
+        order += sorted(phase for phase in seconds if phase not in order)
+        phases = {}
+        for phase in order:
+            if phase not in seconds:
+                continue
+            n = calls.get(phase, 0)
+            phases[phase] = {
+                "seconds": seconds[phase],
+                "calls": n,
+                "us_per_call": seconds[phase] / n * 1e6 if n else 0.0,
+                "share": seconds[phase] / total if total else 0.0,
+            }
+        actions = {ACTIONS[code].value: count for code, count in sorted(self.actions.items())}
+        return {"phases": phases, "actions": actions}
+
+def format_profile(summary: Dict) -> str:
+    """PhaseProfiler.summary() 的文本表"""
+    lines = ["  阶段              |   耗时(s) |     调用次数 | 单次(μs) | 占整局"]
+    for phase, item in summary["phases"].items():
+        lines.append(f"  {phase:<17} | {item['seconds']:9.3f} | {item['calls']:12d} | "
+                     f"{item['us_per_call']:8.2f} | {item['share']*100:5.1f}%")
+    total = sum(summary["actions"].values())
+    if total:
+        lines.append("  行动类型: " + "  ".join(f"{name} {count} ({count/total*100:.1f}%)"
+                                            for name, count in summary["actions"].items()))
+    return "\n".join(lines)
 
 # ============== 游戏引擎 ==============
 
 class GameEngine:
-    def __init__(self, config: GameConfig):
+    def __init__(self, config: GameConfig, rng: Optional[random.Random] = None,
+                 record_end_state: bool = False,
+                 common_streams: bool = False, antithetic: bool = False,
+                 record_controls: bool = False, profiler: Optional[PhaseProfiler] = None,
+                 tracer=None):
         self.config = config
+        self.rng = engine_rng(rng)
+        # 事件、众生、各玩家决策的随机源：默认都是 self.rng（单一流，结果与既有种子一致）；
+        # common_streams=True 时改用 CommonStreams 的预拆分流，须每局调用 seed()；
+        # antithetic=True 时同上，且事件流为对偶流（与同种子普通局配对）
+        if common_streams or antithetic:
+            self.streams = CommonStreams(antithetic)
+            self.event_rng = self.streams.event
+            self.being_rng = self.streams.being
+            self.player_rngs = self.streams.decisions
+        else:
+            self.streams = None
+            self.event_rng = self.being_rng = self.rng
+            self.player_rngs = (self.rng,) * len(ROLES)
+        self.tables = config.compile()  # 只读查表，热循环只做下标访问
+        # 各职业的行动决策函数：默认为 AIDecision 级联；子类可替换（如 rare_events 的倾斜抽样）
+        self.choosers = (AIDecision.choose_action,) * len(ROLES)
+        # 为 True 时结果附带 "end_state"，供只改计分参数时直接重算得分
+        self.record_end_state = record_end_state
+        # 为 True 时结果附带 "controls"：期望已知（恒为0）的事件与众生抽取量，供控制变量修正
+        self.record_controls = record_controls
         self.stats = defaultdict(lambda: defaultdict(int))
+        # 逐阶段剖析（默认关闭）：以实例属性遮蔽各阶段方法，关闭时热循环不受任何影响
+        self.profiler = profiler
+        if profiler is not None:
+            for phase, name in (("collective_event", "process_collective_event"),
+                                ("beings_phase", "process_beings_phase"),
+                                ("round_end", "process_round_end"),
+                                ("mid_game_refuge", "check_mid_game_refuge"),
+                                ("setup", "choose_setup"),
+                                ("game_result", "game_result"),
+                                ("run_game", "run_game")):
+                setattr(self, name, profiler.wrap(phase, getattr(self, name)))
+            self.execute_action = profiler.wrap_action(self.execute_action)
+        # 对局轨迹（默认关闭）：game_trace.GameTracer 同样以实例属性包装各阶段方法
+        if tracer is not None:
+            tracer.attach(self)
+    
+    def seed(self, seed: int):
+        """为下一局播种（两种随机流模式通用）"""
+        if self.streams is not None:
+            self.streams.start_game(seed)
+        else:
+            self.rng.seed(seed)
     
     def init_players(self) -> List[Player]:
-        """初始化玩家"""
-        roles = list(Role)
-        players = []
-        
-        init_resources = {
-            Role.FARMER: self.config.init_farmer,
-            Role.MERCHANT: self.config.init_merchant,
-            Role.SCHOLAR: self.config.init_scholar,
-            Role.MONK: self.config.init_monk,
-        }
+        """初始化玩家（玩家下标与职业编码一致）"""
+        init_resources = (
+            self.config.init_farmer,
+            self.config.init_merchant,
+            self.config.init_scholar,
+            self.config.init_monk,
+        )
         
-        for role in roles:
-            w, m, h = init_resources[role]
-            player = Player(role=role, wealth=w, merit=m, hui=h)
-            players.append(player)
+        players = []
+        for role, (w, m, h) in enumerate(init_resources):
+            players.append(Player(role=role, index=role, wealth=w, merit=m, hui=h))
         
         return players
     
     def apply_faith_choice(self, player: Player, state: GameState):
         """应用信仰选择"""
-        faith, refuge_round, sacrifice = AIDecision.choose_faith(player, state)
+        faith, refuge_round, sacrifice = AIDecision.choose_faith(player, state, self.player_rngs[player.index])
         player.faith = faith
         player.refuge_round = refuge_round if refuge_round else 0
         player.sacrifice = sacrifice
         
         # 不皈依开局奖励
-        if faith == FaithState.SECULAR:
+        if faith == SECULAR:
             player.wealth += self.config.secular_init_wealth
         
         # 皈依开局奖励（第1回合皈依）
@@ -496,12 +958,12 @@ class GameEngine:
             player.hui += h
             
             # 大乘舍离
-            if faith == FaithState.MAHAYANA and sacrifice:
-                if sacrifice == SacrificeType.WEALTH:
+            if faith == MAHAYANA and sacrifice != NO_SACRIFICE:
+                if sacrifice == SAC_WEALTH:
                     player.wealth -= self.config.sacrifice_wealth
-                elif sacrifice == SacrificeType.MERIT:
+                elif sacrifice == SAC_MERIT:
                     player.merit -= self.config.sacrifice_merit
-                elif sacrifice == SacrificeType.WISDOM:
+                elif sacrifice == SAC_WISDOM:
                     player.hui -= self.config.sacrifice_wisdom
                 
                 # 确保不为负
@@ -511,7 +973,7 @@ class GameEngine:
     
     def check_mid_game_refuge(self, player: Player, state: GameState):
         """检查中途皈依"""
-        if player.faith != FaithState.SECULAR:
+        if player.faith != SECULAR:
             return
         if player.refuge_round == 0:
             return
@@ -531,65 +993,48 @@ class GameEngine:
         
         player.merit += m
         player.hui += h
-        player.faith = FaithState.REFUGE
+        player.faith = REFUGE
         
         # 失去不皈依效果（已经获得的资粮保留）
     
-    def execute_action(self, player: Player, action: ActionType, state: GameState):
+    def execute_action(self, player: Player, action: int, state: GameState):
         """执行行动"""
         config = self.config
+        tables = self.tables
         
-        if action == ActionType.LABOR:
-            gain = config.labor_base
-            if player.role == Role.FARMER:
-                gain += config.labor_farmer_bonus
-            if player.faith == FaithState.SECULAR:
-                gain += config.secular_labor_bonus
-            player.wealth += gain
+        if action == LABOR:
+            # 职业/不皈依加成已并入查表
+            player.wealth += tables.labor_gain[player.role][player.faith]
             player.labor_count += 1
         
-        elif action == ActionType.PRACTICE:
-            gain = config.practice_base
-            if player.role == Role.SCHOLAR:
-                gain += config.practice_scholar_bonus
-            # v5.5: 不皈依修行加成
-            if player.faith == FaithState.SECULAR:
-                gain += config.secular_practice_bonus
-            player.hui += gain
+        elif action == PRACTICE:
+            # v5.5: 不皈依修行加成已并入查表
+            player.hui += tables.practice_gain[player.role][player.faith]
             player.practice_count += 1
         
-        elif action == ActionType.DONATE:
+        elif action == DONATE:
             if player.wealth >= config.donate_cost:
                 player.wealth -= config.donate_cost
-                merit_gain = config.donate_merit
-                if player.role == Role.MERCHANT:
-                    merit_gain += config.donate_merchant_bonus
-                player.merit += merit_gain
+                player.merit += tables.donate_merit[player.role]
                 state.calamity -= config.donate_calamity
                 
                 # 大乘舍资加成
-                if player.sacrifice == SacrificeType.WEALTH:
+                if player.sacrifice == SAC_WEALTH:
                     state.calamity -= config.sacrifice_wealth_donate_calamity
                 
                 player.donate_count += 1
                 player.help_count += 1
         
-        elif action == ActionType.SAVE:
+        elif action == SAVE:
             if state.beings_in_play and player.hui >= config.save_hui_requirement:
                 being_idx = state.beings_in_play[0]
-                cost = config.being_costs[being_idx]
-                
-                if player.role == Role.MONK:
-                    cost -= config.save_monk_cost_reduce
-                if player.faith == FaithState.SECULAR:
-                    cost -= config.secular_save_cost_reduce
-                
-                cost = max(1, cost)
+                # 僧侣/不皈依减免与最低成本1已并入查表
+                cost = tables.save_cost[being_idx][player.role][player.faith]
                 
                 # 僧侣可用功德代资（最多2点）
                 merit_substitute = 0
                 actual_wealth_cost = cost
-                if player.role == Role.MONK and player.wealth < cost:
+                if player.role == MONK and player.wealth < cost:
                     merit_substitute = min(2, cost - player.wealth, player.merit)
                     actual_wealth_cost = cost - merit_substitute
                 
@@ -599,15 +1044,15 @@ class GameEngine:
                         player.merit -= merit_substitute
                         player.monk_merit_substitute += merit_substitute
                     
-                    merit_gain = config.being_merit_rewards[being_idx]
-                    hui_gain = config.being_hui_rewards[being_idx]
+                    merit_gain = tables.being_merit[being_idx]
+                    hui_gain = tables.being_hui[being_idx]
                     
                     # 福田加成
-                    if config.being_is_futian[being_idx] and player.faith in [FaithState.REFUGE, FaithState.MAHAYANA]:
+                    if tables.being_futian[being_idx] and player.faith != SECULAR:
                         merit_gain += config.refuge_futian_bonus
                     
                     # 大乘舍功德加成
-                    if player.sacrifice == SacrificeType.MERIT:
+                    if player.sacrifice == SAC_MERIT:
                         merit_gain += config.sacrifice_merit_save_merit
                     
                     # v5.6/v5.7: 护法祝福加成
@@ -618,12 +1063,12 @@ class GameEngine:
                         merit_gain += blessing_bonus
                     
                     # 商人首次渡化+2资
-                    if player.role == Role.MERCHANT and not player.merchant_first_save:
+                    if player.role == MERCHANT and not player.merchant_first_save:
                         player.wealth += 2
                         player.merchant_first_save = True
                     
                     # v5.7: 商人经济渡化额外功德（慧不足时用双倍资粮渡化）
-                    if player.role == Role.MERCHANT and player.hui < config.save_hui_requirement:
+                    if player.role == MERCHANT and player.hui < config.save_hui_requirement:
                         merit_gain += config.merchant_economic_save_merit_bonus
                     
                     player.merit += merit_gain
@@ -636,15 +1081,12 @@ class GameEngine:
                     state.beings_in_play.pop(0)
                     state.being_timers.pop(0)
         
-        elif action == ActionType.PROTECT:
+        elif action == PROTECT:
             # v5.7: 僧侣护法专精 - 成本和收益不同
-            protect_cost = config.monk_protect_cost if player.role == Role.MONK else config.protect_cost
+            protect_cost = tables.protect_cost[player.role]
             if player.wealth >= protect_cost:
                 player.wealth -= protect_cost
-                merit_gain = config.protect_merit
-                # v5.7: 僧侣额外功德
-                if player.role == Role.MONK:
-                    merit_gain += config.monk_protect_merit_bonus
+                merit_gain = tables.protect_merit[player.role]  # 含 v5.7 僧侣额外功德
                 # v5.5: 危机加成
                 if state.calamity >= config.protect_crisis_threshold:
                     merit_gain += config.protect_crisis_bonus
@@ -654,75 +1096,73 @@ class GameEngine:
                 player.help_count += 1
                 # v5.6/v5.7: 护法祝福 (僧侣祝福效果更强，在渡化时判断)
                 state.protect_blessing_active = True
-                state.protect_blessing_monk = (player.role == Role.MONK)
+                state.protect_blessing_monk = (player.role == MONK)
         
-        elif action == ActionType.MUTUAL_AID:
+        elif action == MUTUAL_AID:
             # v5.7新增: 互助行动
             if player.mutual_aid_used < config.mutual_aid_max_uses:
                 player.mutual_aid_used += 1
-                # AI模拟：随机选择一个有资源的队友
-                other_players = [p for p in state.players if p != player]
-                helper = random.choice(other_players) if other_players else None
-                if helper:
-                    # AI决策：根据资源情况决定是否帮助
-                    help_type = None
-                    if helper.wealth >= config.mutual_aid_wealth_transfer + 2:
-                        help_type = "wealth"
-                    elif helper.hui >= config.mutual_aid_hui_transfer + 2:
-                        help_type = "hui"
-                    
-                    if help_type == "wealth":
-                        helper.wealth -= config.mutual_aid_wealth_transfer
-                        player.wealth += config.mutual_aid_wealth_transfer
-                        helper.merit += config.mutual_aid_merit_bonus
-                        player.merit += config.mutual_aid_merit_bonus
-                        helper.mutual_aid_given += 1
-                    elif help_type == "hui":
-                        helper.hui -= config.mutual_aid_hui_transfer
-                        player.hui += config.mutual_aid_hui_transfer
-                        helper.merit += config.mutual_aid_merit_bonus
-                        player.merit += config.mutual_aid_merit_bonus
-                        helper.mutual_aid_given += 1
+                # AI模拟：随机选择一个有资源的队友（按下标选取）
+                helper = state.players[self.player_rngs[player.index].choice(OTHER_PLAYERS[player.index])]
+                # AI决策：根据资源情况决定是否帮助
+                help_type = None
+                if helper.wealth >= config.mutual_aid_wealth_transfer + 2:
+                    help_type = "wealth"
+                elif helper.hui >= config.mutual_aid_hui_transfer + 2:
+                    help_type = "hui"
+                
+                if help_type == "wealth":
+                    helper.wealth -= config.mutual_aid_wealth_transfer
+                    player.wealth += config.mutual_aid_wealth_transfer
+                    helper.merit += config.mutual_aid_merit_bonus
+                    player.merit += config.mutual_aid_merit_bonus
+                    helper.mutual_aid_given += 1
+                elif help_type == "hui":
+                    helper.hui -= config.mutual_aid_hui_transfer
+                    player.hui += config.mutual_aid_hui_transfer
+                    helper.merit += config.mutual_aid_merit_bonus
+                    player.merit += config.mutual_aid_merit_bonus
+                    helper.mutual_aid_given += 1
         
         # 大乘舍慧加成
-        if player.sacrifice == SacrificeType.WISDOM and action in [ActionType.DONATE, ActionType.SAVE, ActionType.PROTECT]:
+        if player.sacrifice == SAC_WISDOM and action in HELP_ACTIONS:
             player.hui += config.sacrifice_wisdom_help_hui
         
         state.calamity = max(0, state.calamity)
     
     def process_collective_event(self, state: GameState):
         """处理集体事件"""
-        r = random.random()
-        
-        # 人间炼狱模式使用更高的灾难权重
-        disaster_weight = self.config.hell_disaster_weight if self.config.hell_mode else self.config.disaster_weight
-        misfortune_weight = self.config.misfortune_weight * (0.5 if self.config.hell_mode else 1.0)
-        
-        if r < disaster_weight:
-            # 人间炼狱模式使用更高劫难
-            if self.config.hell_mode:
-                base = self.config.hell_disaster_calamity
-                # 护法令：本回合护法次数减劫难（激励护法）
-                # 注意：这里简化为随机模拟护法效果
-            else:
-                base = getattr(self.config, 'disaster_base_calamity_adj', self.config.disaster_base_calamity)
-            state.calamity += base
+        rng = self.event_rng
+        r = rng.random()
+        
+        # 权重、劫难值与合作率已按 hell_mode 预计算
+        tables = self.tables
+        
+        controls = state.controls
+        if controls is not None:
+            controls[0] -= tables.disaster_weight
+            controls[1] -= 1.0 - tables.misfortune_cutoff
+        
+        if r < tables.disaster_weight:
+            # 护法令（人间炼狱）：简化为随机模拟护法效果
+            state.calamity += tables.disaster_base
             # 简化：假设玩家合作降低一些（人间炼狱模式合作效果减半）
-            coop_rate = 0.3 if self.config.hell_mode else 0.5
-            coop = sum(1 for p in state.players if random.random() < coop_rate)
+            coop_rate = tables.coop_rate
+            coop = sum(1 for p in state.players if rng.random() < coop_rate)
             state.calamity -= coop
-        elif r < disaster_weight + misfortune_weight:
-            if self.config.hell_mode:
-                base = self.config.hell_disaster_calamity - 3  # 人祸略低
-            else:
-                base = getattr(self.config, 'misfortune_base_calamity_adj', self.config.misfortune_base_calamity)
-            state.calamity += base
+            if controls is not None:
+                controls[0] += 1
+                controls[2] += coop - coop_rate * len(state.players)
+        elif r < tables.misfortune_cutoff:
+            state.calamity += tables.misfortune_base  # 人间炼狱：人祸略低
         else:
             # 功德事件（人间炼狱模式较少出现）
             for p in state.players:
                 p.merit += 1
-                if p.faith in [FaithState.REFUGE, FaithState.MAHAYANA]:
+                if p.faith != SECULAR:
                     p.merit += 1  # 皈依者额外效果
+            if controls is not None:
+                controls[1] += 1
         
         state.calamity = max(0, state.calamity)
     
@@ -745,20 +1185,23 @@ class GameEngine:
         
         # 补充众生
         while len(state.beings_in_play) < 2:
-            new_being = random.randint(0, len(self.config.being_costs) - 1)
+            new_being = self.being_rng.randint(0, len(self.config.being_costs) - 1)
             state.beings_in_play.append(new_being)
             state.being_timers.append(0)
+            if state.controls is not None:
+                costs = self.tables.being_costs
+                state.controls[3] += costs[new_being] - sum(costs) / len(costs)
     
     def process_round_end(self, state: GameState):
         """回合结束处理"""
         # 皈依者每回合+1功德
         for p in state.players:
-            if p.faith in [FaithState.REFUGE, FaithState.MAHAYANA]:
+            if p.faith != SECULAR:
                 p.merit += self.config.refuge_merit_per_round
         
         # 大乘行持检查
         for p in state.players:
-            if p.faith == FaithState.MAHAYANA:
+            if p.faith == MAHAYANA:
                 if p.help_count == 0:
                     p.merit -= 1
                     p.mahayana_penalty += 1
@@ -768,7 +1211,7 @@ class GameEngine:
         if state.current_round % 2 == 0:
             for p in state.players:
                 # 不皈依者仅4、6回合消耗
-                if p.faith == FaithState.SECULAR and state.current_round == 2:
+                if p.faith == SECULAR and state.current_round == 2:
                     continue
                 if p.wealth > 0:
                     p.wealth -= 1
@@ -784,22 +1227,22 @@ class GameEngine:
         vow = player.vow
         config = self.config
         
-        if vow == Vow.DILIGENT:
+        if vow == VOW_DILIGENT:
             return player.merit >= config.vow_diligent_merit
-        elif vow == Vow.POOR_GIRL:
+        elif vow == VOW_POOR_GIRL:
             return player.merit >= config.vow_poor_girl_merit and player.wealth <= config.vow_poor_girl_wealth
-        elif vow == Vow.CHARITY:
+        elif vow == VOW_CHARITY:
             return player.donate_count >= config.vow_charity_donate
-        elif vow == Vow.GREAT_MERCHANT:
+        elif vow == VOW_GREAT_MERCHANT:
             return player.merit >= config.vow_great_merchant_merit and player.save_count >= config.vow_great_merchant_save
-        elif vow == Vow.TEACHING:
+        elif vow == VOW_TEACHING:
             # v5.4: 需使用过主动技能
             return player.hui >= config.vow_teaching_hui and player.scholar_skill_used >= 1
-        elif vow == Vow.MASTER:
+        elif vow == VOW_MASTER:
             return player.merit >= config.vow_master_merit and player.hui >= config.vow_master_hui
-        elif vow == Vow.ARHAT:
+        elif vow == VOW_ARHAT:
             return player.hui >= config.vow_arhat_hui
-        elif vow == Vow.BODHISATTVA:
+        elif vow == VOW_BODHISATTVA:
             return player.merit >= config.vow_bodhisattva_merit and player.save_count >= config.vow_bodhisattva_save
         return False
     
@@ -808,28 +1251,25 @@ class GameEngine:
         bvow = player.bodhisattva_vow
         config = self.config
         
-        if bvow == BodhisattvaVow.KSITIGARBHA:
+        if bvow == KSITIGARBHA:
             # v5.4: 需劫难≤4 且 主动承受≥2次
             return (state.calamity <= config.bvow_ksitigarbha_calamity and 
                     player.ksitigarbha_absorb_count >= config.bvow_ksitigarbha_absorb)
-        elif bvow == BodhisattvaVow.AVALOKITESVARA:
+        elif bvow == AVALOKITESVARA:
             # v5.4: 帮助≥9次
             total_help = player.donate_count + player.save_count + player.protect_count
             return total_help >= config.bvow_avalokitesvara_help
-        elif bvow == BodhisattvaVow.SAMANTABHADRA:
+        elif bvow == SAMANTABHADRA:
             return player.donate_count >= config.bvow_samantabhadra_donate and state.total_saves >= config.bvow_samantabhadra_save
-        elif bvow == BodhisattvaVow.MANJUSRI:
+        elif bvow == MANJUSRI:
             # 文殊愿：渡化≥3次 且 帮助≥6次（智慧度众）
             total_help = player.donate_count + player.save_count + player.protect_count
             return player.save_count >= config.bvow_manjusri_assist and total_help >= 6
         return False
     
     def get_karma_multiplier(self, calamity: int) -> float:
-        """v6.0: 获取共业倍率"""
-        for threshold, multiplier in self.config.karma_multiplier_levels:
-            if calamity <= threshold:
-                return multiplier
-        return 1.0  # 默认×1.0
+        """v6.0: 获取共业倍率（超出各档位时默认×1.0）"""
+        return self.tables.karma(calamity)
     
     def calculate_personal_score(self, player: Player, team_win: bool, vow_achieved: bool, bvow_achieved: bool, calamity: int = 0) -> int:
         """计算个人得分 (v6.0更新：加入共业倍率)"""
@@ -840,30 +1280,17 @@ class GameEngine:
         
         # v5.7: 商人"财施等于法施" - 布施≥4次终局慧+3
         effective_hui = player.hui
-        if player.role == Role.MERCHANT and player.donate_count >= config.merchant_donate_threshold:
+        if player.role == MERCHANT and player.donate_count >= config.merchant_donate_threshold:
             effective_hui += config.merchant_donate_hui_bonus
         
         # v5.8: 农夫"勤劳积德" - 劳作≥5次终局功德+2
         effective_merit = player.merit
-        if player.role == Role.FARMER and player.labor_count >= 5:
-            effective_merit += 2
+        if player.role == FARMER and player.labor_count >= config.farmer_labor_threshold:
+            effective_merit += config.farmer_labor_merit_bonus
         
         # 1. 基础分（功德+慧查表）
-        total = effective_merit + effective_hui  # v5.8: 使用effective_merit
-        if total >= 35:
-            base_score = 65
-        elif total >= 30:
-            base_score = 55
-        elif total >= 25:
-            base_score = 45
-        elif total >= 20:
-            base_score = 35
-        elif total >= 15:
-            base_score = 25
-        elif total >= 10:
-            base_score = 15
-        else:
-            base_score = 10
+        tables = self.tables
+        base_score = tables.base_score(effective_merit + effective_hui)  # v5.8: 使用effective_merit
         
         # 2. 平衡惩罚：功德<5或慧<5时减半
         if effective_merit < 5 or effective_hui < 5:  # v5.8: 使用effective值
@@ -871,19 +1298,14 @@ class GameEngine:
         
         # 3. 发愿奖惩
         vow_score = 0
-        if player.vow:
-            vow_name = player.vow.value
-            if vow_name in config.vow_scores:
-                success_score, fail_score = config.vow_scores[vow_name]
-                vow_score = success_score if vow_achieved else fail_score
+        if player.vow != NO_VOW:
+            vow_score = tables.vow_success[player.vow] if vow_achieved else tables.vow_fail[player.vow]
         
         # 4. 菩萨愿奖惩（仅大乘）
         bvow_score = 0
-        if player.bodhisattva_vow:
-            bvow_name = player.bodhisattva_vow.value
-            if bvow_name in config.bvow_scores:
-                success_score, fail_score = config.bvow_scores[bvow_name]
-                bvow_score = success_score if bvow_achieved else fail_score
+        if player.bodhisattva_vow != NO_BVOW:
+            bvow = player.bodhisattva_vow
+            bvow_score = tables.bvow_success[bvow] if bvow_achieved else tables.bvow_fail[bvow]
         
         # 5. 英雄标记
         hero_score = player.hero_marks * 5
@@ -896,25 +1318,39 @@ class GameEngine:
         final_score = int(raw_score * karma_multiplier)
         return max(0, final_score)
     
+    def end_state(self, state: GameState) -> Tuple:
+        """紧凑终局状态：(终局劫难, 团队渡化, 各玩家按 END_STATE_PLAYER_FIELDS 的整数元组)"""
+        return (
+            state.calamity,
+            state.total_saves,
+            tuple(tuple(getattr(p, name) for name in END_STATE_PLAYER_FIELDS) for p in state.players),
+        )
+    
     def run_game(self) -> Dict:
         """运行一局游戏"""
+        player_rngs = self.player_rngs
+        streams = self.streams
         players = self.init_players()
-        state = GameState(config=self.config, players=players)
+        state = GameState(config=self.config, players=players, tables=self.tables)
+        if self.record_controls:
+            state.controls = [0.0] * len(CONTROL_NAMES)
         
         # 初始众生
         state.beings_in_play = [0, 1]
         state.being_timers = [0, 0]
         
         # 选择信仰和发愿
-        for p in players:
-            self.apply_faith_choice(p, state)
-            p.vow = AIDecision.choose_vow(p)
-            if p.faith == FaithState.MAHAYANA:
-                p.bodhisattva_vow = AIDecision.choose_bodhisattva_vow(p)
-        
+        self.choose_setup(state)
+
+        choosers = self.choosers
+        if self.profiler is not None:
+            choosers = tuple(self.profiler.wrap("choose_action", chooser) for chooser in choosers)
+
         # 游戏循环
         for round_num in range(1, self.config.total_rounds + 1):
             state.current_round = round_num
+            if streams is not None:
+                streams.start_round(round_num)
             
             # 检查中途皈依
             for p in players:
@@ -936,16 +1372,18 @@ class GameEngine:
             
             # 行动阶段（每人2行动）
             for p in players:
+                choose_action = choosers[p.role]
+                rng = player_rngs[p.index]
                 # v5.4: 模拟学者使用主动技能
-                if p.role == Role.SCHOLAR and p.scholar_skill_used < 2 and random.random() < 0.3:
+                if p.role == SCHOLAR and p.scholar_skill_used < 2 and rng.random() < 0.3:
                     p.scholar_skill_used += 1
                 
                 # v5.4: 模拟地藏愿主动承受
-                if p.bodhisattva_vow == BodhisattvaVow.KSITIGARBHA and random.random() < 0.25:
+                if p.bodhisattva_vow == KSITIGARBHA and rng.random() < 0.25:
                     p.ksitigarbha_absorb_count += 1
                 
                 for action_num in range(2):
-                    action = AIDecision.choose_action(p, state, 2 - action_num)
+                    action = choose_action(p, state, 2 - action_num, rng)
                     self.execute_action(p, action, state)
             
             # 回合结束
@@ -954,8 +1392,22 @@ class GameEngine:
             # 检查立即失败
             if state.calamity >= self.config.max_calamity:
                 break
-        
-        # 计算结果
+
+        return self.game_result(state)
+
+    def choose_setup(self, state: GameState):
+        """开局：各玩家选择信仰与发愿"""
+        player_rngs = self.player_rngs
+        for p in state.players:
+            self.apply_faith_choice(p, state)
+            rng = player_rngs[p.index]
+            p.vow = AIDecision.choose_vow(p, rng)
+            if p.faith == MAHAYANA:
+                p.bodhisattva_vow = AIDecision.choose_bodhisattva_vow(p, rng)
+
+    def game_result(self, state: GameState) -> Dict:
+        """终局计分并构造结果字典"""
+        players = state.players
         team_win = state.calamity <= self.config.win_calamity and state.total_saves >= self.config.win_save
         
         result = {
@@ -966,22 +1418,22 @@ class GameEngine:
         }
         
         for p in players:
-            vow_achieved = self.check_vow(p, state) if p.vow else False
-            bvow_achieved = self.check_bodhisattva_vow(p, state) if p.bodhisattva_vow else False
+            vow_achieved = self.check_vow(p, state) if p.vow != NO_VOW else False
+            bvow_achieved = self.check_bodhisattva_vow(p, state) if p.bodhisattva_vow != NO_BVOW else False
             
             # v6.0: 计算个人得分（含共业倍率）
             personal_score = self.calculate_personal_score(p, team_win, vow_achieved, bvow_achieved, state.calamity)
             
             player_result = {
-                "role": p.role.value,
-                "faith": p.faith.value,
-                "sacrifice": p.sacrifice.value if p.sacrifice else None,
+                "role": ROLES[p.role].value,
+                "faith": FAITHS[p.faith].value,
+                "sacrifice": SACRIFICES[p.sacrifice].value if p.sacrifice != NO_SACRIFICE else None,
                 "wealth": p.wealth,
                 "merit": p.merit,
                 "hui": p.hui,
-                "vow": p.vow.value if p.vow else None,
+                "vow": VOWS[p.vow].value if p.vow != NO_VOW else None,
                 "vow_achieved": vow_achieved,
-                "bodhisattva_vow": p.bodhisattva_vow.value if p.bodhisattva_vow else None,
+                "bodhisattva_vow": BVOWS[p.bodhisattva_vow].value if p.bodhisattva_vow != NO_BVOW else None,
                 "bvow_achieved": bvow_achieved,
                 "personal_score": personal_score,  # v5.7新增
                 "hero_marks": p.hero_marks,         # v5.7新增
@@ -1010,252 +1462,692 @@ class GameEngine:
             for p in result["players"]:
                 p["rank"] = 0  # 团队失败无排名
         
+        if self.record_end_state:
+            result["end_state"] = self.end_state(state)
+        if state.controls is not None:
+            result["controls"] = state.controls
+        
+        return result
+
+# ============== 方差缩减 ==============
+
+def _solve(matrix: List[List[float]], vector: List[float]) -> List[float]:
+    """高斯消元解小型线性方程组（主元过小的维度系数取 0，即丢弃近似共线的控制变量）"""
+    n = len(vector)
+    a = [list(row) + [vector[i]] for i, row in enumerate(matrix)]
+    scale = max((abs(a[i][i]) for i in range(n)), default=0.0)
+    used = []
+    for col in range(n):
+        pivot = max(range(col, n), key=lambda i: abs(a[i][col]))
+        if abs(a[pivot][col]) <= 1e-12 * max(scale, 1e-300):
+            continue
+        a[col], a[pivot] = a[pivot], a[col]
+        for i in range(n):
+            if i != col and a[i][col]:
+                factor = a[i][col] / a[col][col]
+                for j in range(col, n + 1):
+                    a[i][j] -= factor * a[col][j]
+        used.append(col)
+    return [a[i][n] / a[i][i] if i in used else 0.0 for i in range(n)]
+
+def _cv_outcomes(result: Dict) -> List[float]:
+    """一局的修正对象，顺序同 CV_OUTCOMES"""
+    players = result["players"]
+    values = [float(result["team_win"]), result["final_calamity"], result["total_saves"]]
+    values.extend(1.0 if p.get("rank") == 1 else 0.0 for p in players)
+    values.extend(p["personal_score"] for p in players)
+    return values
+
+# 玩家下标与职业编码一致，逐局结果的 players 按职业顺序排列
+CV_OUTCOMES = (("team_win_rate", "avg_calamity", "avg_saves")
+               + tuple(f"first_rate/{role.value}" for role in ROLES)
+               + tuple(f"avg_score/{role.value}" for role in ROLES))
+
+class ControlVariateAccumulator:
+    """控制变量回归修正的可合并聚合
+
+    以“单元”为独立样本：普通抽样一局一个单元，对偶抽样一对（普通局+对偶局的均值）一个单元。
+    累计各指标 y 与控制变量 c 的一阶、二阶矩，finalize() 时按
+      修正估计 = mean(y) − β·mean(c)，β = Cov(c)⁻¹·Cov(c, y)
+    给出估计值与标准误（控制变量期望为 0；β 由同一样本估计，偏差为 O(1/n)）。
+    另按逐局矩计算同局数独立抽样的标准误，作为方差缩减倍数的基准。
+    """
+    
+    def __init__(self, antithetic: bool = False):
+        self.antithetic = antithetic
+        k, m = len(CV_OUTCOMES), len(CONTROL_NAMES)
+        self.games = 0
+        self.game_sum = [0.0] * k
+        self.game_sq = [0.0] * k
+        self.units = 0
+        self.sum_y = [0.0] * k
+        self.sum_c = [0.0] * m
+        self.sum_yy = [0.0] * k
+        self.sum_yc = [[0.0] * m for _ in range(k)]
+        self.sum_cc = [[0.0] * m for _ in range(m)]
+        self.pending = None  # 对偶抽样中等待配对的普通局 (y, c)
+    
+    def update(self, result: Dict):
+        y = _cv_outcomes(result)
+        c = result["controls"]
+        self.games += 1
+        for i, v in enumerate(y):
+            self.game_sum[i] += v
+            self.game_sq[i] += v * v
+        if self.antithetic:
+            if self.pending is None:
+                self.pending = (y, c)
+                return
+            y0, c0 = self.pending
+            self.pending = None
+            y = [(a + b) / 2 for a, b in zip(y0, y)]
+            c = [(a + b) / 2 for a, b in zip(c0, c)]
+        self.units += 1
+        for j, cj in enumerate(c):
+            self.sum_c[j] += cj
+            row = self.sum_cc[j]
+            for l, cl in enumerate(c):
+                row[l] += cj * cl
+        for i, yi in enumerate(y):
+            self.sum_y[i] += yi
+            self.sum_yy[i] += yi * yi
+            row = self.sum_yc[i]
+            for j, cj in enumerate(c):
+                row[j] += yi * cj
+    
+    def merge(self, other: "ControlVariateAccumulator"):
+        """合并另一个分片（分片边界须与对偶对对齐）"""
+        if self.pending is not None or other.pending is not None:
+            raise ValueError("对偶抽样的分片边界必须落在偶数局号上")
+        self.games += other.games
+        self.units += other.units
+        for name in ("game_sum", "game_sq", "sum_y", "sum_c", "sum_yy"):
+            mine = getattr(self, name)
+            for i, v in enumerate(getattr(other, name)):
+                mine[i] += v
+        for name in ("sum_yc", "sum_cc"):
+            for mine, theirs in zip(getattr(self, name), getattr(other, name)):
+                for j, v in enumerate(theirs):
+                    mine[j] += v
+        return self
+    
+    def finalize(self) -> Dict[str, Dict[str, float]]:
+        """各指标：{"plain": 样本均值, "plain_se", "iid_se": 同局数独立抽样标准误,
+        "estimate": 控制变量修正估计, "se", "reduction": iid_se² / se²}"""
+        n, m = self.units, len(CONTROL_NAMES)
+        if n <= m + 1:
+            return {}
+        mean_c = [v / n for v in self.sum_c]
+        cov_cc = [[(self.sum_cc[j][l] - n * mean_c[j] * mean_c[l]) / (n - 1) for l in range(m)]
+                  for j in range(m)]
+        result = {}
+        for i, name in enumerate(CV_OUTCOMES):
+            mean_y = self.sum_y[i] / n
+            var_y = max(0.0, (self.sum_yy[i] - n * mean_y * mean_y) / (n - 1))
+            cov_yc = [(self.sum_yc[i][j] - n * mean_y * mean_c[j]) / (n - 1) for j in range(m)]
+            beta = _solve(cov_cc, cov_yc)
+            explained = sum(b * v for b, v in zip(beta, cov_yc))
+            residual = max(0.0, var_y - explained) * (n - 1) / (n - 1 - m)
+            game_mean = self.game_sum[i] / self.games
+            game_var = max(0.0, (self.game_sq[i] - self.games * game_mean ** 2) / (self.games - 1))
+            se = (residual / n) ** 0.5
+            iid_se = (game_var / self.games) ** 0.5
+            result[name] = {
+                "plain": mean_y,
+                "plain_se": (var_y / n) ** 0.5,
+                "iid_se": iid_se,
+                "estimate": mean_y - sum(b * v for b, v in zip(beta, mean_c)),
+                "se": se,
+                "reduction": iid_se ** 2 / se ** 2 if se > 0 else float("inf"),
+            }
         return result
 
 # ============== 统计分析器 ==============
 
-class BalanceAnalyzer:
-    def __init__(self, config: GameConfig, num_simulations: int = 5000):
-        self.config = config
-        self.num_simulations = num_simulations
-        self.results = []
+def _new_role_stats() -> Dict:
+    return {
+        "count": 0,
+        "avg_merit": 0,
+        "avg_hui": 0,
+        "avg_wealth": 0,
+        "vow_achieved": 0,
+        "avg_labor": 0,
+        "avg_practice": 0,
+        "avg_donate": 0,
+        "avg_save": 0,
+        "avg_protect": 0,
+        "avg_score": 0,      # v5.7新增
+        "first_place": 0,    # v5.7新增
+        "scores": Counter(), # 得分直方图（得分→次数），用于方差/中位数，可直接合并
+        "rank_1": 0,         # 第1名次数
+        "rank_2": 0,         # 第2名次数
+        "rank_3": 0,         # 第3名次数
+        "rank_4": 0,         # 第4名次数
+    }
+
+def _new_faith_stats() -> Dict:
+    return {"count": 0, "avg_merit": 0, "avg_hui": 0, "vow_achieved": 0}
+
+def _new_sacrifice_stats() -> Dict:
+    return {"count": 0, "avg_merit": 0, "vow_achieved": 0, "bvow_achieved": 0}
+
+def _new_vow_stats() -> Dict:
+    return {"count": 0, "achieved": 0, "rate": 0}
+
+class BalanceAccumulator:
+    """可合并的部分聚合：只保存计数与求和，不保存逐局结果
+
+    多进程分片各自累加后 merge，finalize() 得到与 analyze() 相同的统计。
+    得分为小整数，按直方图累计即可精确得到均值、方差、中位数与极值，
+    占用只取决于得分取值个数，与局数无关。
+    controls=True 时另带 ControlVariateAccumulator（逐局结果须含 "controls"）。
+    profile=True 时另带 PhaseProfiler，由模拟该分片的引擎写入，随分片合并。
+    """
     
-    def run_simulations(self):
-        """运行模拟"""
-        engine = GameEngine(self.config)
-        for i in range(self.num_simulations):
-            if (i + 1) % 1000 == 0:
-                print(f"  模拟进度: {i+1}/{self.num_simulations}")
-            result = engine.run_game()
-            self.results.append(result)
+    def __init__(self, controls: bool = False, antithetic: bool = False, profile: bool = False):
+        self.controls = ControlVariateAccumulator(antithetic) if controls else None
+        self.profile = PhaseProfiler() if profile else None
+        self.games = 0
+        self.team_wins = 0
+        self.total_calamity = 0
+        self.total_saves = 0
+        self.total_donate = 0
+        self.total_save_actions = 0
+        self.total_protect = 0
+        self.total_mahayana = 0
+        self.total_mahayana_penalty = 0
+        self.by_role = defaultdict(_new_role_stats)
+        self.by_faith = defaultdict(_new_faith_stats)
+        self.by_sacrifice = defaultdict(_new_sacrifice_stats)
+        self.by_vow = defaultdict(_new_vow_stats)
+        self.by_bvow = defaultdict(_new_vow_stats)
     
-    def analyze(self) -> Dict:
-        """分析结果"""
-        stats = {
-            "total_games": len(self.results),
-            "team_wins": 0,
-            "team_win_rate": 0,
-            "avg_calamity": 0,
-            "avg_saves": 0,
+    def update(self, result: Dict):
+        """累加一局结果"""
+        self.games += 1
+        if result["team_win"]:
+            self.team_wins += 1
+        self.total_calamity += result["final_calamity"]
+        self.total_saves += result["total_saves"]
+        if self.controls is not None:
+            self.controls.update(result)
+        
+        for p in result["players"]:
+            role = p["role"]
+            faith = p["faith"]
+            sacrifice = p["sacrifice"]
+            vow = p["vow"]
+            bvow = p["bodhisattva_vow"]
             
-            # 按职业统计（含行动模式、得分、排名）
-            "by_role": defaultdict(lambda: {
-                "count": 0,
-                "avg_merit": 0,
-                "avg_hui": 0,
-                "avg_wealth": 0,
-                "vow_achieved": 0,
-                "avg_labor": 0,
-                "avg_practice": 0,
-                "avg_donate": 0,
-                "avg_save": 0,
-                "avg_protect": 0,
-                "avg_score": 0,      # v5.7新增
-                "first_place": 0,    # v5.7新增
-                "scores": [],        # v5.7新增：存储所有得分用于计算方差
-                "rank_1": 0,         # 第1名次数
-                "rank_2": 0,         # 第2名次数
-                "rank_3": 0,         # 第3名次数
-                "rank_4": 0,         # 第4名次数
-            }),
+            # 职业统计（含行动模式）
+            r = self.by_role[role]
+            r["count"] += 1
+            r["avg_merit"] += p["merit"]
+            r["avg_hui"] += p["hui"]
+            r["avg_wealth"] += p["wealth"]
+            r["avg_labor"] += p["labor_count"]
+            r["avg_practice"] += p["practice_count"]
+            r["avg_donate"] += p["donate_count"]
+            r["avg_save"] += p["save_count"]
+            r["avg_protect"] += p["protect_count"]
+            r["avg_score"] += p["personal_score"]  # v5.7
+            r["scores"][p["personal_score"]] += 1  # v5.7: 存储得分
+            # v5.7: 排名统计
+            rank = p.get("rank", 0)
+            if rank == 1:
+                r["first_place"] += 1
+                r["rank_1"] += 1
+            elif rank == 2:
+                r["rank_2"] += 1
+            elif rank == 3:
+                r["rank_3"] += 1
+            elif rank == 4:
+                r["rank_4"] += 1
+            if p["vow_achieved"]:
+                r["vow_achieved"] += 1
             
-            # 按信仰统计
-            "by_faith": defaultdict(lambda: {
-                "count": 0,
-                "avg_merit": 0,
-                "avg_hui": 0,
-                "vow_achieved": 0,
-            }),
+            # 信仰统计
+            f = self.by_faith[faith]
+            f["count"] += 1
+            f["avg_merit"] += p["merit"]
+            f["avg_hui"] += p["hui"]
+            if p["vow_achieved"]:
+                f["vow_achieved"] += 1
             
-            # 按舍离类型统计
-            "by_sacrifice": defaultdict(lambda: {
-                "count": 0,
-                "avg_merit": 0,
-                "vow_achieved": 0,
-                "bvow_achieved": 0,
-            }),
+            # 舍离统计
+            if sacrifice:
+                s = self.by_sacrifice[sacrifice]
+                s["count"] += 1
+                s["avg_merit"] += p["merit"]
+                if p["vow_achieved"]:
+                    s["vow_achieved"] += 1
+                if p["bvow_achieved"]:
+                    s["bvow_achieved"] += 1
             
-            # 按发愿统计
-            "by_vow": defaultdict(lambda: {
-                "count": 0,
-                "achieved": 0,
-                "rate": 0,
-            }),
+            # 发愿统计
+            if vow:
+                self.by_vow[vow]["count"] += 1
+                if p["vow_achieved"]:
+                    self.by_vow[vow]["achieved"] += 1
             
-            # 按菩萨愿统计
-            "by_bvow": defaultdict(lambda: {
-                "count": 0,
-                "achieved": 0,
-                "rate": 0,
-            }),
+            # 菩萨愿统计
+            if bvow:
+                self.by_bvow[bvow]["count"] += 1
+                if p["bvow_achieved"]:
+                    self.by_bvow[bvow]["achieved"] += 1
             
             # 行动统计
+            self.total_donate += p["donate_count"]
+            self.total_save_actions += p["save_count"]
+            self.total_protect += p["protect_count"]
+            
+            # 大乘惩罚
+            if faith == "大乘":
+                self.total_mahayana += 1
+                self.total_mahayana_penalty += p["mahayana_penalty"]
+    
+    def merge(self, other: "BalanceAccumulator"):
+        """合并另一个分片的部分聚合"""
+        for name in ("games", "team_wins", "total_calamity", "total_saves",
+                     "total_donate", "total_save_actions", "total_protect",
+                     "total_mahayana", "total_mahayana_penalty"):
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+        for name in ("by_role", "by_faith", "by_sacrifice", "by_vow", "by_bvow"):
+            mine = getattr(self, name)
+            for key, data in getattr(other, name).items():
+                target = mine[key]
+                for k, v in data.items():
+                    target[k] += v  # Counter 相加即直方图合并
+        if other.controls is not None:
+            if self.controls is None:
+                self.controls = ControlVariateAccumulator(other.controls.antithetic)
+            self.controls.merge(other.controls)
+        if other.profile is not None:
+            if self.profile is None:
+                self.profile = PhaseProfiler()
+            self.profile.merge(other.profile)
+        return self
+    
+    def proportions(self) -> Dict[str, Tuple[int, int]]:
+        """序贯抽样关心的比例指标：名称 → (成功数, 样本数)
+
+        名称为 team_win_rate、first_rate/职业、vow_rate/发愿、bvow_rate/菩萨愿。
+        """
+        result = {"team_win_rate": (self.team_wins, self.games)}
+        for role, data in self.by_role.items():
+            result[f"first_rate/{role}"] = (data["first_place"], data["count"])
+        for vow, data in self.by_vow.items():
+            result[f"vow_rate/{vow}"] = (data["achieved"], data["count"])
+        for bvow, data in self.by_bvow.items():
+            result[f"bvow_rate/{bvow}"] = (data["achieved"], data["count"])
+        return result
+    
+    def intervals(self, z: float = CI_Z) -> Dict[str, Tuple[float, float, float]]:
+        """各比例指标的置信区间：名称 → (估计值, 下限, 上限)"""
+        result = {}
+        for name, (successes, n) in self.proportions().items():
+            low, high = wilson_interval(successes, n, z)
+            result[name] = (successes / n if n else 0.0, low, high)
+        return result
+    
+    def finalize(self) -> Dict:
+        """由部分聚合计算最终统计（与 analyze() 输出结构一致）"""
+        n = self.games
+        stats = {
+            "total_games": n,
+            "team_wins": self.team_wins,
+            "team_win_rate": self.team_wins / n,
+            "avg_calamity": self.total_calamity / n,
+            "avg_saves": self.total_saves / n,
+            "by_role": defaultdict(_new_role_stats),
+            "by_faith": defaultdict(_new_faith_stats),
+            "by_sacrifice": defaultdict(_new_sacrifice_stats),
+            "by_vow": defaultdict(_new_vow_stats),
+            "by_bvow": defaultdict(_new_vow_stats),
             "action_stats": {
                 "avg_donate": 0,
                 "avg_save": 0,
                 "avg_protect": 0,
             },
-            
-            # 大乘行持惩罚
             "mahayana_penalty_rate": 0,
         }
         
-        total_calamity = 0
-        total_saves = 0
-        total_donate = 0
-        total_save_actions = 0
-        total_protect = 0
-        total_mahayana = 0
-        total_mahayana_penalty = 0
-        
-        for result in self.results:
-            if result["team_win"]:
-                stats["team_wins"] += 1
-            total_calamity += result["final_calamity"]
-            total_saves += result["total_saves"]
-            
-            for p in result["players"]:
-                role = p["role"]
-                faith = p["faith"]
-                sacrifice = p["sacrifice"]
-                vow = p["vow"]
-                bvow = p["bodhisattva_vow"]
-                
-                # 职业统计（含行动模式）
-                stats["by_role"][role]["count"] += 1
-                stats["by_role"][role]["avg_merit"] += p["merit"]
-                stats["by_role"][role]["avg_hui"] += p["hui"]
-                stats["by_role"][role]["avg_wealth"] += p["wealth"]
-                stats["by_role"][role]["avg_labor"] += p["labor_count"]
-                stats["by_role"][role]["avg_practice"] += p["practice_count"]
-                stats["by_role"][role]["avg_donate"] += p["donate_count"]
-                stats["by_role"][role]["avg_save"] += p["save_count"]
-                stats["by_role"][role]["avg_protect"] += p["protect_count"]
-                stats["by_role"][role]["avg_score"] += p["personal_score"]  # v5.7
-                stats["by_role"][role]["scores"].append(p["personal_score"])  # v5.7: 存储得分
-                # v5.7: 排名统计
-                rank = p.get("rank", 0)
-                if rank == 1:
-                    stats["by_role"][role]["first_place"] += 1
-                    stats["by_role"][role]["rank_1"] += 1
-                elif rank == 2:
-                    stats["by_role"][role]["rank_2"] += 1
-                elif rank == 3:
-                    stats["by_role"][role]["rank_3"] += 1
-                elif rank == 4:
-                    stats["by_role"][role]["rank_4"] += 1
-                if p["vow_achieved"]:
-                    stats["by_role"][role]["vow_achieved"] += 1
-                
-                # 信仰统计
-                stats["by_faith"][faith]["count"] += 1
-                stats["by_faith"][faith]["avg_merit"] += p["merit"]
-                stats["by_faith"][faith]["avg_hui"] += p["hui"]
-                if p["vow_achieved"]:
-                    stats["by_faith"][faith]["vow_achieved"] += 1
-                
-                # 舍离统计
-                if sacrifice:
-                    stats["by_sacrifice"][sacrifice]["count"] += 1
-                    stats["by_sacrifice"][sacrifice]["avg_merit"] += p["merit"]
-                    if p["vow_achieved"]:
-                        stats["by_sacrifice"][sacrifice]["vow_achieved"] += 1
-                    if p["bvow_achieved"]:
-                        stats["by_sacrifice"][sacrifice]["bvow_achieved"] += 1
-                
-                # 发愿统计
-                if vow:
-                    stats["by_vow"][vow]["count"] += 1
-                    if p["vow_achieved"]:
-                        stats["by_vow"][vow]["achieved"] += 1
-                
-                # 菩萨愿统计
-                if bvow:
-                    stats["by_bvow"][bvow]["count"] += 1
-                    if p["bvow_achieved"]:
-                        stats["by_bvow"][bvow]["achieved"] += 1
-                
-                # 行动统计
-                total_donate += p["donate_count"]
-                total_save_actions += p["save_count"]
-                total_protect += p["protect_count"]
-                
-                # 大乘惩罚
-                if faith == "大乘":
-                    total_mahayana += 1
-                    total_mahayana_penalty += p["mahayana_penalty"]
-        
-        # 计算平均值
-        n = len(self.results)
-        stats["team_win_rate"] = stats["team_wins"] / n
-        stats["avg_calamity"] = total_calamity / n
-        stats["avg_saves"] = total_saves / n
-        
-        for role in stats["by_role"]:
-            cnt = stats["by_role"][role]["count"]
+        for role, data in self.by_role.items():
+            r = stats["by_role"][role] = dict(data)
+            cnt = r["count"]
             if cnt > 0:
-                stats["by_role"][role]["avg_merit"] /= cnt
-                stats["by_role"][role]["avg_hui"] /= cnt
-                stats["by_role"][role]["avg_wealth"] /= cnt
-                stats["by_role"][role]["avg_labor"] /= cnt
-                stats["by_role"][role]["avg_practice"] /= cnt
-                stats["by_role"][role]["avg_donate"] /= cnt
-                stats["by_role"][role]["avg_save"] /= cnt
-                stats["by_role"][role]["avg_protect"] /= cnt
-                stats["by_role"][role]["avg_score"] /= cnt
-                stats["by_role"][role]["first_rate"] = stats["by_role"][role]["first_place"] / cnt
-                stats["by_role"][role]["vow_rate"] = stats["by_role"][role]["vow_achieved"] / cnt
-                # v5.7: 计算得分方差和标准差
-                scores = stats["by_role"][role]["scores"]
+                for key in ("avg_merit", "avg_hui", "avg_wealth", "avg_labor", "avg_practice",
+                            "avg_donate", "avg_save", "avg_protect", "avg_score"):
+                    r[key] /= cnt
+                r["first_rate"] = r["first_place"] / cnt
+                r["vow_rate"] = r["vow_achieved"] / cnt
+                # v5.7: 由得分直方图计算方差、中位数
+                scores = r["scores"]
                 if scores:
-                    avg = stats["by_role"][role]["avg_score"]
-                    variance = sum((s - avg) ** 2 for s in scores) / len(scores)
-                    stats["by_role"][role]["score_std"] = variance ** 0.5
-                    stats["by_role"][role]["score_var"] = variance
-                    sorted_scores = sorted(scores)
-                    stats["by_role"][role]["score_median"] = sorted_scores[len(sorted_scores) // 2]
-                    stats["by_role"][role]["score_min"] = min(scores)
-                    stats["by_role"][role]["score_max"] = max(scores)
+                    avg = r["avg_score"]
+                    variance = sum(c * (s - avg) ** 2 for s, c in sorted(scores.items())) / cnt
+                    r["score_std"] = variance ** 0.5
+                    r["score_var"] = variance
+                    r["score_median"] = _histogram_percentile(scores, cnt // 2)
+                    r["score_min"] = min(scores)
+                    r["score_max"] = max(scores)
                 # v5.7: 排名分布率
-                stats["by_role"][role]["rank_1_rate"] = stats["by_role"][role]["rank_1"] / cnt
-                stats["by_role"][role]["rank_2_rate"] = stats["by_role"][role]["rank_2"] / cnt
-                stats["by_role"][role]["rank_3_rate"] = stats["by_role"][role]["rank_3"] / cnt
-                stats["by_role"][role]["rank_4_rate"] = stats["by_role"][role]["rank_4"] / cnt
-                # 清理scores列表（避免JSON序列化时过大）
-                del stats["by_role"][role]["scores"]
-        
-        for faith in stats["by_faith"]:
-            cnt = stats["by_faith"][faith]["count"]
-            if cnt > 0:
-                stats["by_faith"][faith]["avg_merit"] /= cnt
-                stats["by_faith"][faith]["avg_hui"] /= cnt
-                stats["by_faith"][faith]["vow_rate"] = stats["by_faith"][faith]["vow_achieved"] / cnt
-        
-        for sacrifice in stats["by_sacrifice"]:
-            cnt = stats["by_sacrifice"][sacrifice]["count"]
+                r["rank_1_rate"] = r["rank_1"] / cnt
+                r["rank_2_rate"] = r["rank_2"] / cnt
+                r["rank_3_rate"] = r["rank_3"] / cnt
+                r["rank_4_rate"] = r["rank_4"] / cnt
+            # 清理得分直方图（避免JSON序列化时过大）
+            del r["scores"]
+        
+        for faith, data in self.by_faith.items():
+            f = stats["by_faith"][faith] = dict(data)
+            cnt = f["count"]
             if cnt > 0:
-                stats["by_sacrifice"][sacrifice]["avg_merit"] /= cnt
-                stats["by_sacrifice"][sacrifice]["vow_rate"] = stats["by_sacrifice"][sacrifice]["vow_achieved"] / cnt
-                stats["by_sacrifice"][sacrifice]["bvow_rate"] = stats["by_sacrifice"][sacrifice]["bvow_achieved"] / cnt
+                f["avg_merit"] /= cnt
+                f["avg_hui"] /= cnt
+                f["vow_rate"] = f["vow_achieved"] / cnt
         
-        for vow in stats["by_vow"]:
-            cnt = stats["by_vow"][vow]["count"]
+        for sacrifice, data in self.by_sacrifice.items():
+            s = stats["by_sacrifice"][sacrifice] = dict(data)
+            cnt = s["count"]
             if cnt > 0:
-                stats["by_vow"][vow]["rate"] = stats["by_vow"][vow]["achieved"] / cnt
+                s["avg_merit"] /= cnt
+                s["vow_rate"] = s["vow_achieved"] / cnt
+                s["bvow_rate"] = s["bvow_achieved"] / cnt
         
-        for bvow in stats["by_bvow"]:
-            cnt = stats["by_bvow"][bvow]["count"]
-            if cnt > 0:
-                stats["by_bvow"][bvow]["rate"] = stats["by_bvow"][bvow]["achieved"] / cnt
+        for key in ("by_vow", "by_bvow"):
+            for vow, data in getattr(self, key).items():
+                v = stats[key][vow] = dict(data)
+                if v["count"] > 0:
+                    v["rate"] = v["achieved"] / v["count"]
         
         player_count = n * 4
-        stats["action_stats"]["avg_donate"] = total_donate / player_count
-        stats["action_stats"]["avg_save"] = total_save_actions / player_count
-        stats["action_stats"]["avg_protect"] = total_protect / player_count
+        stats["action_stats"]["avg_donate"] = self.total_donate / player_count
+        stats["action_stats"]["avg_save"] = self.total_save_actions / player_count
+        stats["action_stats"]["avg_protect"] = self.total_protect / player_count
         
-        if total_mahayana > 0:
-            stats["mahayana_penalty_rate"] = total_mahayana_penalty / total_mahayana
+        if self.total_mahayana > 0:
+            stats["mahayana_penalty_rate"] = self.total_mahayana_penalty / self.total_mahayana
         
+        if self.controls is not None:
+            stats["variance_reduction"] = self.controls.finalize()
+        
+        return stats
+
+def _histogram_percentile(histogram: Counter, index: int) -> int:
+    """直方图中排序后第 index 个值（等价于 sorted(values)[index]）"""
+    seen = 0
+    for value in sorted(histogram):
+        seen += histogram[value]
+        if seen > index:
+            return value
+    raise IndexError(index)
+
+# 引擎版本（源码哈希）：结果缓存键的一部分，改动本文件后旧缓存自动失效
+ENGINE_VERSION = engine_version(__file__, "v5.8")
+
+def _game_engines(config: GameConfig, antithetic: bool = False, controls: bool = False,
+                  profiler: Optional[PhaseProfiler] = None) -> Tuple[GameEngine, ...]:
+    """第 i 局由 engines[i % len(engines)] 以 derive_seed(seed, i // len(engines)) 播种
+
+    普通抽样只有一个引擎（单一随机流）；对偶抽样为（公共随机流引擎, 对偶事件流引擎），
+    第 2k、2k+1 局同种子，事件抽样互为 u 与 1-u。
+    """
+    if antithetic:
+        return (GameEngine(config, common_streams=True, record_controls=controls, profiler=profiler),
+                GameEngine(config, antithetic=True, record_controls=controls, profiler=profiler))
+    return (GameEngine(config, record_controls=controls, profiler=profiler),)
+
+def _play(engines: Tuple[GameEngine, ...], seed: int, game_index: int) -> Dict:
+    engine = engines[game_index % len(engines)]
+    engine.seed(derive_seed(seed, game_index // len(engines)))
+    return engine.run_game()
+
+def _simulate_shard(config: GameConfig, seed: int, start: int, stop: int,
+                    antithetic: bool = False, controls: bool = False,
+                    profile: bool = False) -> BalanceAccumulator:
+    """进程池工作函数：模拟第 [start, stop) 局，只回传部分聚合"""
+    acc = BalanceAccumulator(controls, antithetic, profile)
+    engines = _game_engines(config, antithetic, controls, acc.profile)
+    if acc.profile is None:
+        for game_index in range(start, stop):
+            acc.update(_play(engines, seed, game_index))
+        return acc
+    update = acc.profile.wrap("update", acc.update)
+    for game_index in range(start, stop):
+        update(_play(engines, seed, game_index))
+    return acc
+
+class BalanceAnalyzer:
+    def __init__(self, config: GameConfig, num_simulations: int = 5000, workers: int = 1,
+                 seed: Optional[int] = None, streaming: bool = False,
+                 ci_targets: Optional[Dict[str, float]] = None, batch_size: int = 1000,
+                 cache: Optional[ResultCache] = None, antithetic: bool = False,
+                 control_variates: bool = False, profile: bool = False):
+        self.config = config
+        self.num_simulations = num_simulations
+        self.workers = workers  # >1 时用进程池分片模拟
+        # 根种子：每局使用 derive_seed(seed, 局号) 的独立随机流，
+        # 因此串行与任意分片方式的并行结果逐位一致
+        self.seed = seed if seed is not None else random.randrange(1 << 63)
+        # 流式模式：逐局结果立即折叠进累加器，不保留 self.results，内存不随局数增长
+        self.streaming = streaming
+        # 序贯抽样：{指标名或指标族: 95%置信区间目标半宽}，如 {"team_win_rate": 0.01, "bvow_rate": 0.03}；
+        # 设置后 num_simulations 为预算上限，按 batch_size 分批模拟直到全部目标达成
+        self.ci_targets = ci_targets
+        self.batch_size = batch_size
+        # 结果缓存：按 batch_size 对齐的局号区间为单位缓存部分聚合，命中的区间不再模拟
+        self.cache = cache
+        # 方差缩减（默认关闭，关闭时结果与既有种子逐位一致）：
+        # antithetic：第 2k、2k+1 局为对偶对（同种子、事件流互为 u 与 1-u），局数与分批须为偶数；
+        # control_variates：以事件构成与众生成本（期望已知）回归修正团队胜率、第1名率等，
+        # 修正估计与标准误见 analyze() 的 "variance_reduction"，序贯抽样也按修正后的区间判停
+        if antithetic and (num_simulations % 2 or batch_size % 2):
+            raise ValueError("对偶抽样要求 num_simulations 与 batch_size 为偶数")
+        self.antithetic = antithetic
+        self.control_variates = control_variates
+        # 逐阶段剖析：引擎各阶段、逐局聚合与统计的耗时与调用次数，见 analyze() 的 "profile" 与报告末尾；
+        # 并行分片各自计时后随部分聚合合并（耗时为各进程之和），命中缓存的块沿用首次模拟时的计时
+        self.profile = profile
+        self.games_run = 0
+        self.results = []
+        self.accumulator = self.new_accumulator()
+        self.partials = []  # 并行分片回传的 (起始局号, 部分聚合)
+    
+    def new_accumulator(self) -> BalanceAccumulator:
+        return BalanceAccumulator(self.control_variates, self.antithetic, self.profile)
+    
+    def sampling(self) -> Tuple:
+        """影响逐局结果或部分聚合的抽样选项（进入缓存键；默认为空，与既有缓存键一致）"""
+        return tuple(name for name, on in (("antithetic", self.antithetic),
+                                           ("control_variates", self.control_variates),
+                                           ("profile", self.profile)) if on)
+    
+    def run_simulations(self):
+        """运行模拟"""
+        if self.ci_targets:
+            self._run_sequential()
+            return
+        if self.cache is not None or self.workers > 1:
+            with self._pool() as pool:
+                self._run_range(0, self.num_simulations, pool)
+        else:
+            games = self.iter_games()
+            if self.streaming:
+                self.consume(games)
+            else:
+                self.results.extend(games)
+        self.games_run = self.num_simulations
+    
+    def _run_sequential(self):
+        """分批模拟，每批后检查置信区间，全部达标或用尽预算即停（进程池在各批之间复用）"""
+        with self._pool() as pool:
+            start = 0
+            while start < self.num_simulations:
+                stop = min(start + self.batch_size, self.num_simulations)
+                if self.cache is not None or pool is not None:
+                    self._run_range(start, stop, pool)
+                else:
+                    self.consume(self.iter_games(start, stop))
+                start = stop
+                self.games_run = stop
+                if self.ci_status(self.collect())["done"]:
+                    break
+        status = self.ci_status(self.collect())
+        print(f"  序贯抽样: {self.games_run} 局，目标{'已全部达成' if status['met'] else '未全部达成'}")
+    
+    def _pool(self):
+        """workers > 1 时为整个运行共用的进程池（工作进程在首次提交时才启动），否则为空上下文"""
+        if self.workers > 1:
+            return ProcessPoolExecutor(max_workers=self.workers)
+        return contextlib.nullcontext()
+    
+    def _run_range(self, start: int, stop: int, pool: Optional[ProcessPoolExecutor]):
+        if self.cache is not None:
+            self._run_cached(start, stop, pool)
+        else:
+            self._run_parallel(start, stop, pool)
+    
+    def iter_games(self, start: int = 0, stop: Optional[int] = None) -> Iterator[Dict]:
+        """逐局生成第 [start, stop) 局的结果（生成器，不保留历史结果）"""
+        if stop is None:
+            stop = self.num_simulations
+        engines = _game_engines(self.config, self.antithetic, self.control_variates,
+                                self.accumulator.profile)
+        for i in range(start, stop):
+            if (i + 1) % 1000 == 0:
+                print(f"  模拟进度: {i+1}/{self.num_simulations}")
+            yield _play(engines, self.seed, i)
+    
+    def consume(self, games: Iterable[Dict]):
+        """流式消费任意结果序列，逐局折叠进累加器"""
+        update = self.accumulator.update
+        if self.accumulator.profile is not None:
+            update = self.accumulator.profile.wrap("update", update)
+        for result in games:
+            update(result)
+    
+    def _shards(self, start: int, stop: int, num_shards: int) -> List[Tuple[int, int]]:
+        """把第 [start, stop) 局切成至多 num_shards 个连续分片（对偶抽样以一对为最小单位）"""
+        unit = 2 if self.antithetic else 1
+        total = (stop - start) // unit
+        num_shards = min(total, num_shards)
+        if num_shards == 0:
+            return []  # 空区间：不提交任何分片，collect() 得到空聚合
+        base, extra = divmod(total, num_shards)
+        bounds = [start]
+        for i in range(num_shards):
+            bounds.append(bounds[-1] + (base + (1 if i < extra else 0)) * unit)
+        return list(zip(bounds, bounds[1:]))
+    
+    def _simulate_ranges(self, ranges: List[Tuple[int, int]],
+                         pool: Optional[ProcessPoolExecutor]) -> Iterator[Tuple[int, BalanceAccumulator]]:
+        """模拟若干局号区间，按完成顺序产出 (区间起点, 部分聚合)
+
+        有进程池时每个区间再切成分片（合计约为进程数的4倍，平衡各进程负载）并行模拟，
+        一个区间的分片全部完成后按局号顺序合并；没有进程池时逐区间在本进程模拟。
+        """
+        if pool is None:
+            for start, stop in ranges:
+                yield start, _simulate_shard(self.config, self.seed, start, stop,
+                                             self.antithetic, self.control_variates, self.profile)
+            return
+        per_range = -(-self.workers * 4 // max(len(ranges), 1))
+        futures = {}
+        pending = {}  # 区间起点 → [未完成分片数, [(分片起点, 部分聚合)]]
+        for start, stop in ranges:
+            shards = self._shards(start, stop, per_range)
+            pending[start] = [len(shards), []]
+            for shard_start, shard_stop in shards:
+                future = pool.submit(_simulate_shard, self.config, self.seed, shard_start, shard_stop,
+                                     self.antithetic, self.control_variates, self.profile)
+                futures[future] = (start, shard_start)
+        for future in as_completed(futures):
+            start, shard_start = futures[future]
+            entry = pending[start]
+            entry[0] -= 1
+            entry[1].append((shard_start, future.result()))
+            if entry[0]:
+                continue
+            parts = sorted(entry[1], key=lambda item: item[0])
+            if len(parts) == 1:
+                yield start, parts[0][1]
+                continue
+            acc = self.new_accumulator()
+            for _, partial in parts:
+                acc.merge(partial)
+            yield start, acc
+    
+    def _run_parallel(self, start: int, stop: int, pool: Optional[ProcessPoolExecutor]):
+        """多进程分片模拟第 [start, stop) 局：每个分片回传部分聚合而非逐局结果"""
+        done = start
+        for shard_start, partial in self._simulate_ranges(self._shards(start, stop, self.workers * 4), pool):
+            self.partials.append((shard_start, partial))
+            done += partial.games
+            print(f"  模拟进度: {done}/{self.num_simulations}")
+    
+    def _run_cached(self, start: int, stop: int, pool: Optional[ProcessPoolExecutor]):
+        """按 batch_size 对齐分块模拟第 [start, stop) 局：命中缓存的块直接取部分聚合，其余模拟后写入缓存
+
+        缓存以块为单位；有进程池时未命中的块切成分片并行模拟，合并成整块后写入。
+        """
+        missing = []
+        keys = {}
+        done = start
+        for chunk_start in range(start, stop, self.batch_size):
+            chunk_stop = min(chunk_start + self.batch_size, stop)
+            key = self.cache.key(ENGINE_VERSION, self.config, self.seed, chunk_start, chunk_stop,
+                                 *self.sampling())
+            partial = self.cache.get(key)
+            if partial is None:
+                missing.append((chunk_start, chunk_stop))
+                keys[chunk_start] = key
+            else:
+                self.partials.append((chunk_start, partial))
+                done += partial.games
+        
+        for chunk_start, partial in self._simulate_ranges(missing, pool):
+            self.cache.put(keys[chunk_start], partial)
+            self.partials.append((chunk_start, partial))
+            done += partial.games
+            print(f"  模拟进度: {done}/{self.num_simulations}")
+    
+    def collect(self) -> BalanceAccumulator:
+        """合并逐局结果、流式累加器与并行分片"""
+        acc = self.new_accumulator()
+        for result in self.results:
+            acc.update(result)
+        acc.merge(self.accumulator)
+        # 按局号顺序合并，保证与串行结果逐位一致
+        for _, partial in sorted(self.partials, key=lambda item: item[0]):
+            acc.merge(partial)
+        return acc
+    
+    def ci_status(self, acc: BalanceAccumulator) -> Dict:
+        """按 ci_targets 评估各指标置信区间
+
+        返回 {"met": 是否全部达标, "done": 是否可以停止, "intervals": {名称: 详情}}。
+        按当前累积速度预计预算内无法达标的指标（样本极少的发愿等）标记为不可达，不阻止停止。
+        启用控制变量时，有修正估计的指标改用修正估计 ± z·标准误（判停规则见 sampling.ci_status）。
+        """
+        adjusted = acc.controls.finalize() if acc.controls is not None else {}
+        overrides = {name: (item["estimate"], item["se"]) for name, item in adjusted.items()}
+        return ci_status(acc.proportions(), self.ci_targets, acc.games, self.num_simulations, overrides)
+    
+    def analyze(self) -> Dict:
+        """分析结果"""
+        acc = self.collect()
+        start = time.perf_counter()
+        stats = acc.finalize()
+        if acc.profile is not None:
+            acc.profile.add("analyze", time.perf_counter() - start)
+            stats["profile"] = acc.profile.summary()
+        stats["seed"] = self.seed  # 记录根种子以便复现
+        if self.ci_targets:
+            status = self.ci_status(acc)
+            stats["ci_met"] = status["met"]
+            stats["intervals"] = status["intervals"]
+            stats["budget"] = self.num_simulations
         return stats
     
     def generate_report(self, stats: Dict) -> str:
@@ -1264,11 +2156,19 @@ class BalanceAnalyzer:
         lines.append("=" * 70)
         lines.append("《功德轮回》v5.8 全面平衡分析报告")
         lines.append(f"模拟局数: {stats['total_games']}")
+        if stats.get("seed") is not None:
+            lines.append(f"随机种子: {stats['seed']}")
         lines.append("=" * 70)
         lines.append("")
         
         # 团队胜率
-        lines.append(f"【团队胜率】: {stats['team_win_rate']*100:.1f}%")
+        adjusted = stats.get("variance_reduction") or {}
+        if "team_win_rate" in adjusted:
+            item = adjusted["team_win_rate"]
+            lines.append(f"【团队胜率】: {stats['team_win_rate']*100:.1f}%"
+                         f"（控制变量修正 {item['estimate']*100:.1f}% ± {CI_Z*item['se']*100:.2f}%）")
+        else:
+            lines.append(f"【团队胜率】: {stats['team_win_rate']*100:.1f}%")
         lines.append(f"  平均劫难: {stats['avg_calamity']:.1f}")
         lines.append(f"  平均渡化: {stats['avg_saves']:.1f}")
         lines.append("")
@@ -1368,10 +2268,63 @@ class BalanceAnalyzer:
         lines.append(f"【大乘行持惩罚率】: {stats['mahayana_penalty_rate']:.2f} 次/人")
         lines.append("")
         
+        # 方差缩减：原始均值与修正估计的95%半宽，倍数为同局数独立抽样方差 / 修正后方差
+        if adjusted:
+            lines.append("【方差缩减】（对偶抽样 / 控制变量）")
+            lines.append("  指标                  | 原始均值 | 独立抽样半宽 | 修正估计 | 修正半宽 | 方差缩减")
+            for name, item in adjusted.items():
+                scale = 100 if name.startswith(("team_win_rate", "first_rate")) else 1
+                unit = "%" if scale == 100 else " "
+                lines.append(f"  {name:<20} | {item['plain']*scale:7.2f}{unit}| {CI_Z*item['iid_se']*scale:11.3f}{unit}| "
+                             f"{item['estimate']*scale:7.2f}{unit}| {CI_Z*item['se']*scale:7.3f}{unit}| "
+                             f"{item['reduction']:6.2f}x")
+            lines.append("")
+        
+        # 序贯抽样的置信区间
+        if stats.get("intervals"):
+            met = "全部达成" if stats["ci_met"] else f"未全部达成（预算 {stats['budget']} 局）"
+            lines.append(f"【95%置信区间】目标{met}")
+            lines.append("  指标                  | 估计值 | 区间            | 半宽  | 目标")
+            for name, item in stats["intervals"].items():
+                mark = "" if item["met"] else (" ✗" if item["reachable"] else " ✗ 预算内不可达")
+                lines.append(f"  {name:<20} | {item['rate']*100:5.1f}% | "
+                             f"[{item['low']*100:5.1f}%, {item['high']*100:5.1f}%] | "
+                             f"{item['half_width']*100:4.1f}% | ±{item['target']*100:.1f}%{mark}")
+            lines.append("")
+        
+        # 逐阶段剖析
+        if stats.get("profile"):
+            lines.append("【性能剖析】（各阶段累计耗时，占整局 = 占 run_game 总耗时）")
+            lines.append(format_profile(stats["profile"]))
+            lines.append("")
+        
         lines.append("=" * 70)
         
         return "\n".join(lines)
 
+# ============== 剖析工作负载 ==============
+
+def profile_workload(config: Optional[GameConfig] = None, games: int = 2000, seed: int = 2026,
+                     out: Optional[str] = None, sort: str = "cumulative", limit: int = 25) -> pstats.Stats:
+    """在 cProfile 下跑固定种子工作负载（第 [0, games) 局，与 BalanceAnalyzer 同种子时对局一致）
+
+    out 给出时写出 pstats 文件（可用 snakeviz 等查看）；同一工作负载也可交给统计剖析器：
+      py-spy record -o v58.svg -- python -c "import simulator_v58_FINAL as s; s.fixed_workload()"
+    """
+    profiler = cProfile.Profile()
+    profiler.enable()
+    fixed_workload(config, games, seed)
+    profiler.disable()
+    if out is not None:
+        profiler.dump_stats(out)
+    stats = pstats.Stats(profiler)
+    stats.sort_stats(sort).print_stats(limit)
+    return stats
+
+def fixed_workload(config: Optional[GameConfig] = None, games: int = 2000, seed: int = 2026) -> BalanceAccumulator:
+    """固定种子的剖析基准工作负载：逐局模拟并聚合，返回部分聚合"""
+    return _simulate_shard(config or GameConfig(), seed, 0, games)
+
 # ============== 主程序 ==============
 
 def main():
@@ -1386,10 +2339,21 @@ def main():
             return {k: convert_dict(v) for k, v in d.items()}
         return d
     
+    # 多核并行：按CPU核数分片
+    workers = os.cpu_count() or 1
+    
+    # 序贯抽样：各指标95%置信区间半宽达标即停，预算上限20000局
+    ci_targets = {"team_win_rate": 0.01, "first_rate": 0.015, "vow_rate": 0.02, "bvow_rate": 0.03}
+    
+    # 固定根种子 + 本地结果缓存：配置与引擎未改动时重复生成报告直接命中，不再重新模拟
+    seed = 2026
+    cache = ResultCache()
+    
     # ============ 基础版模拟 ============
     print("\n【基础版模拟】")
     config = GameConfig()
-    analyzer = BalanceAnalyzer(config, num_simulations=5000)
+    analyzer = BalanceAnalyzer(config, num_simulations=20000, workers=workers, streaming=True,
+                               seed=seed, ci_targets=ci_targets, cache=cache)
     
     print("开始模拟...")
     analyzer.run_simulations()
@@ -1412,7 +2376,8 @@ def main():
     print("=" * 50)
     
     hell_config = GameConfig(hell_mode=True)
-    hell_analyzer = BalanceAnalyzer(hell_config, num_simulations=5000)
+    hell_analyzer = BalanceAnalyzer(hell_config, num_simulations=20000, workers=workers, streaming=True,
+                                    seed=seed, ci_targets=ci_targets, cache=cache)
     
     print("开始模拟...")
     hell_analyzer.run_simulations()
@@ -1433,6 +2398,7 @@ def main():
     print("\n报告已保存:")
     print("  基础版: balance_report_v53.txt")
     print("  人间炼狱版: balance_report_hell.txt")
+    print(cache.summary())
 
 if __name__ == "__main__":
-    main()
+    run_as_module(__file__)
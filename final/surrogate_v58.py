@@ -0,0 +1,277 @@
+# -*- coding: utf-8 -*-
+"""
+《功德轮回》v5.8 平衡指标代理模型
+每评估一个 GameConfig 要跑数千局，而团队胜率、各职业第1名率等指标是少数整数参数的光滑函数。
+这里用高斯过程（ARD 径向基核，超参数按边缘似然拟合）在已有的 (配置 → 指标) 样本上回归，
+即时给出预测值与不确定度；主动学习只在不确定度最高的点请求真实模拟（经参数扫描与结果缓存）。
+
+依赖：numpy
+"""
+
+import csv
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from simulator_v58_FINAL import GameConfig, derive_seed
+from result_cache import ResultCache
+from sweep import Param, apply_point, latin_hypercube, run_sweep, v58_target
+
+DEFAULT_METRICS = (
+    "team_win_rate",
+    "by_role/农夫/first_rate", "by_role/商人/first_rate",
+    "by_role/学者/first_rate", "by_role/僧侣/first_rate",
+)
+
+# ============== 高斯过程 ==============
+
+class GaussianProcess:
+    """单输出高斯过程回归：ARD 径向基核 + 已知逐点噪声 + 拟合的附加噪声
+
+    输入为 [0,1]^d 的编码坐标；输出先标准化。超参数（对数长度尺度、信号方差、附加噪声）
+    以随机搜索加坐标细化最大化对数边缘似然。
+    """
+
+    def __init__(self, seed: int = 0):
+        self.rng = np.random.default_rng(seed)
+        self.theta = None
+
+    @staticmethod
+    def _kernel(A: np.ndarray, B: np.ndarray, lengths: np.ndarray, signal: float) -> np.ndarray:
+        diff = (A[:, None, :] - B[None, :, :]) / lengths
+        return signal * np.exp(-0.5 * np.sum(diff * diff, axis=-1))
+
+    def _unpack(self, theta: np.ndarray):
+        d = self.X.shape[1]
+        return np.exp(theta[:d]), np.exp(theta[d]), np.exp(theta[d + 1])
+
+    def _log_likelihood(self, theta: np.ndarray) -> float:
+        lengths, signal, nugget = self._unpack(theta)
+        K = self._kernel(self.X, self.X, lengths, signal)
+        K[np.diag_indices_from(K)] += self.noise + nugget + 1e-8
+        try:
+            L = np.linalg.cholesky(K)
+        except np.linalg.LinAlgError:
+            return -np.inf
+        alpha = np.linalg.solve(L.T, np.linalg.solve(L, self.y))
+        return float(-0.5 * self.y @ alpha - np.sum(np.log(np.diag(L))))
+
+    def fit(self, X: np.ndarray, y: np.ndarray, noise: Optional[np.ndarray] = None, trials: int = 60):
+        """X: (n, d)；y: (n,)；noise: 各样本已知的观测方差（原始单位），如比例指标的二项方差"""
+        self.X = np.asarray(X, dtype=float)
+        y = np.asarray(y, dtype=float)
+        self.y_mean = y.mean()
+        self.y_std = y.std() or 1.0
+        self.y = (y - self.y_mean) / self.y_std
+        self.noise = (np.zeros(len(y)) if noise is None else np.asarray(noise, dtype=float)) / self.y_std ** 2
+        d = self.X.shape[1]
+
+        # 随机搜索：长度尺度 0.05–5，信号方差 0.1–10，附加噪声 1e-6–1（标准化单位）
+        best, best_ll = self.theta, -np.inf
+        if best is not None and len(best) == d + 2:
+            best_ll = self._log_likelihood(best)
+        for _ in range(trials):
+            theta = np.concatenate([self.rng.uniform(np.log(0.05), np.log(5.0), d),
+                                    [self.rng.uniform(np.log(0.1), np.log(10.0))],
+                                    [self.rng.uniform(np.log(1e-6), 0.0)]])
+            ll = self._log_likelihood(theta)
+            if ll > best_ll:
+                best, best_ll = theta, ll
+        # 坐标细化
+        step = 0.5
+        while step > 0.02:
+            improved = False
+            for k in range(d + 2):
+                for sign in (1, -1):
+                    theta = best.copy()
+                    theta[k] += sign * step
+                    ll = self._log_likelihood(theta)
+                    if ll > best_ll:
+                        best, best_ll, improved = theta, ll, True
+            if not improved:
+                step /= 2
+        self.theta = best
+
+        lengths, signal, nugget = self._unpack(best)
+        K = self._kernel(self.X, self.X, lengths, signal)
+        K[np.diag_indices_from(K)] += self.noise + nugget + 1e-8
+        self._L = np.linalg.cholesky(K)
+        self._alpha = np.linalg.solve(self._L.T, np.linalg.solve(self._L, self.y))
+        return self
+
+    def predict(self, X: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """预测均值与标准差（原始单位；标准差不含观测噪声，即对真实指标的不确定度）"""
+        lengths, signal, _ = self._unpack(self.theta)
+        Ks = self._kernel(np.asarray(X, dtype=float), self.X, lengths, signal)
+        mean = Ks @ self._alpha
+        v = np.linalg.solve(self._L, Ks.T)
+        var = np.maximum(signal - np.sum(v * v, axis=0), 0.0)
+        return mean * self.y_std + self.y_mean, np.sqrt(var) * self.y_std
+
+# ============== 代理模型 ==============
+
+class SurrogateModel:
+    """参数 → 平衡指标的代理：积累样本、拟合、即时预测、按不确定度请求真实模拟"""
+
+    def __init__(self, params: List[Param], metrics: Sequence[str] = DEFAULT_METRICS,
+                 base: Optional[GameConfig] = None, games: int = 2000, seed: int = 2026,
+                 cache: Optional[ResultCache] = None, workers: Optional[int] = None):
+        self.params = params
+        self.metrics = tuple(metrics)
+        self.base = base or GameConfig()
+        self.games = games
+        self.seed = seed
+        self.cache = cache
+        self.workers = workers
+        self.points: List[Dict] = []
+        self.rows: List[Dict[str, float]] = []
+        self.models: Dict[str, GaussianProcess] = {}
+
+    # ---------- 样本 ----------
+
+    def encode(self, point: Dict) -> np.ndarray:
+        """字段取值 → [0,1]^d 坐标（离散取值按所在分层的中点）"""
+        x = []
+        for p in self.params:
+            value = point[p.name]
+            if p.values is not None:
+                x.append((list(p.values).index(value) + 0.5) / len(p.values))
+            else:
+                x.append((float(value) - p.low) / (p.high - p.low))
+        return np.array(x)
+
+    def _normalize(self, point: Dict) -> Dict:
+        config = apply_point(self.base, point)
+        return {p.name: getattr(config, p.name) for p in self.params}
+
+    def add_rows(self, rows: List[Dict]):
+        """加入参数扫描的结果行（须含全部参数列与指标列）"""
+        for row in rows:
+            self.points.append(self._normalize({p.name: _number(row[p.name]) for p in self.params}))
+            self.rows.append({m: float(row[m]) for m in self.metrics + ("total_games",) if m in row})
+        self.models.clear()
+
+    def load_csv(self, path: str):
+        """读入 sweep.write_csv 写出的表"""
+        with open(path, encoding="utf-8-sig", newline="") as f:
+            self.add_rows(list(csv.DictReader(f)))
+
+    def simulate(self, points: List[Dict]):
+        """真实模拟若干点并加入样本（经参数扫描进程池；已算过的分片命中结果缓存）
+
+        每点的根种子由取值派生：点间抽样误差独立（公共随机数的共同偏差无法被回归平均掉），
+        同一点重复请求仍得到相同种子而命中缓存。
+        """
+        points = [self._normalize(p) for p in points]
+        seeds = [derive_seed(self.seed, *p.values()) for p in points]
+        rows = run_sweep(v58_target(self.base), points, games=self.games, workers=self.workers,
+                         cache=self.cache, progress=False, seeds=seeds)
+        self.add_rows(rows)
+
+    # ---------- 拟合与预测 ----------
+
+    def fit(self):
+        X = np.array([self.encode(p) for p in self.points])
+        for metric in self.metrics:
+            y = np.array([row[metric] for row in self.rows])
+            noise = None
+            if metric.endswith("rate"):
+                # 比例指标：观测方差已知为 p(1-p)/局数
+                games = np.array([row.get("total_games", self.games) for row in self.rows])
+                noise = np.clip(y * (1 - y), 1e-4, None) / games
+            previous = self.models.get(metric)
+            gp = previous if previous is not None else GaussianProcess(seed=len(self.models))
+            self.models[metric] = gp.fit(X, y, noise)
+        return self
+
+    def predict(self, points: List[Dict]) -> List[Dict[str, Tuple[float, float]]]:
+        """每个点：{指标: (预测值, 标准差)}"""
+        if set(self.models) != set(self.metrics):
+            self.fit()
+        X = np.array([self.encode(self._normalize(p)) for p in points])
+        out = [{} for _ in points]
+        for metric, gp in self.models.items():
+            mean, std = gp.predict(X)
+            for i in range(len(points)):
+                out[i][metric] = (float(mean[i]), float(std[i]))
+        return out
+
+    def query(self, point: Dict, tolerance: Optional[float] = None) -> Dict[str, Tuple[float, float]]:
+        """即时预测；给出 tolerance 且任一指标标准差超出时，先真实模拟该点再预测"""
+        prediction = self.predict([point])[0]
+        if tolerance is not None and max(std for _, std in prediction.values()) > tolerance:
+            self.simulate([point])
+            self.fit()
+            prediction = self.predict([point])[0]
+        return prediction
+
+    def active_learn(self, rounds: int = 4, batch: int = 8, pool: int = 512, seed: int = 0) -> List[float]:
+        """主动学习：每轮在拉丁超立方候选池中挑（各指标标准差/指标尺度之和）最大的 batch 个点模拟
+
+        返回每轮挑选前候选池上的最大相对不确定度。
+        """
+        history = []
+        for r in range(rounds):
+            candidates = [self._normalize(p) for p in latin_hypercube(self.params, pool, seed=seed + r)]
+            predictions = self.predict(candidates)
+            scores = []
+            for prediction in predictions:
+                scores.append(sum(std / (self.models[m].y_std or 1.0) for m, (_, std) in prediction.items()))
+            history.append(max(scores))
+            chosen, seen = [], {tuple(p.values()) for p in self.points}
+            for i in np.argsort(scores)[::-1]:
+                key = tuple(candidates[i].values())
+                if key not in seen:
+                    seen.add(key)
+                    chosen.append(candidates[i])
+                if len(chosen) == batch:
+                    break
+            self.simulate(chosen)
+            self.fit()
+        return history
+
+def _number(value):
+    value = float(value)
+    return int(value) if value.is_integer() else value
+
+# ============== 主程序 ==============
+
+SURROGATE_PARAMS = [
+    Param("disaster_base_calamity_adj", 4, 8),
+    Param("misfortune_base_calamity_adj", 3, 7),
+    Param("protect_merit", 2, 5),
+    Param("vow_diligent_merit", 12, 20),
+]
+
+def main(initial: int = 16, rounds: int = 3, batch: int = 8, holdout: int = 8, games: int = 2000):
+    print("《功德轮回》v5.8 平衡指标代理模型")
+    print("=" * 50)
+    model = SurrogateModel(SURROGATE_PARAMS, games=games, cache=ResultCache())
+    start = time.perf_counter()
+    model.simulate(latin_hypercube(SURROGATE_PARAMS, initial, seed=100))
+    model.fit()
+    history = model.active_learn(rounds=rounds, batch=batch)
+    print(f"训练样本 {len(model.points)} 个（初始 {initial} + 主动学习 {rounds}×{batch}）："
+          f"{time.perf_counter() - start:.1f}s")
+    print("各轮最大相对不确定度: " + " → ".join(f"{h:.2f}" for h in history))
+
+    # 留出点：代理预测 vs 真实模拟
+    test_points = [model._normalize(p) for p in latin_hypercube(SURROGATE_PARAMS, holdout, seed=999)]
+    start = time.perf_counter()
+    predictions = model.predict(test_points)
+    elapsed = (time.perf_counter() - start) * 1000
+    actual = run_sweep(v58_target(), test_points, games=games, progress=False,
+                       seeds=[derive_seed(model.seed + 1, *p.values()) for p in test_points])
+    z = []
+    print(f"\n留出 {holdout} 点预测耗时 {elapsed:.1f}ms（团队胜率：预测 ± 标准差 / 独立种子真实模拟）")
+    for point, prediction, row in zip(test_points, predictions, actual):
+        mean, std = prediction["team_win_rate"]
+        values = " ".join(f"{k}={v}" for k, v in point.items())
+        p = row["team_win_rate"]
+        z.append((p - mean) / np.sqrt(std ** 2 + p * (1 - p) / games))  # 含真实模拟自身的抽样误差
+        print(f"  {mean*100:5.1f}% ± {std*100:3.1f}% / {p*100:5.1f}% | {values}")
+    print(f"标准化误差 z 的均方根: {np.sqrt(np.mean(np.square(z))):.2f}（≈1 说明不确定度校准良好）")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,259 @@
+# -*- coding: utf-8 -*-
+"""
+《功德轮回》参数扫描
+对 GameConfig / CoreConfig / BalanceConfig 的任意字段给出取值范围，
+生成全因子网格或拉丁超立方点，按每点局数预算分片调度到进程池，
+输出每点一行、列为全部 analyze() 指标的整洁表（CSV）。
+
+所有点共用同一根种子（公共随机数），相邻点之间的差异主要来自参数而非抽样噪声。
+"""
+
+import csv
+import itertools
+import os
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, fields, replace
+from functools import partial
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "core"))
+
+import simulator_v58_FINAL as v58
+import simulator_core_v1 as core
+import balance_test_v2 as balance_test
+from compare_v58 import flatten_stats
+from result_cache import ResultCache
+
+# ============== 参数空间 ==============
+
+@dataclass
+class Param:
+    """一个扫描维度：给出 values（离散取值）或 [low, high] 区间
+
+    区间维度在网格中取 levels 个等距点，在拉丁超立方中连续抽样；
+    整数字段（按基准配置的字段类型判断）自动取整。
+    """
+    name: str
+    low: Optional[float] = None
+    high: Optional[float] = None
+    levels: int = 3
+    values: Optional[Sequence[Any]] = None
+
+    def grid(self) -> List[float]:
+        if self.values is not None:
+            return list(self.values)
+        if self.levels == 1:
+            return [self.low]
+        step = (self.high - self.low) / (self.levels - 1)
+        return [self.low + i * step for i in range(self.levels)]
+
+    def at(self, u: float) -> Any:
+        """单位区间 [0, 1) 上的位置 → 取值"""
+        if self.values is not None:
+            return self.values[min(int(u * len(self.values)), len(self.values) - 1)]
+        return self.low + u * (self.high - self.low)
+
+def grid_points(params: List[Param]) -> List[Dict[str, Any]]:
+    """全因子网格"""
+    names = [p.name for p in params]
+    return [dict(zip(names, combo)) for combo in itertools.product(*(p.grid() for p in params))]
+
+def latin_hypercube(params: List[Param], n: int, seed: int = 0) -> List[Dict[str, Any]]:
+    """拉丁超立方：每个维度的 n 个等分层各恰好取一个点"""
+    rng = random.Random(seed)
+    columns = []
+    for p in params:
+        strata = list(range(n))
+        rng.shuffle(strata)
+        columns.append([p.at((k + rng.random()) / n) for k in strata])
+    return [{p.name: column[i] for p, column in zip(params, columns)} for i in range(n)]
+
+def apply_point(base: Any, point: Dict[str, Any]) -> Any:
+    """以基准配置为底替换字段（整数字段取整），未知字段直接报错"""
+    known = {f.name for f in fields(base)}
+    values = {}
+    for name, value in point.items():
+        if name not in known:
+            raise ValueError(f"{type(base).__name__} 没有字段 {name}")
+        current = getattr(base, name)
+        if isinstance(current, int) and not isinstance(current, bool):
+            value = int(round(value))
+        values[name] = value
+    return replace(base, **values)
+
+# ============== 扫描目标 ==============
+
+@dataclass
+class SweepTarget:
+    """被扫描的模拟器：基准配置、区间模拟函数（进程池可序列化）、引擎版本
+
+    key_extra：simulate 中绑定的、配置之外影响结果的参数（如玩家类型组合），计入缓存键。
+    """
+    name: str
+    base: Any
+    simulate: Callable  # (config, seed, start, stop) -> 可 merge/finalize 的部分聚合
+    engine: str
+    key_extra: Tuple = ()
+
+def _simulate_balance_test(player_types, config, seed, start, stop):
+    return balance_test.simulate_range(config, player_types, seed, start, stop)
+
+def v58_target(base: Optional[v58.GameConfig] = None) -> SweepTarget:
+    return SweepTarget("v5.8", base or v58.GameConfig(), v58._simulate_shard, v58.ENGINE_VERSION)
+
+def core_target(base: Optional[core.CoreConfig] = None) -> SweepTarget:
+    return SweepTarget("core", base or core.CoreConfig(), core.simulate_range, core.ENGINE_VERSION)
+
+def balance_test_target(player_types: List[balance_test.PlayerType],
+                        base: Optional[balance_test.BalanceConfig] = None) -> SweepTarget:
+    player_types = tuple(player_types)
+    return SweepTarget("balance_test", base or balance_test.BalanceConfig(),
+                       partial(_simulate_balance_test, player_types), balance_test.ENGINE_VERSION,
+                       key_extra=player_types)
+
+# ============== 调度 ==============
+
+def _run_shard(target: SweepTarget, config: Any, seed: int, start: int, stop: int,
+               cache: Optional[ResultCache]):
+    """进程池工作函数：模拟一个点的一个分片，返回 (部分聚合, 是否命中缓存)"""
+    key = None
+    if cache is not None:
+        key = cache.key(target.engine, config, seed, start, stop, target.name, target.key_extra)
+        partial_acc = cache.get(key)
+        if partial_acc is not None:
+            return partial_acc, True
+    partial_acc = target.simulate(config, seed, start, stop)
+    if key is not None:
+        cache.put(key, partial_acc)
+    return partial_acc, False
+
+def simulate_points(target: SweepTarget, configs: List[Any], seeds: Sequence[int], start: int, stop: int,
+                    workers: Optional[int] = None, shard_size: int = 1000,
+                    cache: Optional[ResultCache] = None, progress: bool = False) -> List[Any]:
+    """在进程池中模拟每个配置的局号区间 [start, stop)（按 shard_size 分片以均衡负载）
+
+    返回每个配置按局号顺序合并后的部分聚合（未 finalize，可继续与其他区间 merge）；
+    区间为空时返回空聚合。
+    """
+    workers = workers or os.cpu_count() or 1
+    tasks = [(i, lo, min(lo + shard_size, stop))
+             for i in range(len(configs)) for lo in range(start, stop, shard_size)]
+    shards: Dict[int, List] = {i: [] for i in range(len(configs))}
+    remaining = [0] * len(configs)
+    for i, _, _ in tasks:
+        remaining[i] += 1
+
+    done_points = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(_run_shard, target, configs[i], seeds[i], lo, hi, cache): (i, lo)
+            for i, lo, hi in tasks
+        }
+        for future in as_completed(futures):
+            i, lo = futures[future]
+            partial_acc, hit = future.result()
+            shards[i].append((lo, partial_acc))
+            if cache is not None:  # 命中统计在工作进程中，汇总回主进程
+                if hit:
+                    cache.hits += 1
+                else:
+                    cache.misses += 1
+            remaining[i] -= 1
+            if remaining[i] == 0:
+                done_points += 1
+                if progress:
+                    print(f"  扫描进度: {done_points}/{len(configs)} 点")
+
+    merged = []
+    for i in range(len(configs)):
+        ordered = [acc for _, acc in sorted(shards[i], key=lambda item: item[0])]
+        if not ordered:
+            merged.append(target.simulate(configs[i], seeds[i], start, start))
+            continue
+        total = ordered[0]
+        for acc in ordered[1:]:
+            total.merge(acc)
+        merged.append(total)
+    return merged
+
+def run_sweep(target: SweepTarget, points: List[Dict[str, Any]], games: int = 2000,
+              seed: int = 2026, workers: Optional[int] = None, shard_size: int = 1000,
+              cache: Optional[ResultCache] = None, progress: bool = True,
+              seeds: Optional[Sequence[int]] = None) -> List[Dict[str, Any]]:
+    """模拟全部点，每点 games 局
+
+    默认所有点共用根种子 seed（公共随机数）；seeds 给出时每点使用各自的根种子
+    （点间抽样误差独立，适合回归拟合）。
+    返回每点一行：{"point": 序号, 参数..., 指标...}，指标为 finalize() 展开后的全部数值
+    （games=0 时聚合为空，只有参数列）。
+    """
+    configs = [apply_point(target.base, point) for point in points]
+    seeds = list(seeds) if seeds is not None else [seed] * len(points)
+    totals = simulate_points(target, configs, seeds, 0, games, workers=workers,
+                             shard_size=shard_size, cache=cache, progress=progress)
+    rows = []
+    for i, point in enumerate(points):
+        row = {"point": i}
+        row.update({name: getattr(configs[i], name) for name in point})
+        if games > 0:
+            row.update(flatten_stats(totals[i].finalize()))
+        rows.append(row)
+    return rows
+
+def write_csv(rows: List[Dict[str, Any]], path: str):
+    """写出整洁表：列为所有行出现过的键的并集（参数列在前）"""
+    columns = []
+    for row in rows:
+        for key in row:
+            if key not in columns:
+                columns.append(key)
+    with open(path, "w", encoding="utf-8-sig", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=columns)
+        writer.writeheader()
+        writer.writerows(rows)
+
+# ============== 自检 ==============
+
+def check_cache_keys(games: int = 200, workers: Optional[int] = None):
+    """同一缓存下依次扫描全利他、全自私两种组合，结果须与不用缓存时一致，否则抛出 AssertionError"""
+    compositions = [[balance_test.PlayerType.ALTRUIST] * 4, [balance_test.PlayerType.SELFISH] * 4]
+    with tempfile.TemporaryDirectory() as directory:
+        cache = ResultCache(directory)
+        for player_types in compositions:
+            target = balance_test_target(player_types)
+            cached = run_sweep(target, [{}], games=games, workers=workers, cache=cache, progress=False)
+            fresh = run_sweep(target, [{}], games=games, workers=workers, progress=False)
+            label = "/".join(t.name for t in player_types)
+            assert cached == fresh, f"{label}: 缓存结果与直接模拟不一致（缓存键未区分玩家组合）"
+    rows = run_sweep(v58_target(), [{}], games=0, workers=workers, progress=False)
+    assert rows == [{"point": 0}], "games=0 时应只返回参数列"
+
+# ============== 主程序 ==============
+
+# 示例：v5.8 六维区域的拉丁超立方扫描
+V58_PARAMS = [
+    Param("disaster_base_calamity_adj", 4, 8),
+    Param("monk_protect_cost", values=[1, 2, 3]),
+    Param("vow_diligent_merit", 12, 20),
+    Param("vow_arhat_hui", 8, 16),
+    Param("protect_merit", 2, 5),
+    Param("refuge_merit_per_round", values=[0, 1, 2]),
+]
+
+def main(num_points: int = 64, games: int = 2000, out: str = "sweep_v58.csv"):
+    print("《功德轮回》v5.8 参数扫描（拉丁超立方）")
+    print("=" * 50)
+    points = latin_hypercube(V58_PARAMS, num_points, seed=1)
+    start = time.perf_counter()
+    cache = ResultCache()
+    rows = run_sweep(v58_target(), points, games=games, cache=cache)
+    write_csv(rows, out)
+    print(f"{len(rows)} 点 × {games} 局: {time.perf_counter() - start:.1f}s，已写入 {out}")
+    print(cache.summary())
+
+if __name__ == "__main__":
+    main()